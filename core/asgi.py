@@ -3,15 +3,19 @@ from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from django.urls import path
-from votaciones.consumers import VotacionConsumer
+from core.asincrono import RecordarBucle
+from votaciones.consumers import VotacionConsumer, VotacionesConsumer
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = ProtocolTypeRouter({
+# RecordarBucle: los hilos del difusor y de las bajas mandan sus avisos por este bucle
+application = RecordarBucle(ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": AuthMiddlewareStack(
         URLRouter([
             path("ws/votacion/<int:id_votacion>/", VotacionConsumer.as_asgi()),
+            # Un socket por vecino para muchas votaciones (la lista)
+            path("ws/votaciones/", VotacionesConsumer.as_asgi()),
         ])
     ),
-})
\ No newline at end of file
+}))
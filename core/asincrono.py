@@ -0,0 +1,60 @@
+# core/asincrono.py
+import asyncio
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+# Bucle de eventos del servidor ASGI de este proceso (lo apunta RecordarBucle)
+_bucle_servidor = None
+
+
+async def usuario_de(request):
+    """
+    El usuario de la petición, cargado sin salir del bucle de eventos.
+
+    Se deja también en request.user: las plantillas ({{ user }}) y los mensajes lo
+    leen de ahí, y si siguiera siendo perezoso iría a la BD de forma síncrona.
+    """
+    usuario = await request.auser()
+    request.user = usuario
+    return usuario
+
+
+def recordar_bucle():
+    global _bucle_servidor
+    _bucle_servidor = asyncio.get_running_loop()
+
+
+class RecordarBucle:
+    """
+    Middleware ASGI que apunta el bucle del servidor con la primera conexión.
+
+    Los hilos propios (el difusor, las bajas...) lo necesitan para mandar por la
+    capa de canales: ver enviar_a_grupo().
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if _bucle_servidor is not asyncio.get_running_loop():
+            recordar_bucle()
+        return await self.app(scope, receive, send)
+
+
+def enviar_a_grupo(grupo, mensaje, espera=10):
+    """
+    group_send desde código síncrono, en cualquier hilo.
+
+    async_to_sync en un hilo propio abre otro bucle, y la capa en memoria no se
+    puede usar desde dos: el mensaje entra en la cola pero el socket que espera
+    no se despierta hasta su siguiente timeout. Por eso, si el servidor está en
+    marcha, el envío se hace en su bucle, que es el dueño de las colas.
+    """
+    capa = get_channel_layer()
+    bucle = _bucle_servidor
+    if bucle is not None and bucle.is_running():
+        asyncio.run_coroutine_threadsafe(capa.group_send(grupo, mensaje), bucle).result(espera)
+    else:
+        # Sin servidor ASGI (tests, comandos): nadie escucha desde otro bucle
+        async_to_sync(capa.group_send)(grupo, mensaje)
@@ -0,0 +1,254 @@
+# core/capa_sqlite.py
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+
+class SQLiteChannelLayer(BaseChannelLayer):
+    """
+    Capa de canales compartida entre varios procesos de la MISMA máquina, sin Redis.
+
+    Todos los procesos abren el mismo fichero SQLite (en modo WAL). Cada proceso
+    tiene un prefijo propio para sus canales y un único lector que recoge de una
+    vez los mensajes de todos sus sockets, así el coste de sondear no crece con
+    el número de conexiones. group_send es un solo INSERT ... SELECT.
+
+    Los mensajes se guardan como JSON, que es lo único que mandamos por la capa.
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, ruta='canales.sqlite3', expiry=60, group_expiry=86400, capacity=100,
+                 channel_capacity=None, sondeo_minimo=0.005, sondeo_maximo=0.05, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        self.ruta = str(ruta)
+        self.group_expiry = group_expiry
+        self.sondeo_minimo = sondeo_minimo
+        self.sondeo_maximo = sondeo_maximo
+
+        # Prefijo de los canales de este proceso: "specific.<id>!"
+        self.prefijo = f"specific.{uuid.uuid4().hex}!"
+        self._colas = {}                    # canal -> asyncio.Queue, desde new_channel hasta que se descarta
+        self._grupos_de = defaultdict(set)  # canal de este proceso -> sus grupos
+        self._lector = None
+        self._ultima_limpieza = 0
+
+        # SQLite bloquea: todas las consultas van a un hilo propio con una sola conexión
+        self._hilo_bd = ThreadPoolExecutor(max_workers=1, thread_name_prefix='capa-sqlite')
+        self._conexion = None
+
+    # --- BASE DE DATOS (siempre en el hilo propio) ---
+
+    def _bd(self):
+        if self._conexion is None:
+            conexion = sqlite3.connect(self.ruta, timeout=10, isolation_level=None, check_same_thread=False)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=NORMAL")
+            conexion.executescript("""
+                CREATE TABLE IF NOT EXISTS mensajes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    canal TEXT NOT NULL,
+                    cuerpo TEXT NOT NULL,
+                    expira REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS mensajes_canal ON mensajes (canal, id);
+                CREATE TABLE IF NOT EXISTS grupos (
+                    grupo TEXT NOT NULL,
+                    canal TEXT NOT NULL,
+                    expira REAL NOT NULL,
+                    PRIMARY KEY (grupo, canal)
+                );
+            """)
+            self._conexion = conexion
+        return self._conexion
+
+    async def _ejecutar(self, funcion, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._hilo_bd, funcion, *args)
+
+    def _insertar(self, canal, cuerpo):
+        bd = self._bd()
+        ahora = time.time()
+        en_cola = bd.execute(
+            "SELECT COUNT(*) FROM mensajes WHERE canal = ? AND expira > ?", (canal, ahora)
+        ).fetchone()[0]
+        if en_cola >= self.get_capacity(canal):
+            raise ChannelFull(canal)
+        bd.execute(
+            "INSERT INTO mensajes (canal, cuerpo, expira) VALUES (?, ?, ?)",
+            (canal, cuerpo, ahora + self.expiry)
+        )
+
+    def _insertar_en_grupo(self, grupo, cuerpo):
+        ahora = time.time()
+        # Un mensaje por miembro del grupo, en una sola sentencia
+        self._bd().execute(
+            "INSERT INTO mensajes (canal, cuerpo, expira) "
+            "SELECT canal, ?, ? FROM grupos WHERE grupo = ? AND expira > ?",
+            (cuerpo, ahora + self.expiry, grupo, ahora)
+        )
+
+    def _sacar(self, desde, hasta, canales):
+        # Saca (y borra) los mensajes de los canales entre desde y hasta que tienen a
+        # quién entregárselos. Los demás se quedan hasta que caducan: puede que su
+        # receive() aún no haya empezado
+        bd = self._bd()
+        ahora = time.time()
+        bd.execute("BEGIN IMMEDIATE")
+        try:
+            filas = [
+                fila for fila in bd.execute(
+                    "SELECT id, canal, cuerpo FROM mensajes WHERE canal >= ? AND canal < ? AND expira > ? ORDER BY id",
+                    (desde, hasta, ahora)
+                ).fetchall()
+                if fila[1] in canales
+            ]
+            if filas:
+                bd.executemany("DELETE FROM mensajes WHERE id = ?", [(id_mensaje,) for id_mensaje, _, _ in filas])
+            bd.execute("COMMIT")
+        except BaseException:
+            bd.execute("ROLLBACK")
+            raise
+        return [(canal, cuerpo) for _, canal, cuerpo in filas]
+
+    def _limpiar_caducados(self):
+        bd = self._bd()
+        ahora = time.time()
+        bd.execute("DELETE FROM mensajes WHERE expira <= ?", (ahora,))
+        bd.execute("DELETE FROM grupos WHERE expira <= ?", (ahora,))
+
+    # --- API DE CHANNELS ---
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        await self._ejecutar(self._insertar, channel, json.dumps(message))
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+
+        # Canales de otro tipo (sin "!"): los sondeamos directamente
+        if '!' not in channel:
+            espera = self.sondeo_minimo
+            while True:
+                cuerpo = await self._ejecutar(self._sacar_uno, channel)
+                if cuerpo:
+                    return json.loads(cuerpo)
+                await asyncio.sleep(espera)
+                espera = min(espera * 2, self.sondeo_maximo)
+
+        # Canales de este proceso: los reparte el lector común
+        cola = self._cola(channel)
+        try:
+            return await cola.get()
+        except asyncio.CancelledError:
+            # Un wait_for que vence no suelta la cola: lo que llegue luego sigue siendo suyo.
+            # Solo se olvida la de un canal sin grupos (el consumer ya se ha ido)
+            if cola.empty() and not self._grupos_de.get(channel):
+                self._colas.pop(channel, None)
+            raise
+
+    def _cola(self, channel):
+        cola = self._colas.get(channel)
+        if cola is None:
+            cola = self._colas[channel] = asyncio.Queue()
+        self._arrancar_lector()
+        return cola
+
+    def _sacar_uno(self, channel):
+        bd = self._bd()
+        bd.execute("BEGIN IMMEDIATE")
+        try:
+            fila = bd.execute(
+                "SELECT id, cuerpo FROM mensajes WHERE canal = ? AND expira > ? ORDER BY id LIMIT 1",
+                (channel, time.time())
+            ).fetchone()
+            if fila:
+                bd.execute("DELETE FROM mensajes WHERE id = ?", (fila[0],))
+            bd.execute("COMMIT")
+        except BaseException:
+            bd.execute("ROLLBACK")
+            raise
+        return fila and fila[1]
+
+    async def new_channel(self, prefix='specific'):
+        # La cola nace con el canal: lo que le llegue antes de su primer receive() espera en ella
+        canal = f"{self.prefijo}{uuid.uuid4().hex}"
+        self._cola(canal)
+        return canal
+
+    async def flush(self):
+        def vaciar():
+            bd = self._bd()
+            bd.execute("DELETE FROM mensajes")
+            bd.execute("DELETE FROM grupos")
+        await self._ejecutar(vaciar)
+        self._colas.clear()
+        self._grupos_de.clear()
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        if channel.startswith(self.prefijo):
+            self._grupos_de[channel].add(group)
+            self._cola(channel)
+        await self._ejecutar(
+            lambda: self._bd().execute(
+                "INSERT OR REPLACE INTO grupos (grupo, canal, expira) VALUES (?, ?, ?)",
+                (group, channel, time.time() + self.group_expiry)
+            )
+        )
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._ejecutar(
+            lambda: self._bd().execute("DELETE FROM grupos WHERE grupo = ? AND canal = ?", (group, channel))
+        )
+        # Fuera de su último grupo el canal está descartado: su cola ya no hace falta
+        grupos = self._grupos_de.get(channel)
+        if grupos is not None:
+            grupos.discard(group)
+            if not grupos:
+                del self._grupos_de[channel]
+                self._colas.pop(channel, None)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_group_name(group)
+        await self._ejecutar(self._insertar_en_grupo, group, json.dumps(message))
+
+    # --- LECTOR DE ESTE PROCESO ---
+
+    def _arrancar_lector(self):
+        loop = asyncio.get_running_loop()
+        if self._lector is None or self._lector.done() or self._lector.get_loop() is not loop:
+            self._lector = loop.create_task(self._leer())
+
+    async def _leer(self):
+        # "!" va justo antes que "\"" en ASCII: el rango cubre todos nuestros canales
+        desde, hasta = self.prefijo, self.prefijo[:-1] + '"'
+        espera = self.sondeo_minimo
+        while self._colas:
+            filas = await self._ejecutar(self._sacar, desde, hasta, set(self._colas))
+            for canal, cuerpo in filas:
+                cola = self._colas.get(canal)
+                if cola is not None:
+                    cola.put_nowait(json.loads(cuerpo))
+
+            # Con tráfico sondeamos rápido; en reposo vamos espaciando
+            espera = self.sondeo_minimo if filas else min(espera * 2, self.sondeo_maximo)
+
+            if time.monotonic() - self._ultima_limpieza > 30:
+                self._ultima_limpieza = time.monotonic()
+                await self._ejecutar(self._limpiar_caducados)
+
+            await asyncio.sleep(espera)
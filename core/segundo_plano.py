@@ -0,0 +1,51 @@
+# core/segundo_plano.py
+import logging
+import threading
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class TrabajoEnSegundoPlano:
+    """
+    Hilo que se despierta con avisar() (y además cada `espera` segundos) y llama
+    a procesar() hasta que devuelve 0. Las subclases solo ponen procesar(): la
+    bandeja de salida de correos, las bajas de vecinos...
+    """
+    nombre = 'segundo-plano'
+
+    def __init__(self, espera=30):
+        self.espera = espera
+        self._aviso = threading.Event()
+        self._cerrojo = threading.Lock()
+        self._hilo = None
+
+    def procesar(self):
+        # Un lote de trabajo; devuelve cuántas cosas ha hecho (0 = no quedaba nada)
+        raise NotImplementedError
+
+    def avisar(self):
+        with self._cerrojo:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self.ejecutar, name=self.nombre, daemon=True)
+                self._hilo.start()
+        self._aviso.set()
+
+    def ejecutar(self):
+        while True:
+            self._aviso.wait(self.espera)
+            self._aviso.clear()
+            self.vaciar()
+
+    def vaciar(self):
+        hechos = 0
+        try:
+            while (lote := self.procesar()):
+                hechos += lote
+        except Exception:
+            logger.exception("Fallo en %s", self.nombre)
+        finally:
+            # Este hilo vive mucho: que no se quede con conexiones a la BD caducadas
+            close_old_connections()
+        return hechos
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -80,6 +81,54 @@ CHANNEL_LAYERS = {
     }
 }
 
+# Con varios procesos daphne en la misma máquina la memoria no se comparte:
+# arrancar con CANALES_MULTIPROCESO=1 para que los avisos pasen por un fichero SQLite común
+if os.environ.get('CANALES_MULTIPROCESO'):
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "core.capa_sqlite.SQLiteChannelLayer",
+            "CONFIG": {
+                "ruta": BASE_DIR / 'canales.sqlite3',
+            },
+        }
+    }
+
+# CACHÉ: en memoria de cada proceso. Lo que se guarda con borrado explícito (lo votado y
+# pendiente de cada vecino, el directorio de nombres) solo se borra en el proceso que hizo
+# el cambio, así que con CANALES_MULTIPROCESO la caché TIENE que ser compartida: sin Redis
+# ni memcached vale la de ficheros. votaciones/apps.py no arranca si no lo es
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+if os.environ.get('CANALES_MULTIPROCESO'):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": BASE_DIR / 'cache',
+        }
+    }
+
+# CIERRE DE VOTACIONES: con un solo proceso lo hace el propio daphne;
+# con varios, se pone a False y se arranca aparte "python manage.py programar_cierres"
+VOTACIONES_CIERRES_EN_PROCESO = not os.environ.get('CANALES_MULTIPROCESO')
+
+# AVISOS EN VIVO: se juntan los votos de cada votación y sale un mensaje por ventana
+VOTACIONES_DIFUSION = {
+    'VENTANA': 0.2,          # Segundos
+    'MAX_POR_SEGUNDO': 5,    # Por grupo de votación
+}
+
+# SOCKETS EN VIVO: límites por proceso y latido para echar a los que ya no están
+# (ver votaciones/conexiones.py; el estado se ve en /api/conexiones/)
+VOTACIONES_SOCKETS = {
+    'MAX_POR_USUARIO': 10,
+    'MAX_POR_GRUPO': 2000,
+    'LATIDO': 25,            # Segundos
+    'INACTIVIDAD': 75,       # Segundos
+}
+
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
@@ -137,3 +186,24 @@ AUTH_USER_MODEL = 'usuarios.Usuario'
 # Esto hace que los emails salgan por la terminal negra en lugar de enviarse
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 EMAIL_HOST_USER = 'admin@tucomunidad.com' # Remitente falso
+
+# Los correos pasan por la bandeja de salida (usuarios/correo.py). Con True los manda un hilo
+# del propio servidor; con False hay que tener en marcha "python manage.py enviar_correos"
+CORREO_EN_PROCESO = True
+
+# Las bajas de vecinos (usuarios/bajas.py): igual, con False las hace "python manage.py procesar_bajas"
+BAJAS_EN_PROCESO = True
+
+# Procesos para cifrar contraseñas al importar vecinos (None = uno por núcleo, 0 = sin pool)
+IMPORTACION_PROCESOS = None
+
+# LOGIN: el cifrado de contraseñas va a una cola de hilos (usuarios/cifrado.py).
+# Con más de CIFRADO_MAX_COLA esperando se contesta "inténtalo en un momento" (503)
+AUTHENTICATION_BACKENDS = ['usuarios.backends.BackendConCola']
+CIFRADO_HILOS = None        # None = uno por núcleo
+CIFRADO_MAX_COLA = 100
+# Freno de intentos (usuarios/limites.py): (capacidad, fichas recuperadas por segundo).
+# Cada intento gasta del usuario; la IP solo gasta con los fallidos, así una asamblea
+# entera entrando desde la misma wifi no se frena a sí misma
+LOGIN_FRENO_IP = (50, 5.0)
+LOGIN_FRENO_USUARIO = (5, 1 / 30)
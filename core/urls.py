@@ -4,7 +4,7 @@ from django.urls import path
 from usuarios.views import (
     login_view, logout_view, panel_inicio, 
     cambiar_password_obligatorio, listar_vecinos, 
-    editar_vecino, crear_vecino, eliminar_vecino, 
+    editar_vecino, crear_vecino, eliminar_vecino, eliminar_vecinos, importar_vecinos,
     ver_perfil, solicitar_codigo_perfil, confirmar_cambios_perfil
 )
 from votaciones.views import listar_votaciones, crear_votacion, ver_votacion
@@ -18,12 +18,17 @@ urlpatterns = [
     path('inicio/', panel_inicio, name='panel_inicio'), # Donde iremos al entrar
     # --- ¡ESTA ES LA LÍNEA QUE HACE QUE EL WEBSOCKET FUNCIONE! ---
     path('api/votacion/<int:id_votacion>/', views_votaciones.datos_en_vivo, name='datos_en_vivo'),
+    path('api/votacion/<int:id_votacion>/eventos/', views_votaciones.eventos_en_vivo, name='eventos_en_vivo'),
+    path('api/directorio/', views_votaciones.directorio_vecinos, name='directorio_vecinos'),
+    path('api/conexiones/', views_votaciones.estado_conexiones, name='estado_conexiones'),
 
     # --- NUEVAS RUTAS PARA GESTIONAR VECINOS ---
     path('mis-vecinos/', listar_vecinos, name='listar_vecinos'),   
     path('crear-vecino/', crear_vecino, name='crear_vecino'),
+    path('importar-vecinos/', importar_vecinos, name='importar_vecinos'),
     path('editar-vecino/<int:id_vecino>/', editar_vecino, name='editar_vecino'),
     path('eliminar-vecino/<int:id_vecino>/', eliminar_vecino, name='eliminar_vecino'),
+    path('eliminar-vecinos/', eliminar_vecinos, name='eliminar_vecinos'),
     path('activar-cuenta/', cambiar_password_obligatorio, name='cambiar_password_obligatorio'),
     # --- PERFIL DEL VECINO ---
     path('mi-perfil/', ver_perfil, name='ver_perfil'),
@@ -34,4 +39,6 @@ urlpatterns = [
     path('votaciones/', listar_votaciones, name='listar_votaciones'),
     path('votaciones/nueva/', crear_votacion, name='crear_votacion'),
     path('votaciones/<int:id_votacion>/', ver_votacion, name='ver_votacion'),
+    path('votaciones/<int:id_votacion>/acta.<str:formato>', views_votaciones.acta_votacion, name='acta_votacion'),
+    path('votaciones/actas.<str:formato>', views_votaciones.actas_cooperativa, name='actas_cooperativa'),
 ]
\ No newline at end of file
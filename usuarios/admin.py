@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import Usuario, Cooperativa
+from .models import Usuario, Cooperativa, CorreoSaliente, BajaVecino
 
 class UsuarioAdmin(UserAdmin):
     # 1. FIELDSETS: Añadimos 'numero_vivienda' para poder editarlo dentro de la ficha
@@ -18,6 +18,22 @@ class CooperativaAdmin(admin.ModelAdmin):
     list_display = ('nombre', 'direccion', 'presidente_ve_votos', 'fecha_creacion')
     list_filter = ('presidente_ve_votos',)
 
+class CorreoSalienteAdmin(admin.ModelAdmin):
+    # La bandeja de salida: para ver qué correos no han llegado a salir y por qué
+    list_display = ('asunto', 'destinatario', 'estado', 'intentos', 'fecha_creacion', 'fecha_envio')
+    list_filter = ('estado',)
+    search_fields = ('destinatario',)
+    readonly_fields = ('fecha_creacion', 'fecha_envio', 'ultimo_error')
+    # El cuerpo lleva contraseñas provisionales y códigos de seguridad: ni se ve ni se toca
+    exclude = ('cuerpo',)
+
+class BajaVecinoAdmin(admin.ModelAdmin):
+    # Bajas pedidas: sin fecha_baja es que aún no las ha hecho el procesador
+    list_display = ('username', 'pedida_por', 'fecha_peticion', 'fecha_baja')
+    readonly_fields = ('fecha_peticion', 'fecha_baja')
+
 # Registramos todoy
 admin.site.register(Usuario, UsuarioAdmin)
-admin.site.register(Cooperativa, CooperativaAdmin)
\ No newline at end of file
+admin.site.register(Cooperativa, CooperativaAdmin)
+admin.site.register(CorreoSaliente, CorreoSalienteAdmin)
+admin.site.register(BajaVecino, BajaVecinoAdmin)
@@ -0,0 +1,35 @@
+# usuarios/backends.py
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from .cifrado import acomprobar_clave, acifrar_clave
+
+
+class BackendConCola(ModelBackend):
+    """
+    El ModelBackend de siempre, pero en async (el login) el cifrado va a la cola
+    de cifrado (usuarios/cifrado.py) en lugar de a un hilo cualquiera sin límite.
+    El login síncrono (el admin) sigue igual.
+    """
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        try:
+            usuario = await UserModel._default_manager.aget_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Mismo coste que con un usuario real, para no delatar qué nombres existen
+            await acifrar_clave(password)
+            return None
+
+        correcta, recifrar = await acomprobar_clave(password, usuario.password)
+        if not correcta or not self.user_can_authenticate(usuario):
+            return None
+        if recifrar:
+            usuario.password = await acifrar_clave(password)
+            await usuario.asave(update_fields=['password'])
+        return usuario
@@ -0,0 +1,76 @@
+# usuarios/bajas.py
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.segundo_plano import TrabajoEnSegundoPlano
+from votaciones.contadores import descontar_votos
+from votaciones.pendientes import olvidar_usuario
+from .models import Usuario, BajaVecino
+
+logger = logging.getLogger(__name__)
+
+TAM_LOTE = 100
+
+
+# --- PEDIR BAJAS ---
+# La vista solo desactiva las cuentas (ya no pueden entrar ni votar) y deja apuntada
+# la baja; el borrado con todo lo que cuelga de cada vecino se hace en segundo plano.
+
+def pedir_bajas(vecinos, pedida_por):
+    vecinos = [vecino for vecino in vecinos if vecino.is_active]
+    if not vecinos:
+        return 0
+    with transaction.atomic():
+        Usuario.objects.filter(id__in=[vecino.id for vecino in vecinos]).update(is_active=False)
+        BajaVecino.objects.bulk_create([
+            BajaVecino(usuario=vecino, username=vecino.username, pedida_por=pedida_por)
+            for vecino in vecinos
+        ])
+        transaction.on_commit(avisar_procesador)
+    return len(vecinos)
+
+
+# --- PROCESAR BAJAS ---
+
+def procesar_bajas(tam=TAM_LOTE):
+    """
+    Borra un lote de vecinos en una transacción: sus votos se descuentan de los
+    contadores de golpe (votaciones.contadores.descontar_votos) y luego se borran
+    las cuentas. Devuelve cuántas bajas se han hecho (0 = no quedaba ninguna).
+    """
+    with transaction.atomic():
+        # Las que esté haciendo otro proceso se saltan
+        bajas = list(
+            BajaVecino.objects.select_for_update(skip_locked=True)
+            .filter(fecha_baja__isnull=True).order_by('id')[:tam]
+        )
+        if not bajas:
+            return 0
+        ids_usuarios = {baja.usuario_id for baja in bajas if baja.usuario_id}
+
+        afectadas = descontar_votos(ids_usuarios)
+        Usuario.objects.filter(id__in=ids_usuarios).delete()
+        BajaVecino.objects.filter(id__in=[baja.id for baja in bajas]).update(fecha_baja=timezone.now())
+
+    for id_usuario in ids_usuarios:
+        olvidar_usuario(id_usuario)
+    logger.info("%s vecinos dados de baja (%s votaciones recontadas)", len(bajas), len(afectadas))
+    return len(bajas)
+
+
+class ProcesadorBajas(TrabajoEnSegundoPlano):
+    nombre = 'procesador-bajas'
+
+    def procesar(self):
+        return procesar_bajas()
+
+
+procesador = ProcesadorBajas()
+
+def avisar_procesador():
+    # Con BAJAS_EN_PROCESO = False las hace solo el comando procesar_bajas
+    if getattr(settings, 'BAJAS_EN_PROCESO', True):
+        procesador.avisar()
@@ -0,0 +1,126 @@
+# usuarios/cifrado.py
+# Aparte de importacion.py a propósito: los procesos del pool importan este módulo
+# antes de que Django esté listo, así que aquí no puede haber modelos.
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password, verify_password
+
+
+def _iniciar_proceso():
+    # Con "spawn" cada proceso arranca de cero y tiene que cargar los ajustes de Django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    django.setup()
+
+def pool_de_cifrado(procesos=None):
+    """
+    PBKDF2 tarda cientos de ms por contraseña y es CPU pura: repartido en procesos
+    escala con los núcleos. procesos=0 cifra en el propio proceso (tests, máquinas
+    de un núcleo). "spawn" y no "fork" porque esto se llama desde un servidor con hilos.
+    """
+    if procesos is None:
+        procesos = getattr(settings, 'IMPORTACION_PROCESOS', None)
+    if procesos == 0:
+        return nullcontext(None)
+    return ProcessPoolExecutor(
+        max_workers=procesos or os.cpu_count(),
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_iniciar_proceso,
+    )
+
+def cifrar(claves, pool):
+    if pool is None:
+        return [make_password(clave) for clave in claves]
+    # Trozos medianos: ni un viaje entre procesos por contraseña ni un proceso con todo el lote
+    trozo = max(1, len(claves) // 32)
+    return list(pool.map(make_password, claves, chunksize=trozo))
+
+
+# --- COLA DE CIFRADO PARA LOGIN Y CAMBIOS DE CONTRASEÑA ---
+# Un PBKDF2 ocupa ~0.5 s de CPU. Hecho en el bucle de eventos (o en el único hilo de las
+# vistas síncronas bajo ASGI) para a todo el servidor; aquí va a unos pocos hilos
+# (hashlib suelta el GIL mientras cifra) con una cola limitada: si se llena, se rechaza
+# al momento en lugar de hacer esperar a todos más y más.
+
+class CifradoSaturado(Exception):
+    pass
+
+
+class ColaCifrado:
+
+    def __init__(self, hilos=None, max_cola=None):
+        self.hilos = hilos
+        self.max_cola = max_cola
+        self._pool = None
+        self._cerrojo = threading.Lock()
+        self.en_cola = 0
+        self.en_curso = 0
+        self.atendidos = 0
+        self.rechazados = 0
+        self._espera_total = 0.0
+        self._espera_max = 0.0
+
+    def _preparar(self):
+        # Los ajustes se leen al primer uso: este módulo se importa antes de django.setup()
+        if self.hilos is None:
+            self.hilos = getattr(settings, 'CIFRADO_HILOS', None) or os.cpu_count() or 1
+        if self.max_cola is None:
+            self.max_cola = getattr(settings, 'CIFRADO_MAX_COLA', 100)
+        self._pool = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix='cifrado')
+
+    def enviar(self, funcion, *args):
+        with self._cerrojo:
+            if self._pool is None:
+                self._preparar()
+            if self.en_cola >= self.max_cola:
+                self.rechazados += 1
+                raise CifradoSaturado(f"{self.en_cola} cifrados esperando")
+            self.en_cola += 1
+        return self._pool.submit(self._ejecutar, time.perf_counter(), funcion, args)
+
+    async def ejecutar(self, funcion, *args):
+        return await asyncio.wrap_future(self.enviar(funcion, *args))
+
+    def _ejecutar(self, encolado, funcion, args):
+        espera = time.perf_counter() - encolado
+        with self._cerrojo:
+            self.en_cola -= 1
+            self.en_curso += 1
+            self._espera_total += espera
+            self._espera_max = max(self._espera_max, espera)
+        try:
+            return funcion(*args)
+        finally:
+            with self._cerrojo:
+                self.en_curso -= 1
+                self.atendidos += 1
+
+    def metricas(self):
+        with self._cerrojo:
+            return {
+                'hilos': self.hilos,
+                'max_cola': self.max_cola,
+                'en_cola': self.en_cola,
+                'en_curso': self.en_curso,
+                'atendidos': self.atendidos,
+                'rechazados': self.rechazados,
+                'espera_media_ms': round(self._espera_total / self.atendidos * 1000, 2) if self.atendidos else 0,
+                'espera_max_ms': round(self._espera_max * 1000, 2),
+            }
+
+
+cola_cifrado = ColaCifrado()
+
+async def acomprobar_clave(clave, cifrada):
+    # (correcta, hay_que_recifrar): lo segundo si el hasher por defecto ha cambiado
+    return await cola_cifrado.ejecutar(verify_password, clave, cifrada)
+
+async def acifrar_clave(clave):
+    return await cola_cifrado.ejecutar(make_password, clave)
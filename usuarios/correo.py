@@ -0,0 +1,146 @@
+# usuarios/correo.py
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from core.segundo_plano import TrabajoEnSegundoPlano
+from .models import CorreoSaliente
+
+logger = logging.getLogger(__name__)
+
+TAM_LOTE = 50           # correos por conexión SMTP
+MAX_INTENTOS = 6
+REINTENTO_BASE = 30     # segundos; se dobla en cada fallo (30s, 1m, 2m, 4m, 8m)
+RESERVA = timedelta(minutes=5)
+# Lo que queda en "cuerpo" una vez enviado o descartado: llevaba contraseñas provisionales y códigos
+CUERPO_BORRADO = ''
+
+
+# --- ENCOLAR ---
+# Las vistas no hablan con el SMTP: guardan el correo en la bandeja de salida dentro de
+# su transacción (si la petición falla, el correo tampoco existe) y el repartidor lo
+# manda después.
+
+def nuevo_correo(asunto, cuerpo, destinatario):
+    return CorreoSaliente(
+        asunto=asunto,
+        cuerpo=cuerpo,
+        remitente=settings.EMAIL_HOST_USER,
+        destinatario=destinatario,
+    )
+
+def correo_bienvenida(vecino, password_provisional):
+    return nuevo_correo(
+        'Bienvenido a tu Comunidad',
+        f"Usuario: {vecino.username}\nContraseña: {password_provisional}",
+        vecino.email,
+    )
+
+def correo_codigo_perfil(usuario, codigo):
+    return nuevo_correo(
+        'Código de Seguridad - Editar Perfil',
+        f"Hola {usuario.username},\n\nTu código es: {codigo}",
+        usuario.email,
+    )
+
+def encolar(correos):
+    CorreoSaliente.objects.bulk_create(correos)
+    # Al repartidor solo se le avisa si la transacción llega a confirmarse
+    transaction.on_commit(avisar_repartidor)
+
+
+# --- ENVÍO ---
+
+def reservar_lote(tam=TAM_LOTE):
+    """
+    Coge los pendientes que ya tocan y los aparta un rato (RESERVA) para que
+    otro repartidor no los mande a la vez. Si este se muere a medias, al pasar
+    la reserva vuelven a estar disponibles.
+    """
+    ahora = timezone.now()
+    with transaction.atomic():
+        correos = list(
+            CorreoSaliente.objects.select_for_update(skip_locked=True)
+            .filter(estado=CorreoSaliente.PENDIENTE, proximo_intento__lte=ahora)
+            .order_by('proximo_intento')[:tam]
+        )
+        CorreoSaliente.objects.filter(id__in=[correo.id for correo in correos]).update(
+            proximo_intento=ahora + RESERVA
+        )
+    return correos
+
+def enviar_pendientes(tam=TAM_LOTE):
+    """
+    Manda un lote de la bandeja de salida por una sola conexión SMTP.
+    Devuelve cuántos correos se han intentado (0 = no quedaba nada que mandar).
+    """
+    correos = reservar_lote(tam)
+    if not correos:
+        return 0
+
+    conexion = get_connection(fail_silently=False)
+    try:
+        conexion.open()
+    except Exception as e:
+        for correo in correos:
+            _apuntar_fallo(correo, e)
+        return len(correos)
+
+    enviados = []
+    try:
+        for correo in correos:
+            mensaje = EmailMessage(correo.asunto, correo.cuerpo, correo.remitente, [correo.destinatario])
+            try:
+                conexion.send_messages([mensaje])
+            except Exception as e:
+                _apuntar_fallo(correo, e)
+            else:
+                enviados.append(correo.id)
+    finally:
+        conexion.close()
+        CorreoSaliente.objects.filter(id__in=enviados).update(
+            estado=CorreoSaliente.ENVIADO, fecha_envio=timezone.now(), ultimo_error='',
+            cuerpo=CUERPO_BORRADO,
+        )
+    return len(correos)
+
+def _apuntar_fallo(correo, error):
+    correo.intentos += 1
+    correo.ultimo_error = f"{type(error).__name__}: {error}"
+    if correo.intentos >= MAX_INTENTOS:
+        correo.estado = CorreoSaliente.FALLIDO
+        correo.cuerpo = CUERPO_BORRADO
+        logger.error("Correo %s a %s descartado tras %s intentos: %s",
+                     correo.id, correo.destinatario, correo.intentos, correo.ultimo_error)
+    else:
+        correo.proximo_intento = timezone.now() + timedelta(seconds=REINTENTO_BASE * 2 ** (correo.intentos - 1))
+    correo.save(update_fields=['intentos', 'ultimo_error', 'estado', 'proximo_intento', 'cuerpo'])
+
+
+# --- REPARTIDOR ---
+
+class RepartidorCorreos(TrabajoEnSegundoPlano):
+    """
+    Vacía la bandeja de salida. Se despierta cuando se confirma una transacción
+    que ha dejado correos y, además, cada ESPERA segundos para los reintentos.
+    Con varios procesos pueden convivir varios: cada uno reserva su lote.
+    """
+    nombre = 'repartidor-correos'
+
+    def __init__(self, espera=REINTENTO_BASE):
+        super().__init__(espera)
+
+    def procesar(self):
+        return enviar_pendientes()
+
+
+repartidor = RepartidorCorreos()
+
+def avisar_repartidor():
+    # Con CORREO_EN_PROCESO = False los manda solo el comando enviar_correos
+    if getattr(settings, 'CORREO_EN_PROCESO', True):
+        repartidor.avisar()
@@ -1,8 +1,14 @@
 from django import forms
+from django.contrib.auth.forms import PasswordChangeForm
 from .models import Usuario
 
 class VecinoForm(forms.ModelForm):
     class Meta:
         model = Usuario
         # YA NO PEDIMOS PASSWORD. Solo datos de contacto.
-        fields = ['username', 'first_name', 'last_name', 'email','numero_vivienda']
\ No newline at end of file
+        fields = ['username', 'first_name', 'last_name', 'email','numero_vivienda']
+
+class CambioClaveForm(PasswordChangeForm):
+    # La contraseña actual no se comprueba aquí: la vista la manda a la cola de cifrado
+    def clean_old_password(self):
+        return self.cleaned_data['old_password']
@@ -0,0 +1,210 @@
+# usuarios/importacion.py
+import codecs
+import csv
+import time
+from itertools import chain
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils.crypto import get_random_string
+
+from votaciones.resultados import clave_directorio
+from .cifrado import cifrar, pool_de_cifrado
+from .correo import encolar, correo_bienvenida
+from .forms import VecinoForm
+from .models import Usuario
+
+
+class FicheroNoValido(Exception):
+    pass
+
+
+# Cabeceras que entendemos (en minúsculas) y el campo de Usuario al que van
+COLUMNAS = {
+    'username': 'username', 'usuario': 'username',
+    'first_name': 'first_name', 'nombre': 'first_name',
+    'last_name': 'last_name', 'apellido': 'last_name', 'apellidos': 'last_name',
+    'email': 'email', 'correo': 'email',
+    'numero_vivienda': 'numero_vivienda', 'vivienda': 'numero_vivienda', 'piso': 'numero_vivienda',
+}
+OBLIGATORIAS = {'username', 'email'}
+
+
+class FilaVecinoForm(VecinoForm):
+    """
+    Valida una fila como el alta a mano, pero sin consultar si el usuario existe:
+    eso se mira de golpe para todo el lote.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Sin email la contraseña provisional no llegaría a nadie
+        self.fields['email'].required = True
+
+    def validate_unique(self):
+        pass
+
+
+# --- LECTURA DEL FICHERO (FILA A FILA) ---
+
+def leer_filas(fichero, nombre):
+    """
+    Va dando (número de línea, datos) sin cargar el fichero entero.
+    Acepta CSV (con "," o ";", como lo guarda Excel en español) y XLSX.
+    """
+    if nombre.lower().endswith('.xlsx'):
+        filas = _filas_xlsx(fichero)
+    elif nombre.lower().endswith('.csv'):
+        filas = _filas_csv(fichero)
+    else:
+        raise FicheroNoValido("El fichero debe ser .csv o .xlsx.")
+
+    cabecera = next(filas, None)
+    if not cabecera:
+        raise FicheroNoValido("El fichero está vacío.")
+    campos = [COLUMNAS.get(str(columna or '').strip().lower()) for columna in cabecera]
+    faltan = OBLIGATORIAS - set(campos)
+    if faltan:
+        raise FicheroNoValido(f"Faltan columnas obligatorias: {', '.join(sorted(faltan))}.")
+
+    # La cabecera se comprueba ya; el resto se lee según se vaya pidiendo
+    return _datos(filas, campos)
+
+def _datos(filas, campos):
+    for linea, fila in enumerate(filas, start=2):
+        if not any(fila):
+            continue
+        yield linea, {
+            campo: str(valor).strip() if valor is not None else ''
+            for campo, valor in zip(campos, fila) if campo
+        }
+
+def _filas_csv(fichero):
+    lineas = _lineas_csv(fichero)
+    primera = next(lineas, '')
+    separador = ';' if primera.count(';') > primera.count(',') else ','
+    lector = csv.reader(chain([primera], lineas), delimiter=separador)
+    try:
+        yield from lector
+    except csv.Error as e:
+        raise FicheroNoValido(f"Línea {lector.line_num}: el CSV no se puede leer ({e}).")
+
+def _lineas_csv(fichero):
+    # UTF-8 (con o sin BOM) o Windows-1252, que es lo que guarda Excel en español como "CSV".
+    # Se decide línea a línea: sin acentos las dos son iguales, y así no hay que leerlo dos veces
+    for numero, linea in enumerate(fichero, start=1):
+        if numero == 1 and linea.startswith(codecs.BOM_UTF8):
+            linea = linea[len(codecs.BOM_UTF8):]
+        try:
+            yield linea.decode('utf-8')
+        except UnicodeDecodeError:
+            try:
+                yield linea.decode('cp1252')
+            except UnicodeDecodeError:
+                raise FicheroNoValido(f"Línea {numero}: el fichero no es texto (guárdalo como CSV UTF-8).")
+
+def _filas_xlsx(fichero):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise FicheroNoValido("Para importar .xlsx hace falta instalar openpyxl (o guarda el fichero como .csv).")
+    libro = load_workbook(fichero, read_only=True, data_only=True)
+    try:
+        yield from libro.active.iter_rows(values_only=True)
+    finally:
+        libro.close()
+
+
+# --- IMPORTACIÓN ---
+
+def importar_vecinos(fichero, nombre, cooperativa, tam_lote=200, procesos=None):
+    """
+    Da de alta a los vecinos de un CSV/XLSX en la cooperativa.
+
+    Las filas se validan según llegan; las buenas se juntan en lotes que se
+    comprueban contra la BD con una consulta, se cifran en paralelo y se insertan
+    con bulk_create. Los correos de bienvenida van a la bandeja de salida en la misma transacción.
+    Devuelve un resumen con los creados, los errores por línea y los vecinos/segundo.
+
+    Si el fichero se rompe a mitad (FicheroNoValido), lo anterior a la línea rota
+    queda dado de alta y el resumen de lo hecho va en el atributo resumen de la excepción.
+    """
+    inicio = time.perf_counter()
+    resumen = {'creados': 0, 'errores': []}
+    vistos = set()
+    lote = []
+
+    filas = leer_filas(fichero, nombre)
+    with pool_de_cifrado(procesos) as pool:
+        try:
+            for linea, datos in filas:
+                form = FilaVecinoForm(datos)
+                if not form.is_valid():
+                    campo, mensajes = next(iter(form.errors.items()))
+                    resumen['errores'].append((linea, f"{campo}: {mensajes[0]}"))
+                    continue
+                username = form.cleaned_data['username']
+                if username in vistos:
+                    resumen['errores'].append((linea, f"El usuario {username} está repetido en el fichero."))
+                    continue
+                vistos.add(username)
+
+                lote.append((linea, form))
+                if len(lote) >= tam_lote:
+                    _guardar_lote(lote, cooperativa, pool, resumen)
+                    lote = []
+        except FicheroNoValido as e:
+            # Los lotes anteriores ya están guardados (y sus correos en la bandeja):
+            # se guarda también lo leído hasta la línea rota y se cuenta todo
+            if lote:
+                _guardar_lote(lote, cooperativa, pool, resumen)
+            e.resumen = _cerrar_resumen(resumen, inicio)
+            raise
+        if lote:
+            _guardar_lote(lote, cooperativa, pool, resumen)
+
+    return _cerrar_resumen(resumen, inicio)
+
+def _cerrar_resumen(resumen, inicio):
+    resumen['segundos'] = time.perf_counter() - inicio
+    resumen['por_segundo'] = resumen['creados'] / resumen['segundos'] if resumen['segundos'] else 0
+    return resumen
+
+def _guardar_lote(lote, cooperativa, pool, resumen):
+    # 1. Los que ya existen, en una sola consulta para todo el lote
+    existentes = set(Usuario.objects.filter(
+        username__in=[form.cleaned_data['username'] for _, form in lote]
+    ).values_list('username', flat=True))
+
+    nuevos, lineas = [], []
+    for linea, form in lote:
+        if form.cleaned_data['username'] in existentes:
+            resumen['errores'].append((linea, f"Ya existe el usuario {form.cleaned_data['username']}."))
+            continue
+        vecino = form.save(commit=False)
+        vecino.cooperativa = cooperativa
+        vecino.rol = Usuario.VECINO
+        vecino.requiere_cambio_pass = True
+        nuevos.append(vecino)
+        lineas.append(linea)
+    if not nuevos:
+        return
+
+    # 2. Contraseñas provisionales, cifradas en paralelo
+    claves = [get_random_string(length=8) for _ in nuevos]
+    for vecino, cifrada in zip(nuevos, cifrar(claves, pool)):
+        vecino.password = cifrada
+
+    # 3. Todo el lote en un INSERT, con sus bienvenidas (o nada, si alguien ha cogido un nombre mientras tanto)
+    try:
+        with transaction.atomic():
+            Usuario.objects.bulk_create(nuevos)
+            encolar([correo_bienvenida(vecino, clave) for vecino, clave in zip(nuevos, claves)])
+    except IntegrityError:
+        resumen['errores'].extend(
+            (linea, "Lote no guardado: otro usuario con el mismo nombre se creó a la vez.") for linea in lineas
+        )
+        return
+    resumen['creados'] += len(nuevos)
+    # bulk_create no lanza señales: el directorio de nombres se renueva a mano, lote a lote
+    cache.delete(clave_directorio(cooperativa.id))
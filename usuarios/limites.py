@@ -0,0 +1,90 @@
+# usuarios/limites.py
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+# --- FRENO DE INTENTOS DE LOGIN ---
+# Un cubo de fichas por nombre de usuario y otro por IP, guardados en la caché como
+# (fichas, instante); se van recuperando solas a su ritmo. Sin fichas se rechaza
+# antes de cifrar nada, que es lo caro.
+#
+# Cada intento gasta una ficha de su usuario. La IP solo gasta con los intentos
+# FALLIDOS: en una asamblea toda la comunidad entra a la vez desde la misma wifi,
+# y sus logins buenos no deben frenarse entre sí. Quien prueba contraseñas (o
+# nombres) desde una IP sí la vacía.
+
+# (capacidad, fichas que se recuperan por segundo)
+FRENO_USUARIO = (5, 1 / 30)
+FRENO_IP = (50, 5.0)        # 50 fallos seguidos, y luego 5 por segundo
+
+
+def ip_cliente(request):
+    return request.META.get('REMOTE_ADDR') or 'desconocida'
+
+def _clave(tipo, valor):
+    # El nombre lo escribe cualquiera: a la clave solo va su huella
+    return f'usuarios:freno:{tipo}:{hashlib.sha1(valor.encode()).hexdigest()[:16]}'
+
+def _cubo_ip(ip):
+    return _clave('ip', ip), getattr(settings, 'LOGIN_FRENO_IP', FRENO_IP)
+
+def _cubo_usuario(username):
+    return _clave('usuario', username.strip().lower()), getattr(settings, 'LOGIN_FRENO_USUARIO', FRENO_USUARIO)
+
+def _fichas(cubo, capacidad, ritmo, ahora):
+    if cubo is None:
+        return float(capacidad)
+    fichas, instante = cubo
+    return min(capacidad, fichas + (ahora - instante) * ritmo)
+
+def _gastar(clave, freno, fichas, ahora):
+    # Pasado lo que tarda en llenarse, el cubo está lleno: la entrada puede caducar
+    capacidad, ritmo = freno
+    cache.set(clave, (fichas - 1, ahora), int(capacidad / ritmo) + 1)
+
+def frenar_login(ip, username):
+    """
+    Mira los cubos de la IP y del usuario y gasta una ficha del usuario. Devuelve
+    0 si el intento puede seguir, o los segundos que faltan para que vuelva a
+    haber ficha. Si luego la contraseña no vale, hay que llamar a apuntar_fallo().
+
+    Leer y escribir no es atómico: con mucha concurrencia se puede colar algún
+    intento de más, que para frenar fuerza bruta no importa.
+    """
+    ahora = time.time()
+    cubos = dict([_cubo_ip(ip), _cubo_usuario(username)])
+    guardados = cache.get_many(list(cubos))
+    fichas = {
+        clave: _fichas(guardados.get(clave), capacidad, ritmo, ahora)
+        for clave, (capacidad, ritmo) in cubos.items()
+    }
+
+    esperas = [(1 - fichas[clave]) / ritmo for clave, (_, ritmo) in cubos.items() if fichas[clave] < 1]
+    if esperas:
+        return max(esperas)
+
+    clave, freno = _cubo_usuario(username)
+    _gastar(clave, freno, fichas[clave], ahora)
+    return 0
+
+def apuntar_fallo(ip):
+    # Contraseña o usuario incorrectos: ahora sí gasta la IP
+    ahora = time.time()
+    clave, freno = _cubo_ip(ip)
+    _gastar(clave, freno, _fichas(cache.get(clave), *freno, ahora), ahora)
+
+async def afrenar_login(ip, username):
+    # Como votaciones.resultados.aleer_cache: la caché en memoria no hace E/S
+    if isinstance(caches['default'], LocMemCache):
+        return frenar_login(ip, username)
+    return await sync_to_async(frenar_login)(ip, username)
+
+async def aapuntar_fallo(ip):
+    if isinstance(caches['default'], LocMemCache):
+        return apuntar_fallo(ip)
+    return await sync_to_async(apuntar_fallo)(ip)
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import time
+from urllib.parse import urlencode
+
+from django.contrib.auth import authenticate, login
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.shortcuts import redirect, render
+from django.test import override_settings
+from django.urls import path
+from django.utils.crypto import get_random_string
+
+from usuarios import cifrado
+from usuarios.cifrado import ColaCifrado
+from usuarios.models import Cooperativa, Usuario
+from usuarios.views import login_view
+from votaciones.management.commands._medidas import percentiles, formatear, peticion_asgi
+
+
+# El login tal como era antes (síncrono, cifrando en el hilo de la vista), para comparar
+def login_sincrono(request):
+    if request.method == 'POST':
+        user = authenticate(request, username=request.POST['username'], password=request.POST['password'])
+        if user is not None:
+            login(request, user)
+            return redirect('/')
+        return render(request, 'login.html', {'error': "Usuario o contraseña incorrectos."})
+    return render(request, 'login.html')
+
+
+# Este mismo módulo hace de urls.py mientras dura la prueba
+urlpatterns = [
+    path('sincrona/', login_sincrono),
+    path('asincrona/', login_view),
+    path('', lambda request: HttpResponse(), name='panel_inicio'),
+]
+
+
+class PBKDF2Ajustable(PBKDF2PasswordHasher):
+    # Para pruebas rápidas con --iteraciones (mismo algoritmo, menos vueltas)
+    pass
+
+
+CSRF = get_random_string(32)
+CABECERAS = [
+    (b'cookie', f'csrftoken={CSRF}'.encode()),
+    (b'x-csrftoken', CSRF.encode()),
+    (b'content-type', b'application/x-www-form-urlencoded'),
+]
+
+
+class Command(BaseCommand):
+    help = "Avalancha de logins (todos a la vez, como al empezar una asamblea): síncrono contra cola de cifrado."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=500)
+        parser.add_argument('--intrusos', type=int, default=100,
+                            help="Intentos con contraseña mala contra un mismo usuario durante la avalancha.")
+        parser.add_argument('--iteraciones', type=int, default=None,
+                            help="Vueltas de PBKDF2 (por defecto, las de Django; menos para una prueba rápida).")
+        parser.add_argument('--hilos', type=int, default=None, help="Hilos de la cola de cifrado.")
+        parser.add_argument('--max-cola', type=int, default=None, help="Cifrados en espera antes de contestar 503.")
+        parser.add_argument('--conservar', action='store_true',
+                            help="No borrar la cooperativa de prueba al terminar.")
+
+    def handle(self, *args, **options):
+        ajustes = {'ROOT_URLCONF': __name__, 'ALLOWED_HOSTS': ['localhost']}
+        if options['iteraciones']:
+            PBKDF2Ajustable.iterations = options['iteraciones']
+            ajustes['PASSWORD_HASHERS'] = [f'{__name__}.PBKDF2Ajustable']
+
+        with override_settings(**ajustes):
+            # 1. ESCENARIO: todos con la misma contraseña (cifrarla 500 veces llevaría minutos)
+            token = get_random_string(6).lower()
+            clave = get_random_string(12)
+            cooperativa = Cooperativa.objects.create(nombre=f"Benchmark {token}")
+            cifrada = make_password(clave)
+            Usuario.objects.bulk_create([
+                Usuario(username=f"bench_{token}_{i}", password=cifrada, cooperativa=cooperativa,
+                        rol=Usuario.VECINO, requiere_cambio_pass=False)
+                for i in range(options['usuarios'])
+            ])
+            nombres = list(Usuario.objects.filter(cooperativa=cooperativa).values_list('username', flat=True))
+
+            # 2. AVALANCHA: primero el login de antes y luego el de ahora
+            original = cifrado.cola_cifrado
+            try:
+                aplicacion = get_asgi_application()
+                # Los 429/503 son lo esperado aquí: que no llenen la salida de avisos
+                logging.getLogger('django.request').setLevel(logging.CRITICAL)
+                for numero, modo in enumerate(('sincrona', 'asincrona')):
+                    cifrado.cola_cifrado = ColaCifrado(hilos=options['hilos'], max_cola=options['max_cola'])
+                    resultado = asyncio.run(self.avalancha(
+                        aplicacion, f'/{modo}/', nombres, clave, options['intrusos'], numero
+                    ))
+                    self.informar(modo, resultado)
+            finally:
+                cifrado.cola_cifrado = original
+                if not options['conservar']:
+                    cooperativa.delete()
+
+    async def avalancha(self, aplicacion, ruta, nombres, clave, intrusos, numero):
+        def entrar(username, password, ip):
+            cuerpo = urlencode({'username': username, 'password': password}).encode()
+            return peticion_asgi(aplicacion, ruta, 'POST', CABECERAS, cuerpo, cliente=ip)
+
+        # Los vecinos, todos desde la misma IP (la wifi de la asamblea); los intrusos, desde
+        # otra y contra un solo usuario
+        legitimos = [entrar(nombre, clave, f'10.{numero}.0.1') for nombre in nombres]
+        ataque = [entrar(nombres[0] + '_intruso', 'mala', f'192.0.2.{numero + 1}') for _ in range(intrusos)]
+
+        inicio = time.perf_counter()
+        tareas = [asyncio.ensure_future(peticion) for peticion in legitimos + ataque]
+        sondas = await self.sondear(aplicacion, ruta, tareas)
+        respuestas = await asyncio.gather(*tareas)
+        total = time.perf_counter() - inicio
+        return {
+            'legitimos': respuestas[:len(legitimos)],
+            'ataque': respuestas[len(legitimos):],
+            'sondas': sondas,
+            'total': total,
+        }
+
+    async def sondear(self, aplicacion, ruta, tareas):
+        # Alguien que solo quiere ver la página de login mientras los demás entran
+        muestras = []
+        while not all(tarea.done() for tarea in tareas):
+            _, duracion = await peticion_asgi(aplicacion, ruta, cliente='10.255.0.1')
+            muestras.append(duracion)
+            await asyncio.sleep(0.1)
+        return muestras
+
+    def informar(self, modo, resultado):
+        estados = {}
+        for estado, _ in resultado['legitimos']:
+            estados[estado] = estados.get(estado, 0) + 1
+        dentro = [duracion for estado, duracion in resultado['legitimos'] if estado == 302]
+        todos = [duracion for _, duracion in resultado['legitimos']]
+        saturados = estados.get(503, 0)
+        ataque = [duracion for _, duracion in resultado['ataque']]
+        frenados = sum(1 for estado, _ in resultado['ataque'] if estado == 429)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{modo}: {resultado['total']:.1f}s en total"))
+        # La latencia de los que entran no basta: un 503 contesta rápido y no cuenta en ella
+        self.stdout.write(formatear("  logins correctos", percentiles(dentro))
+                          + f" | 503: {saturados}/{len(todos)} ({saturados / len(todos):.0%})"
+                          + f" | respuestas {dict(sorted(estados.items()))}"
+                          + f" | {len(dentro) / resultado['total']:.1f} logins/s")
+        self.stdout.write(formatear("  todos los legítimos (también los rechazados)", percentiles(todos)))
+        if ataque:
+            self.stdout.write(formatear("  intrusos", percentiles(ataque))
+                              + f" | {frenados}/{len(ataque)} frenados sin cifrar")
+        self.stdout.write(formatear("  página de login durante la avalancha", percentiles(resultado['sondas'])))
+        if modo == 'asincrona':
+            self.stdout.write(f"  cola de cifrado: {cifrado.cola_cifrado.metricas()}")
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from usuarios.correo import RepartidorCorreos
+
+
+class Command(BaseCommand):
+    help = "Vacía la bandeja de salida de correos (en bucle, o una sola vez con --una-vez)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--espera', type=int, default=5,
+                            help="Segundos entre una pasada y la siguiente.")
+        parser.add_argument('--una-vez', action='store_true',
+                            help="Mandar lo pendiente y salir (para cron).")
+
+    def handle(self, *args, **options):
+        repartidor = RepartidorCorreos(espera=options['espera'])
+        if options['una_vez']:
+            self.stdout.write(f"{repartidor.vaciar()} correos procesados.")
+            return
+
+        self.stdout.write("Repartidor de correos en marcha (Ctrl+C para parar).")
+        try:
+            while True:
+                repartidor.vaciar()
+                time.sleep(options['espera'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from usuarios.importacion import importar_vecinos, FicheroNoValido
+from usuarios.models import Cooperativa
+
+
+class Command(BaseCommand):
+    help = "Da de alta en una cooperativa a todos los vecinos de un CSV o XLSX."
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichero')
+        parser.add_argument('--cooperativa', required=True, help="Id o nombre de la cooperativa.")
+        parser.add_argument('--lote', type=int, default=200, help="Vecinos por cada bulk_create.")
+        parser.add_argument('--procesos', type=int, default=None,
+                            help="Procesos para cifrar contraseñas (por defecto, uno por núcleo; 0 = sin pool).")
+
+    def handle(self, *args, **options):
+        filtro = {'id': options['cooperativa']} if options['cooperativa'].isdigit() else {'nombre': options['cooperativa']}
+        cooperativa = Cooperativa.objects.filter(**filtro).first()
+        if cooperativa is None:
+            raise CommandError(f"No existe la cooperativa {options['cooperativa']}.")
+
+        try:
+            with open(options['fichero'], 'rb') as fichero:
+                resumen = importar_vecinos(
+                    fichero, options['fichero'], cooperativa,
+                    tam_lote=options['lote'], procesos=options['procesos'],
+                )
+        except (OSError, FicheroNoValido) as e:
+            raise CommandError(str(e))
+
+        for linea, motivo in resumen['errores']:
+            self.stderr.write(f"Línea {linea}: {motivo}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumen['creados']} vecinos creados en {resumen['segundos']:.2f}s "
+            f"({resumen['por_segundo']:.1f} vecinos/s), {len(resumen['errores'])} filas con errores."
+        ))
+        self.stdout.write("Las bienvenidas están en la bandeja de salida (ver el comando enviar_correos).")
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from usuarios.bajas import ProcesadorBajas
+
+
+class Command(BaseCommand):
+    help = "Hace las bajas de vecinos pendientes (en bucle, o una sola vez con --una-vez)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--espera', type=int, default=5,
+                            help="Segundos entre una pasada y la siguiente.")
+        parser.add_argument('--una-vez', action='store_true',
+                            help="Hacer las pendientes y salir (para cron).")
+
+    def handle(self, *args, **options):
+        procesador = ProcesadorBajas(espera=options['espera'])
+        if options['una_vez']:
+            self.stdout.write(f"{procesador.vaciar()} vecinos dados de baja.")
+            return
+
+        self.stdout.write("Procesador de bajas en marcha (Ctrl+C para parar).")
+        try:
+            while True:
+                procesador.vaciar()
+                time.sleep(options['espera'])
+        except KeyboardInterrupt:
+            pass
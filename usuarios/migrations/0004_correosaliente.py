@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:29
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0003_cooperativa_presidente_ve_votos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorreoSaliente',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('asunto', models.CharField(max_length=200)),
+                ('cuerpo', models.TextField()),
+                ('remitente', models.CharField(max_length=254)),
+                ('destinatario', models.EmailField(max_length=254)),
+                ('estado', models.CharField(choices=[('PE', 'Pendiente'), ('EN', 'Enviado'), ('FA', 'Fallido')], default='PE', max_length=2)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('proximo_intento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_envio', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Correo saliente',
+                'verbose_name_plural': 'Bandeja de salida',
+                'indexes': [models.Index(fields=['estado', 'proximo_intento'], name='usuarios_co_estado_19b5e1_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0004_correosaliente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BajaVecino',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(max_length=150)),
+                ('fecha_peticion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_baja', models.DateTimeField(blank=True, null=True)),
+                ('pedida_por', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('usuario', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Baja de vecino',
+                'verbose_name_plural': 'Bajas de vecinos',
+            },
+        ),
+    ]
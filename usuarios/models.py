@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 
 # 1. MODELO COOPERATIVA (El Edificio)
 class Cooperativa(models.Model):
@@ -62,6 +63,13 @@ class Usuario(AbstractUser):
         verbose_name = "Usuario"
         verbose_name_plural = "Usuarios"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Como en Votacion: cómo venía de la BD, para saber de qué cooperativa se ha ido
+        instancia = super().from_db(db, field_names, values)
+        instancia._valores_guardados = dict(zip(field_names, values))
+        return instancia
+
     def __str__(self):
         coop = self.cooperativa.nombre if self.cooperativa else "Sin asignar"
         return f"{self.username} ({self.get_rol_display()}) - {coop}"
@@ -73,4 +81,63 @@ class Usuario(AbstractUser):
     
     @property
     def es_vecino(self):
-        return self.rol == self.VECINO
\ No newline at end of file
+        return self.rol == self.VECINO
+
+# 3. BANDEJA DE SALIDA (correos que manda la aplicación)
+class CorreoSaliente(models.Model):
+    """
+    Un correo por enviar. Se guarda en la misma transacción que lo provoca
+    (alta de vecino, código de perfil...) y lo manda luego usuarios/correo.py.
+    """
+    PENDIENTE = 'PE'
+    ENVIADO = 'EN'
+    FALLIDO = 'FA'
+
+    ESTADOS_CHOICES = [
+        (PENDIENTE, 'Pendiente'),
+        (ENVIADO, 'Enviado'),
+        (FALLIDO, 'Fallido'),
+    ]
+
+    asunto = models.CharField(max_length=200)
+    cuerpo = models.TextField()
+    remitente = models.CharField(max_length=254)
+    destinatario = models.EmailField()
+
+    estado = models.CharField(max_length=2, choices=ESTADOS_CHOICES, default=PENDIENTE)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    # Cuándo se puede volver a intentar (también sirve de "reserva" mientras se envía)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_envio = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Correo saliente"
+        verbose_name_plural = "Bandeja de salida"
+        indexes = [models.Index(fields=['estado', 'proximo_intento'])]
+
+    def __str__(self):
+        return f"{self.asunto} -> {self.destinatario} ({self.get_estado_display()})"
+
+
+# 4. BAJAS DE VECINOS PENDIENTES
+class BajaVecino(models.Model):
+    """
+    Un vecino que el presidente ha dado de baja. La cuenta se desactiva al momento
+    y el borrado (con sus votos) lo hace después usuarios/bajas.py, por lotes.
+    """
+    # Al borrarlo se queda en NULL: el nombre se guarda aparte para el historial
+    usuario = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, related_name='+')
+    username = models.CharField(max_length=150)
+    pedida_por = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, related_name='+')
+    fecha_peticion = models.DateTimeField(auto_now_add=True)
+    fecha_baja = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Baja de vecino"
+        verbose_name_plural = "Bajas de vecinos"
+
+    def __str__(self):
+        estado = "hecha" if self.fecha_baja else "pendiente"
+        return f"Baja de {self.username} ({estado})"
@@ -1,3 +1,497 @@
-from django.test import TestCase
+from datetime import timedelta
+from smtplib import SMTPException
+from unittest import mock
+from io import BytesIO
 
-# Create your tests here.
+from django.conf import global_settings
+from django.contrib.auth.hashers import check_password
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from votaciones.contadores import cuadrar_contadores
+from votaciones.difusion import difusor
+from votaciones.models import Votacion, Opcion, Voto
+from votaciones.pendientes import calcular_estado
+from votaciones.resultados import clave_directorio
+from votaciones.servicios import registrar_voto
+from . import bajas, cifrado, correo
+from .cifrado import ColaCifrado
+from .correo import enviar_pendientes
+from .importacion import importar_vecinos, FicheroNoValido
+from .models import Cooperativa, Usuario, CorreoSaliente, BajaVecino
+
+
+class PanelInicioTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooperativa = Cooperativa.objects.create(nombre="Los Olivos")
+        cls.vecino = Usuario.objects.create_user('vecino', password='x', cooperativa=cls.cooperativa,
+                                                 requiere_cambio_pass=False)
+        cls.votaciones = []
+        for i in range(3):
+            votacion = Votacion.objects.create(
+                titulo=f"Votación {i}", cooperativa=cls.cooperativa,
+                fecha_fin=timezone.now() + timedelta(days=1),
+            )
+            Opcion.objects.create(votacion=votacion, texto="Sí")
+            cls.votaciones.append(votacion)
+        registrar_voto(cls.vecino, cls.votaciones[0], cls.votaciones[0].opciones.get().id)
+        Votacion.objects.filter(id=cls.votaciones[2].id).update(fecha_fin=timezone.now() - timedelta(days=1))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cuenta_las_pendientes(self):
+        self.client.force_login(self.vecino)
+
+        respuesta = self.client.get(reverse('panel_inicio'))
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context['pendientes'], 1)
+        self.assertContains(respuesta, "Los Olivos")
+
+    def test_obliga_a_cambiar_la_contrasena(self):
+        nuevo = Usuario.objects.create_user('nuevo', cooperativa=self.cooperativa)
+        self.client.force_login(nuevo)
+
+        respuesta = self.client.get(reverse('panel_inicio'))
+
+        self.assertRedirects(respuesta, reverse('cambiar_password_obligatorio'), fetch_redirect_response=False)
+
+    def test_segunda_carga_sin_consultas_de_pendientes(self):
+        self.client.force_login(self.vecino)
+        self.client.get(reverse('panel_inicio'))
+
+        # Sesión, usuario y cooperativa: las pendientes salen de la caché
+        with self.assertNumQueries(3):
+            self.client.get(reverse('panel_inicio'))
+
+    def test_pendientes_en_un_solo_not_exists(self):
+        with CaptureQueriesContext(connection) as consultas:
+            estado = calcular_estado(self.vecino, generacion=0)
+
+        self.assertEqual(len(consultas), 2)
+        self.assertTrue(any('NOT EXISTS' in consulta['sql'] for consulta in consultas))
+        self.assertEqual([id_votacion for id_votacion, _ in estado['pendientes']], [self.votaciones[1].id])
+
+    def test_votar_y_abrir_votaciones_renueva_la_cuenta(self):
+        self.client.force_login(self.vecino)
+        url = reverse('panel_inicio')
+        self.client.get(url)
+
+        registrar_voto(self.vecino, self.votaciones[1], self.votaciones[1].opciones.get().id)
+        self.assertEqual(self.client.get(url).context['pendientes'], 0)
+
+        Votacion.objects.create(titulo="Nueva", cooperativa=self.cooperativa,
+                                fecha_fin=timezone.now() + timedelta(days=1))
+        self.assertEqual(self.client.get(url).context['pendientes'], 1)
+
+    def test_fuera_del_censo_no_tiene_pendientes(self):
+        # Entra en la cooperativa con las votaciones ya abiertas: no puede votarlas
+        recien_llegado = Usuario.objects.create_user('nuevo', cooperativa=self.cooperativa,
+                                                     requiere_cambio_pass=False)
+        self.client.force_login(recien_llegado)
+
+        self.assertEqual(self.client.get(reverse('panel_inicio')).context['pendientes'], 0)
+        respuesta = self.client.get(reverse('ver_votacion', args=[self.votaciones[1].id]))
+        self.assertTrue(respuesta.context['fuera_del_censo'])
+        self.assertNotContains(respuesta, 'name="btn_votar"')
+
+
+CSV_VECINOS = (
+    "usuario;email;nombre;apellidos;vivienda\n"
+    "ana;ana@x.com;Ana;Sanz;1A\n"
+    "luis;luis@x.com;Luis;Gil;1B\n"
+    "ana;otra@x.com;Ana;Repetida;2A\n"
+    "sin_correo;;Pepe;Ruiz;2B\n"
+    "existente;e@x.com;Ya;Estaba;3A\n"
+).encode()
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], IMPORTACION_PROCESOS=0,
+                   CORREO_EN_PROCESO=False)
+class ImportacionVecinosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooperativa = Cooperativa.objects.create(nombre="Los Olivos")
+        cls.presidente = Usuario.objects.create_user('presi', password='x', cooperativa=cls.cooperativa,
+                                                     rol=Usuario.PRESIDENTE, requiere_cambio_pass=False)
+        Usuario.objects.create_user('existente', cooperativa=cls.cooperativa)
+
+    def test_importa_las_buenas_y_explica_las_malas(self):
+        resumen = importar_vecinos(BytesIO(CSV_VECINOS), 'vecinos.csv', self.cooperativa, tam_lote=1)
+        enviar_pendientes()
+
+        self.assertEqual(resumen['creados'], 2)
+        self.assertEqual([linea for linea, _ in resumen['errores']], [4, 5, 6])
+        ana = Usuario.objects.get(username='ana')
+        self.assertEqual((ana.cooperativa, ana.rol, ana.numero_vivienda), (self.cooperativa, Usuario.VECINO, '1A'))
+        self.assertTrue(ana.requiere_cambio_pass)
+
+        # La contraseña del correo es la que se ha guardado cifrada
+        correo = next(m for m in mail.outbox if m.to == ['ana@x.com'])
+        self.assertTrue(check_password(correo.body.split('Contraseña: ')[1], ana.password))
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_cabecera_sin_columnas_obligatorias(self):
+        with self.assertRaises(FicheroNoValido):
+            importar_vecinos(BytesIO(b"nombre,apellidos\nAna,Sanz\n"), 'vecinos.csv', self.cooperativa)
+
+    def test_csv_de_excel_en_windows_1252(self):
+        csv_excel = "usuario;email;nombre;apellidos\r\njose;jose@x.com;José;Muñoz\r\n".encode('cp1252')
+
+        resumen = importar_vecinos(BytesIO(csv_excel), 'vecinos.csv', self.cooperativa)
+
+        self.assertEqual(resumen['creados'], 1)
+        jose = Usuario.objects.get(username='jose')
+        self.assertEqual((jose.first_name, jose.last_name), ('José', 'Muñoz'))
+
+    def test_fichero_que_no_es_texto(self):
+        self.client.force_login(self.presidente)
+
+        respuesta = self.client.post(reverse('importar_vecinos'), {
+            'fichero': SimpleUploadedFile('vecinos.csv', b"usuario;email\nana;\x81\x8d@x.com\n"),
+        })
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('Línea 2', respuesta.context['error'])
+        self.assertFalse(Usuario.objects.filter(username='ana').exists())
+
+    def test_fichero_roto_a_mitad(self):
+        # Lo anterior a la línea rota queda dado de alta, con su resumen y el directorio renovado
+        self.client.force_login(self.presidente)
+        cache.set(clave_directorio(self.cooperativa.id), {'viejo': 'directorio'})
+        fichero = b"usuario;email\nana;ana@x.com\nluis;luis@x.com\nmar;mar@x.com\npepe;\x81\x8d@x.com\nrosa;rosa@x.com\n"
+
+        respuesta = self.client.post(reverse('importar_vecinos'), {
+            'fichero': SimpleUploadedFile('vecinos.csv', fichero),
+        })
+
+        self.assertIn('Línea 5', respuesta.context['error'])
+        self.assertEqual(respuesta.context['resumen']['creados'], 3)
+        self.assertContains(respuesta, '3 vecinos dados de alta')
+        self.assertEqual(
+            set(Usuario.objects.filter(username__in=['ana', 'luis', 'mar', 'pepe', 'rosa']).values_list('username', flat=True)),
+            {'ana', 'luis', 'mar'}
+        )
+        self.assertEqual(CorreoSaliente.objects.count(), 3)
+        self.assertIsNone(cache.get(clave_directorio(self.cooperativa.id)))
+
+    def test_subida_del_presidente(self):
+        self.client.force_login(self.presidente)
+
+        respuesta = self.client.post(reverse('importar_vecinos'), {
+            'fichero': SimpleUploadedFile('vecinos.csv', CSV_VECINOS, content_type='text/csv'),
+        })
+
+        self.assertEqual(respuesta.context['resumen']['creados'], 2)
+        self.assertTrue(Usuario.objects.filter(username='luis', cooperativa=self.cooperativa).exists())
+
+    @override_settings(PASSWORD_HASHERS=global_settings.PASSWORD_HASHERS)
+    def test_cifrado_en_procesos(self):
+        # Los procesos del pool arrancan con los ajustes reales (PBKDF2), no con los del test
+        resumen = importar_vecinos(BytesIO(CSV_VECINOS), 'vecinos.csv', self.cooperativa, procesos=2)
+        enviar_pendientes()
+
+        self.assertEqual(resumen['creados'], 2)
+        luis = Usuario.objects.get(username='luis')
+        self.assertTrue(luis.password.startswith('pbkdf2_sha256$'))
+        correo = next(m for m in mail.outbox if m.to == ['luis@x.com'])
+        self.assertTrue(check_password(correo.body.split('Contraseña: ')[1], luis.password))
+
+
+@override_settings(CORREO_EN_PROCESO=False)
+class BandejaSalidaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooperativa = Cooperativa.objects.create(nombre="Los Olivos")
+        cls.presidente = Usuario.objects.create_user('presi', password='x', email='presi@x.com',
+                                                     cooperativa=cls.cooperativa, rol=Usuario.PRESIDENTE,
+                                                     requiere_cambio_pass=False)
+
+    def test_alta_deja_el_correo_y_avisa_al_confirmar(self):
+        self.client.force_login(self.presidente)
+
+        with mock.patch.object(correo.repartidor, 'avisar') as avisar, \
+                self.settings(CORREO_EN_PROCESO=True), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('crear_vecino'), {'username': 'ana', 'email': 'ana@x.com'})
+
+        # La respuesta no ha tocado el SMTP: el correo espera en la bandeja
+        self.assertEqual(mail.outbox, [])
+        pendiente = CorreoSaliente.objects.get(destinatario='ana@x.com')
+        self.assertEqual(pendiente.estado, CorreoSaliente.PENDIENTE)
+        avisar.assert_called_once()
+
+        self.assertEqual(enviar_pendientes(), 1)
+        pendiente.refresh_from_db()
+        self.assertEqual(pendiente.estado, CorreoSaliente.ENVIADO)
+        self.assertIsNotNone(pendiente.fecha_envio)
+        self.assertEqual(mail.outbox[0].to, ['ana@x.com'])
+        # La contraseña provisional no se queda en la bandeja
+        self.assertEqual(pendiente.cuerpo, '')
+        self.assertIn('Contraseña: ', mail.outbox[0].body)
+
+    def test_codigo_de_perfil_por_la_bandeja(self):
+        self.client.force_login(self.presidente)
+        self.client.get(reverse('solicitar_codigo_perfil'))
+
+        enviar_pendientes()
+        self.assertIn(self.client.session['codigo_seguridad'], mail.outbox[0].body)
+
+    def test_una_conexion_por_lote(self):
+        correo.encolar([correo.nuevo_correo('Aviso', 'Hola', f'v{i}@x.com') for i in range(5)])
+
+        with mock.patch.object(correo, 'get_connection', wraps=correo.get_connection) as conexiones:
+            self.assertEqual(enviar_pendientes(tam=3), 3)
+            self.assertEqual(enviar_pendientes(tam=3), 2)
+            self.assertEqual(enviar_pendientes(tam=3), 0)
+
+        self.assertEqual(conexiones.call_count, 2)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_reintentos_con_espera_creciente(self):
+        correo.encolar([correo.nuevo_correo('Aviso', 'Hola', 'ana@x.com')])
+        pendiente = CorreoSaliente.objects.get()
+        esperas = []
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                        side_effect=SMTPException("buzón lleno")), self.assertLogs('usuarios.correo', 'ERROR'):
+            for _ in range(correo.MAX_INTENTOS):
+                antes = timezone.now()
+                self.assertEqual(enviar_pendientes(), 1)
+                pendiente.refresh_from_db()
+                esperas.append((pendiente.proximo_intento - antes).total_seconds())
+                # Hasta que llegue su hora nadie lo vuelve a coger
+                self.assertEqual(enviar_pendientes(), 0)
+                CorreoSaliente.objects.update(proximo_intento=timezone.now())
+
+        pendiente.refresh_from_db()
+        self.assertEqual(pendiente.estado, CorreoSaliente.FALLIDO)
+        self.assertEqual(pendiente.intentos, correo.MAX_INTENTOS)
+        self.assertIn("buzón lleno", pendiente.ultimo_error)
+        self.assertEqual(pendiente.cuerpo, '')
+        self.assertTrue(all(a < b for a, b in zip(esperas, esperas[1:-1])))
+        self.assertEqual(enviar_pendientes(), 0)
+
+    def test_si_la_alta_falla_no_hay_correo(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            correo.encolar([correo.nuevo_correo('Aviso', 'Hola', 'ana@x.com')])
+            raise RuntimeError
+
+        self.assertFalse(CorreoSaliente.objects.exists())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AccesoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooperativa = Cooperativa.objects.create(nombre="Los Olivos")
+        cls.vecino = Usuario.objects.create_user('vecino', password='clave-buena', cooperativa=cls.cooperativa,
+                                                 requiere_cambio_pass=False)
+
+    def setUp(self):
+        cache.clear()
+        # Una cola propia por test para poder contar lo que pasa por ella
+        self.cola = ColaCifrado(hilos=2, max_cola=10)
+        parche = mock.patch.object(cifrado, 'cola_cifrado', self.cola)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def entrar(self, username='vecino', password='clave-buena', ip='10.0.0.1'):
+        return self.client.post(reverse('login'), {'username': username, 'password': password}, REMOTE_ADDR=ip)
+
+    def test_login_cifra_en_la_cola(self):
+        respuesta = self.entrar()
+
+        self.assertRedirects(respuesta, reverse('panel_inicio'), fetch_redirect_response=False)
+        self.assertEqual(self.client.session['_auth_user_id'], str(self.vecino.id))
+        metricas = self.cola.metricas()
+        self.assertEqual((metricas['atendidos'], metricas['en_cola'], metricas['en_curso']), (1, 0, 0))
+
+    def test_login_incorrecto(self):
+        for username in ('vecino', 'no_existe'):
+            respuesta = self.entrar(username=username, password='mala')
+            self.assertContains(respuesta, "Usuario o contraseña incorrectos.")
+        # También se cifra para el que no existe: el tiempo no delata qué nombres hay
+        self.assertEqual(self.cola.metricas()['atendidos'], 2)
+
+    @override_settings(LOGIN_FRENO_USUARIO=(3, 0.001))
+    def test_freno_por_usuario_antes_de_cifrar(self):
+        for i in range(3):
+            self.entrar(password='mala', ip=f'10.0.0.{i}')
+
+        respuesta = self.entrar(ip='10.0.0.9')
+
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertContains(respuesta, "Demasiados intentos", status_code=429)
+        self.assertGreater(int(respuesta['Retry-After']), 0)
+        self.assertEqual(self.cola.metricas()['atendidos'], 3)
+
+    @override_settings(LOGIN_FRENO_IP=(2, 0.001))
+    def test_freno_por_ip(self):
+        self.entrar(username='a', password='mala')
+        self.entrar(username='b', password='mala')
+
+        self.assertEqual(self.entrar().status_code, 429)
+        # Desde otra IP se sigue entrando
+        self.assertEqual(self.entrar(ip='10.0.0.2').status_code, 302)
+
+    @override_settings(LOGIN_FRENO_IP=(2, 0.001))
+    def test_logins_buenos_desde_la_misma_wifi_no_gastan_la_ip(self):
+        otros = [Usuario.objects.create_user(f'vecino{i}', password='clave-buena', cooperativa=self.vecino.cooperativa)
+                 for i in range(3)]
+
+        for usuario in [self.vecino, *otros]:
+            self.assertEqual(self.entrar(username=usuario.username).status_code, 302)
+
+    def test_cola_llena_rechaza_al_momento(self):
+        self.cola.max_cola = 0
+
+        respuesta = self.entrar()
+
+        self.assertEqual(respuesta.status_code, 503)
+        self.assertEqual(respuesta['Retry-After'], '2')
+        self.assertEqual(self.cola.metricas()['rechazados'], 1)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_cambio_obligatorio(self):
+        self.vecino.requiere_cambio_pass = True
+        self.vecino.save()
+        self.client.force_login(self.vecino)
+        url = reverse('cambiar_password_obligatorio')
+        nueva = {'new_password1': 'Otra-Clave-2024', 'new_password2': 'Otra-Clave-2024'}
+
+        respuesta = self.client.post(url, {'old_password': 'mala', **nueva})
+        self.assertIn('old_password', respuesta.context['form'].errors)
+
+        respuesta = self.client.post(url, {'old_password': 'clave-buena', **nueva})
+        self.assertRedirects(respuesta, reverse('panel_inicio'), fetch_redirect_response=False)
+        self.vecino.refresh_from_db()
+        self.assertFalse(self.vecino.requiere_cambio_pass)
+        self.assertTrue(self.vecino.check_password('Otra-Clave-2024'))
+        # La sesión sigue valiendo con la contraseña nueva
+        self.assertEqual(self.client.get(reverse('panel_inicio')).status_code, 200)
+        self.assertEqual(self.cola.metricas()['atendidos'], 3)
+
+    def test_cambio_desde_el_perfil(self):
+        self.client.force_login(self.vecino)
+        sesion = self.client.session
+        sesion['codigo_seguridad'] = '123456'
+        sesion.save()
+
+        self.client.post(reverse('confirmar_cambios_perfil'), {'codigo': '123456', 'password': 'Nueva-2024'})
+
+        self.vecino.refresh_from_db()
+        self.assertTrue(self.vecino.check_password('Nueva-2024'))
+        self.assertNotIn('codigo_seguridad', self.client.session)
+        self.assertEqual(self.client.get(reverse('panel_inicio')).status_code, 200)
+
+
+class BajasVecinosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooperativa = Cooperativa.objects.create(nombre="Los Olivos")
+        cls.presidente = Usuario.objects.create_user('presi', password='x', cooperativa=cls.cooperativa,
+                                                     rol=Usuario.PRESIDENTE, requiere_cambio_pass=False)
+        cls.vecinos = [
+            Usuario.objects.create_user(f'vecino{i}', password='x', cooperativa=cls.cooperativa,
+                                        requiere_cambio_pass=False)
+            for i in range(4)
+        ]
+        cls.votaciones = []
+        for i in range(2):
+            votacion = Votacion.objects.create(titulo=f"Votación {i}", cooperativa=cls.cooperativa,
+                                               fecha_fin=timezone.now() + timedelta(days=1))
+            si = Opcion.objects.create(votacion=votacion, texto="Sí")
+            Opcion.objects.create(votacion=votacion, texto="No")
+            for vecino in cls.vecinos:
+                registrar_voto(vecino, votacion, si.id)
+            cls.votaciones.append(votacion)
+
+    def contadores(self):
+        return list(Opcion.objects.order_by('id').values_list('votos_cantidad', flat=True))
+
+    def test_baja_desactiva_y_se_hace_en_segundo_plano(self):
+        self.client.force_login(self.presidente)
+        vecino = self.vecinos[0]
+
+        with mock.patch.object(bajas.procesador, 'avisar') as avisar, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('eliminar_vecino', args=[vecino.id]))
+
+        # En la petición solo se desactiva la cuenta: los votos siguen ahí
+        avisar.assert_called_once()
+        vecino.refresh_from_db()
+        self.assertFalse(vecino.is_active)
+        self.assertEqual(Voto.objects.filter(usuario=vecino).count(), 2)
+
+        self.assertEqual(bajas.procesar_bajas(), 1)
+        self.assertFalse(Usuario.objects.filter(id=vecino.id).exists())
+        self.assertEqual(self.contadores(), [3, 0, 3, 0])
+        self.assertIsNotNone(BajaVecino.objects.get(username='vecino0').fecha_baja)
+
+    def test_baja_de_varios_un_aviso_por_votacion(self):
+        self.client.force_login(self.presidente)
+        versiones = dict(Votacion.objects.values_list('id', 'version'))
+
+        with mock.patch.object(bajas.procesador, 'avisar'):
+            self.client.post(reverse('eliminar_vecinos'), {'vecinos': [v.id for v in self.vecinos[:3]]})
+        self.assertEqual(BajaVecino.objects.count(), 3)
+
+        with mock.patch.object(difusor, 'notificar') as notificar, \
+                self.captureOnCommitCallbacks(execute=True), \
+                CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(bajas.procesar_bajas(), 3)
+
+        # Tres vecinos y seis votos: un UPDATE de contadores y un aviso por votación
+        self.assertEqual(self.contadores(), [1, 0, 1, 0])
+        self.assertEqual(sorted(llamada.args[0] for llamada in notificar.call_args_list),
+                         sorted(versiones))
+        actualizaciones = [c['sql'] for c in consultas.captured_queries
+                           if c['sql'].startswith('UPDATE') and 'votos_cantidad' in c['sql']]
+        self.assertEqual(len(actualizaciones), 1)
+        for id_votacion, version in Votacion.objects.values_list('id', 'version'):
+            self.assertEqual(version, versiones[id_votacion] + 1)
+
+        # Ya no hay nada que cuadrar
+        self.assertEqual(cuadrar_contadores(corregir=False)['descuadres'], [])
+
+    def test_baja_con_el_contador_descuadrado_a_la_baja(self):
+        # El "Sí" de la primera dice 1 cuando tiene 4 votos: restar 2 lo dejaría en -1
+        Opcion.objects.filter(id=self.votaciones[0].opciones.order_by('id').first().id).update(votos_cantidad=1)
+        self.client.force_login(self.presidente)
+        with mock.patch.object(bajas.procesador, 'avisar'):
+            self.client.post(reverse('eliminar_vecinos'), {'vecinos': [v.id for v in self.vecinos[:2]]})
+
+        self.assertEqual(bajas.procesar_bajas(), 2)
+
+        self.assertFalse(Usuario.objects.filter(id__in=[v.id for v in self.vecinos[:2]]).exists())
+        self.assertEqual(self.contadores(), [0, 0, 2, 0])
+        cuadrar_contadores()
+        self.assertEqual(self.contadores(), [2, 0, 2, 0])
+
+    def test_solo_el_presidente_da_de_baja(self):
+        self.client.force_login(self.vecinos[0])
+        self.client.get(reverse('eliminar_vecino', args=[self.vecinos[1].id]))
+        self.client.post(reverse('eliminar_vecinos'), {'vecinos': [self.vecinos[1].id]})
+
+        self.assertFalse(BajaVecino.objects.exists())
+        self.assertTrue(Usuario.objects.get(id=self.vecinos[1].id).is_active)
+
+    def test_no_toca_vecinos_de_otra_cooperativa(self):
+        otra = Cooperativa.objects.create(nombre="Otra")
+        ajeno = Usuario.objects.create_user('ajeno', password='x', cooperativa=otra)
+        self.client.force_login(self.presidente)
+
+        with mock.patch.object(bajas.procesador, 'avisar'):
+            self.client.post(reverse('eliminar_vecinos'), {'vecinos': [ajeno.id, self.vecinos[0].id]})
+
+        self.assertEqual(list(BajaVecino.objects.values_list('username', flat=True)), ['vecino0'])
+        self.assertTrue(Usuario.objects.get(id=ajeno.id).is_active)
@@ -1,37 +1,71 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth import authenticate, login, logout, update_session_auth_hash
-from django.utils import timezone
-from django.contrib.auth.forms import AuthenticationForm, PasswordChangeForm
+from django.contrib.auth import aauthenticate, alogin, logout, aupdate_session_auth_hash
 from django.contrib.auth.decorators import login_required
-from django.core.mail import send_mail
+from django.db import transaction
 from django.conf import settings
 from django.utils.crypto import get_random_string 
 from django.contrib import messages 
 
 # --- IMPORTACIONES CORREGIDAS ---
+import math
 import random 
 
 # 1. De la propia app (usuarios)
-from .forms import VecinoForm
-from .models import Usuario 
+from .forms import VecinoForm, CambioClaveForm
+from .cifrado import acomprobar_clave, acifrar_clave, CifradoSaturado
+from .limites import afrenar_login, aapuntar_fallo, ip_cliente
+from .models import Usuario, Cooperativa
+from .importacion import importar_vecinos as importar_fichero, FicheroNoValido
+from .correo import encolar, correo_bienvenida, correo_codigo_perfil
+from .bajas import pedir_bajas
 
 # 2. De la otra app (votaciones) <--- AQUÍ ESTABA EL FALLO
-from votaciones.models import Votacion, Voto 
+from votaciones.pendientes import aestado_usuario, contar_pendientes
+
+# 3. Del proyecto
+from core.asincrono import usuario_de
 # --------------------------------
 
 # --- LOGIN Y LOGOUT ---
 
-def login_view(request):
+async def login_view(request):
+    # Asíncrona: el cifrado de la contraseña va a la cola de cifrado (usuarios/cifrado.py)
+    # y el servidor sigue atendiendo a los demás mientras tanto
+    contexto = {}
     if request.method == 'POST':
-        form = AuthenticationForm(request, data=request.POST)
-        if form.is_valid():
-            user = form.get_user()
-            login(request, user)
+        username = request.POST.get('username', '')
+
+        # 1. Freno por IP y por usuario, antes de gastar un solo cifrado
+        espera = await afrenar_login(ip_cliente(request), username)
+        if espera:
+            return _reintentar_luego(
+                request, 'login.html', {'error': f"Demasiados intentos. Prueba de nuevo en {math.ceil(espera)} segundos."},
+                429, espera
+            )
+
+        # 2. Comprobamos la contraseña
+        try:
+            user = await aauthenticate(request, username=username, password=request.POST.get('password', ''))
+        except CifradoSaturado:
+            return _servidor_ocupado(request, 'login.html', {})
+
+        if user is not None:
+            await alogin(request, user)
             return redirect('panel_inicio')
-    else:
-        form = AuthenticationForm()
+        await aapuntar_fallo(ip_cliente(request))
+        contexto['error'] = "Usuario o contraseña incorrectos."
+
+    return render(request, 'login.html', contexto)
+
+def _reintentar_luego(request, plantilla, contexto, estado, espera):
+    respuesta = render(request, plantilla, contexto, status=estado)
+    respuesta['Retry-After'] = str(math.ceil(espera))
+    return respuesta
 
-    return render(request, 'login.html', {'form': form})
+def _servidor_ocupado(request, plantilla, contexto):
+    # La cola de cifrado está llena: mejor decirlo ya que hacer esperar a todos
+    contexto['error'] = "Hay mucha gente entrando a la vez. Prueba de nuevo en unos segundos."
+    return _reintentar_luego(request, plantilla, contexto, 503, 2)
 
 def logout_view(request):
     logout(request)
@@ -40,36 +74,27 @@ def logout_view(request):
 # --- PANEL PRINCIPAL Y CONTROL DE SEGURIDAD ---
 
 @login_required(login_url='login')
-def panel_inicio(request):
-    usuario = request.user
+async def panel_inicio(request):
+    # Vista asíncrona: es la primera página tras el login y la que más se recarga
+    usuario = await usuario_de(request)
     
     # 1. INTERCEPTOR DE SEGURIDAD
     if usuario.requiere_cambio_pass:
         return redirect('cambiar_password_obligatorio')
 
     # 2. CÁLCULO DE VOTACIONES PENDIENTES
+    # Sale de la caché del vecino; si no está, un solo NOT EXISTS (ver votaciones/pendientes.py)
     pendientes_count = 0
-    if usuario.cooperativa:
-        # CORRECCIÓN CRÍTICA: Usamos fecha_fin__gt (Mayor que ahora)
-        # porque 'activa' no es un campo de la base de datos y da error.
-        votaciones_activas = Votacion.objects.filter(
-            cooperativa=usuario.cooperativa, 
-            fecha_fin__gt=timezone.now()
-        )
-        
-        # Buscamos en cuáles YA ha votado este usuario
-        votos_usuario = Voto.objects.filter(
-            usuario=usuario,
-            votacion__in=votaciones_activas
-        ).values_list('votacion_id', flat=True)
-        
-        # Restamos: (Total Activas) - (Votadas) = Pendientes
-        pendientes_count = votaciones_activas.exclude(id__in=votos_usuario).count()
+    cooperativa = None
+    if usuario.cooperativa_id:
+        # La plantilla no puede ir a buscarla: la cargamos aquí
+        cooperativa = await Cooperativa.objects.aget(id=usuario.cooperativa_id)
+        pendientes_count = contar_pendientes(await aestado_usuario(usuario))
 
     # Preparamos los datos
     contexto = {
         'usuario': usuario,
-        'cooperativa': usuario.cooperativa,
+        'cooperativa': cooperativa,
         'pendientes': pendientes_count, 
     }
 
@@ -84,20 +109,30 @@ def panel_inicio(request):
         return render(request, 'dashboards/inicio_vecino.html', context=contexto)
 
 @login_required(login_url='login')
-def cambiar_password_obligatorio(request):
-    if not request.user.requiere_cambio_pass:
+async def cambiar_password_obligatorio(request):
+    # Asíncrona por lo mismo que el login: justo después de la asamblea la usan todos a la vez
+    usuario = await usuario_de(request)
+    if not usuario.requiere_cambio_pass:
         return redirect('panel_inicio')
 
     if request.method == 'POST':
-        form = PasswordChangeForm(request.user, request.POST)
+        form = CambioClaveForm(usuario, request.POST)
         if form.is_valid():
-            user = form.save()
-            user.requiere_cambio_pass = False
-            user.save()
-            update_session_auth_hash(request, user)
-            return redirect('panel_inicio')
+            try:
+                correcta, _ = await acomprobar_clave(form.cleaned_data['old_password'], usuario.password)
+                if correcta:
+                    usuario.password = await acifrar_clave(form.cleaned_data['new_password1'])
+            except CifradoSaturado:
+                return _servidor_ocupado(request, 'usuarios/cambiar_pass.html', {'form': form})
+
+            if correcta:
+                usuario.requiere_cambio_pass = False
+                await usuario.asave(update_fields=['password', 'requiere_cambio_pass'])
+                await aupdate_session_auth_hash(request, usuario)
+                return redirect('panel_inicio')
+            form.add_error('old_password', form.error_messages['password_incorrect'])
     else:
-        form = PasswordChangeForm(request.user)
+        form = CambioClaveForm(usuario)
     
     return render(request, 'usuarios/cambiar_pass.html', {'form': form})
 
@@ -137,14 +172,11 @@ def crear_vecino(request):
 
             password_provisional = get_random_string(length=8)
             vecino.set_password(password_provisional)
-            vecino.save()
 
-            asunto = 'Bienvenido a tu Comunidad'
-            mensaje = f"Usuario: {vecino.username}\nContraseña: {password_provisional}"
-            try:
-                send_mail(asunto, mensaje, settings.EMAIL_HOST_USER, [vecino.email])
-            except Exception as e:
-                print(f"Error enviando mail: {e}")
+            # El vecino y su correo de bienvenida, juntos o ninguno (lo manda luego el repartidor)
+            with transaction.atomic():
+                vecino.save()
+                encolar([correo_bienvenida(vecino, password_provisional)])
 
             return redirect('listar_vecinos')
     else:
@@ -153,6 +185,28 @@ def crear_vecino(request):
     return render(request, 'usuarios/form_vecino.html', {'form': form})
 
 
+@login_required(login_url='login')
+def importar_vecinos(request):
+    # Alta de muchos vecinos de golpe desde un CSV o XLSX (ver usuarios/importacion.py)
+    if request.user.rol != Usuario.PRESIDENTE:
+        return redirect('panel_inicio')
+
+    contexto = {'cooperativa': request.user.cooperativa}
+    if request.method == 'POST':
+        fichero = request.FILES.get('fichero')
+        if not fichero:
+            contexto['error'] = "Elige un fichero .csv o .xlsx."
+        else:
+            try:
+                contexto['resumen'] = importar_fichero(fichero, fichero.name, request.user.cooperativa)
+            except FicheroNoValido as e:
+                # Si se rompe a mitad, lo de antes ya está dado de alta: se enseña también
+                contexto['error'] = str(e)
+                contexto['resumen'] = getattr(e, 'resumen', None)
+
+    return render(request, 'usuarios/importar_vecinos.html', contexto)
+
+
 @login_required(login_url='login')
 def editar_vecino(request, id_vecino):
     # 1. Seguridad: Solo presidentes
@@ -175,8 +229,25 @@ def editar_vecino(request, id_vecino):
 
 @login_required(login_url='login')
 def eliminar_vecino(request, id_vecino):
-    vecino = get_object_or_404(Usuario, id=id_vecino, cooperativa=request.user.cooperativa)
-    vecino.delete()
+    if request.user.rol != Usuario.PRESIDENTE:
+        return redirect('panel_inicio')
+
+    vecino = get_object_or_404(Usuario, id=id_vecino, cooperativa=request.user.cooperativa, rol=Usuario.VECINO)
+    # La cuenta se desactiva ya; sus votos y la cuenta se borran en segundo plano (usuarios/bajas.py)
+    pedir_bajas([vecino], request.user)
+    return redirect('listar_vecinos')
+
+
+@login_required(login_url='login')
+def eliminar_vecinos(request):
+    # Baja de todos los vecinos marcados en la lista, en una sola petición
+    if request.user.rol != Usuario.PRESIDENTE:
+        return redirect('panel_inicio')
+
+    if request.method == 'POST':
+        ids = [id_vecino for id_vecino in request.POST.getlist('vecinos') if id_vecino.isdigit()]
+        vecinos = Usuario.objects.filter(id__in=ids, cooperativa=request.user.cooperativa, rol=Usuario.VECINO)
+        pedir_bajas(list(vecinos), request.user)
     return redirect('listar_vecinos')
 
 
@@ -194,21 +265,14 @@ def solicitar_codigo_perfil(request):
     codigo = str(random.randint(100000, 999999))
     request.session['codigo_seguridad'] = codigo
     
-    # 2. Enviamos email
-    asunto = 'Código de Seguridad - Editar Perfil'
-    mensaje = f"Hola {usuario.username},\n\nTu código es: {codigo}"
-    
-    try:
-        send_mail(asunto, mensaje, settings.EMAIL_HOST_USER, [usuario.email])
-        print(f"--- CÓDIGO GENERADO: {codigo} ---") 
-    except Exception as e:
-        print(f"Error enviando mail: {e}")
+    # 2. Dejamos el email en la bandeja de salida (la respuesta no espera al SMTP)
+    encolar([correo_codigo_perfil(usuario, codigo)])
 
     return redirect('confirmar_cambios_perfil')
 
 @login_required(login_url='login')
-def confirmar_cambios_perfil(request):
-    usuario = request.user
+async def confirmar_cambios_perfil(request):
+    usuario = await usuario_de(request)
 
     if request.method == 'POST':
         codigo_ingresado = request.POST.get('codigo')
@@ -216,7 +280,7 @@ def confirmar_cambios_perfil(request):
         nuevo_email = request.POST.get('email')
         nueva_pass = request.POST.get('password')
         
-        codigo_real = request.session.get('codigo_seguridad')
+        codigo_real = await request.session.aget('codigo_seguridad')
         
         if not codigo_real or codigo_ingresado != codigo_real:
             return render(request, 'usuarios/editar_perfil_seguro.html', {
@@ -233,15 +297,23 @@ def confirmar_cambios_perfil(request):
             usuario.email = nuevo_email
             cambios_realizados.append("Email")
         if nueva_pass:
-            usuario.set_password(nueva_pass)
+            # El cifrado, en la cola de cifrado (ver login_view)
+            try:
+                usuario.password = await acifrar_clave(nueva_pass)
+            except CifradoSaturado:
+                return _servidor_ocupado(request, 'usuarios/editar_perfil_seguro.html', {'usuario': usuario})
             cambios_realizados.append("Contraseña")
 
-        usuario.save()
+        await usuario.asave()
         
         if nueva_pass:
-            update_session_auth_hash(request, usuario)
+            await aupdate_session_auth_hash(request, usuario)
+
+        await request.session.apop('codigo_seguridad')
 
-        del request.session['codigo_seguridad']
+        # El perfil enseña la cooperativa y la plantilla no puede ir a buscarla: la cargamos aquí
+        if usuario.cooperativa_id:
+            usuario.cooperativa = await Cooperativa.objects.aget(id=usuario.cooperativa_id)
         
         return render(request, 'usuarios/perfil.html', {
             'usuario': usuario,
@@ -0,0 +1,115 @@
+# votaciones/actas.py
+import csv
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import Voto
+from .resultados import aobtener_resumen
+
+# Votos por consulta. Se pagina por id ("los siguientes a este") en lugar de un solo
+# iterator(): con MySQL el driver se trae el resultado entero a memoria aunque Django
+# lo entregue a trozos. Así cada trozo es una consulta y la memoria no crece con el acta.
+TAM_TROZO = 2000
+
+COLUMNAS = ['votacion_id', 'votacion', 'opcion', 'fecha_voto']
+COLUMNAS_VOTANTE = ['usuario', 'votante', 'vivienda']
+
+
+# --- FILAS ---
+
+async def votos_por_trozos(votacion, con_votante, tam=None):
+    """
+    Va dando los votos de la votación en listas de como mucho `tam` filas.
+    Sin permiso para ver quién vota qué no se lee ni el votante ni su vivienda.
+    """
+    tam = tam or TAM_TROZO
+    campos = ['id', 'opcion_elegida__texto', 'fecha_voto']
+    if con_votante:
+        campos += ['usuario__username', 'usuario__first_name', 'usuario__last_name', 'usuario__numero_vivienda']
+    consulta = Voto.objects.filter(votacion_id=votacion.id).order_by('id').values_list(*campos)
+
+    ultimo = 0
+    while True:
+        # Un salto a hilo por trozo (aiterator() con values_list consulta fuera de él)
+        trozo = await sync_to_async(list)(consulta.filter(id__gt=ultimo)[:tam].iterator(chunk_size=tam))
+        if not trozo:
+            return
+        ultimo = trozo[-1][0]
+        yield [_fila(votacion, datos, con_votante) for datos in trozo]
+        if len(trozo) < tam:
+            return
+
+def _fila(votacion, datos, con_votante):
+    fila = {
+        'votacion_id': votacion.id,
+        'votacion': votacion.titulo,
+        'opcion': datos[1],
+        'fecha_voto': timezone.localtime(datos[2]).isoformat(),
+    }
+    if con_votante:
+        username, nombre, apellidos, vivienda = datos[3:]
+        fila.update({
+            'usuario': username,
+            'votante': f"{nombre} {apellidos}".strip(),
+            'vivienda': vivienda or '',
+        })
+    return fila
+
+
+# --- FORMATOS ---
+# Generadores asíncronos: con uno síncrono, Django bajo ASGI se lo lee entero antes de
+# mandar nada. Cada trozo del acta sale en cuanto se ha leído su consulta.
+
+# Lo que Excel toma por el principio de una fórmula. Usuario, nombre o textos de opción
+# los escriben los propios vecinos: con un "'" delante Excel los enseña como texto
+INICIO_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+def _sin_formulas(fila):
+    return {
+        columna: "'" + valor if isinstance(valor, str) and valor.startswith(INICIO_FORMULA) else valor
+        for columna, valor in fila.items()
+    }
+
+class _Eco:
+    # Lo que csv.writer "escribe" se devuelve tal cual para poder ir soltándolo
+    def write(self, valor):
+        return valor
+
+async def acta_csv(votaciones, con_votante, tam=None):
+    columnas = COLUMNAS + (COLUMNAS_VOTANTE if con_votante else [])
+    # BOM y ";": así lo abre bien Excel en español (y es lo que entiende la importación de vecinos)
+    escritor = csv.DictWriter(_Eco(), fieldnames=columnas, delimiter=';')
+    yield '\ufeff' + escritor.writeheader()
+    async for votacion in votaciones:
+        async for trozo in votos_por_trozos(votacion, con_votante, tam):
+            yield ''.join(escritor.writerow(_sin_formulas(fila)) for fila in trozo)
+
+async def acta_ndjson(votaciones, con_votante, tam=None):
+    # Una línea con los resultados de cada votación y luego una por voto
+    async for votacion in votaciones:
+        resumen = await aobtener_resumen(votacion)
+        yield _linea({
+            'tipo': 'votacion',
+            'votacion_id': votacion.id,
+            'votacion': votacion.titulo,
+            'fecha_fin': votacion.fecha_fin,
+            'activa': resumen['activa'],
+            'total_votos': resumen['total_votos'],
+            'total_censo': resumen['total_censo'],
+            'abstencion': resumen['abstencion'],
+            'resultados': dict(zip(resumen['nombres_opciones'], resumen['votos_opciones'])),
+        })
+        async for trozo in votos_por_trozos(votacion, con_votante, tam):
+            yield ''.join(_linea({'tipo': 'voto', **fila}) for fila in trozo)
+
+def _linea(datos):
+    return json.dumps(datos, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+FORMATOS = {
+    'csv': (acta_csv, 'text/csv; charset=utf-8'),
+    'ndjson': (acta_ndjson, 'application/x-ndjson; charset=utf-8'),
+}
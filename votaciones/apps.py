@@ -1,9 +1,22 @@
-# votaciones/apps.py
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 
 class VotacionesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'votaciones'
 
     def ready(self):
-        import votaciones.signals  # <--- IMPORTANTE
\ No newline at end of file
+        import votaciones.signals  # <--- IMPORTANTE
+        comprobar_cache_compartida()
+
+def comprobar_cache_compartida():
+    # Con una capa de canales entre procesos hay varios procesos sirviendo: una caché en
+    # memoria de cada uno enseñaría a los demás lo votado y pendiente de antes (ver settings.py)
+    capa = settings.CHANNEL_LAYERS.get('default', {}).get('BACKEND')
+    cache = settings.CACHES.get('default', {}).get('BACKEND')
+    if capa != 'channels.layers.InMemoryChannelLayer' and cache == 'django.core.cache.backends.locmem.LocMemCache':
+        raise ImproperlyConfigured(
+            "Con varios procesos (CHANNEL_LAYERS = %s) la caché tiene que ser compartida entre "
+            "ellos: LocMemCache no vale. Ver CACHES en core/settings.py." % capa
+        )
@@ -0,0 +1,52 @@
+# votaciones/censo.py
+import sys
+from array import array
+from bisect import bisect_left
+
+
+class Censo:
+    """
+    Ids de los vecinos con derecho a voto, ordenados y sin repetir.
+
+    Se guarda en la votación como enteros de 4 bytes (little-endian) pegados:
+    1.000 viviendas son 4 KB. Participación y abstención salen de aquí con
+    operaciones de conjuntos en memoria, sin volver a consultar el censo.
+    """
+
+    def __init__(self, ids=()):
+        self.ids = array('I', sorted(set(ids)))
+
+    @classmethod
+    def desde_bytes(cls, datos):
+        censo = cls()
+        censo.ids.frombytes(bytes(datos))
+        if sys.byteorder == 'big':
+            censo.ids.byteswap()
+        return censo
+
+    def a_bytes(self):
+        ids = array('I', self.ids)
+        if sys.byteorder == 'big':
+            ids.byteswap()
+        return ids.tobytes()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __contains__(self, usuario_id):
+        posicion = bisect_left(self.ids, usuario_id)
+        return posicion < len(self.ids) and self.ids[posicion] == usuario_id
+
+    def repartir(self, ids_votaron):
+        # Devuelve (participación, abstención) en el orden del censo
+        votaron = set(ids_votaron)
+        participacion, abstencion = [], []
+        for usuario_id in self.ids:
+            (participacion if usuario_id in votaron else abstencion).append(usuario_id)
+        return participacion, abstencion
+
+
+assert array('I').itemsize == 4, "El censo necesita enteros de 4 bytes"
@@ -0,0 +1,113 @@
+# votaciones/cierre.py
+import asyncio
+import logging
+from datetime import timedelta
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Votacion
+from .novedades import aavisar_cooperativa, CERRADA
+from .resultados import grupo_votacion, finalizar_votacion, MARGEN_CIERRE
+
+logger = logging.getLogger(__name__)
+
+
+# --- PROGRAMADOR DE CIERRES ---
+
+class ProgramadorCierres:
+    """
+    Temporizadores de asyncio, uno por votación abierta, que saltan en su fecha_fin.
+
+    Al saltar escriben el ResultadoFinal y mandan un aviso "cerrada" con los números
+    definitivos a todos los conectados, en lugar de que cada navegador recargue la
+    página a la misma hora. Cada RECARGA segundos se vuelve a mirar la BD para
+    recoger votaciones nuevas o fechas cambiadas por el presidente o el admin.
+    """
+
+    def __init__(self, recarga=30, margen=MARGEN_CIERRE):
+        self.recarga = recarga
+        self.margen = margen
+        self._temporizadores = {}   # id_votacion -> (fecha_fin, handle)
+        # asyncio solo guarda referencias débiles a las tareas: sin esto un cierre
+        # a medias podría desaparecer con el recolector de basura
+        self._cierres = set()
+        self._tarea = None
+
+    def asegurar_en_marcha(self):
+        # Para arrancarlo dentro del propio proceso ASGI (una sola vez por proceso)
+        if self._tarea is None or self._tarea.done():
+            self._tarea = asyncio.get_running_loop().create_task(self.ejecutar())
+
+    async def ejecutar(self):
+        while True:
+            try:
+                await self.programar()
+            except Exception:
+                logger.exception("No se pudieron programar los cierres")
+            await asyncio.sleep(self.recarga)
+
+    async def programar(self):
+        loop = asyncio.get_running_loop()
+        proximas = dict(await self._proximas_a_cerrar())
+
+        # Cancelamos los que ya no tocan (borradas, ampliadas o ya cerradas)
+        for id_votacion, (fecha_fin, handle) in list(self._temporizadores.items()):
+            if proximas.get(id_votacion) != fecha_fin:
+                handle.cancel()
+                del self._temporizadores[id_votacion]
+
+        ahora = timezone.now()
+        for id_votacion, fecha_fin in proximas.items():
+            if id_votacion in self._temporizadores:
+                continue
+            espera = max((fecha_fin - ahora).total_seconds(), 0) + self.margen
+            handle = loop.call_later(espera, self._lanzar_cierre, id_votacion)
+            self._temporizadores[id_votacion] = (fecha_fin, handle)
+
+    def _lanzar_cierre(self, id_votacion):
+        tarea = asyncio.get_running_loop().create_task(self.cerrar(id_votacion))
+        self._cierres.add(tarea)
+        tarea.add_done_callback(self._cierres.discard)
+
+    async def cerrar(self, id_votacion):
+        self._temporizadores.pop(id_votacion, None)
+        resultado = await database_sync_to_async(finalizar_votacion)(id_votacion)
+        if resultado is None:
+            return
+
+        await get_channel_layer().group_send(
+            grupo_votacion(id_votacion),
+            {
+                'type': 'evento_cierre',
+                'datos': {**resultado.resumen, 'activa': False},
+            }
+        )
+        # Y a los paneles y listas de la cooperativa, que no están suscritos a esta votación
+        cooperativa_id = await self._cooperativa_de(id_votacion)
+        if cooperativa_id is not None:
+            await aavisar_cooperativa(cooperativa_id, CERRADA, {'id_votacion': id_votacion, 'activa': False})
+        logger.info("Votación %s cerrada", id_votacion)
+
+    @database_sync_to_async
+    def _cooperativa_de(self, id_votacion):
+        return Votacion.objects.filter(id=id_votacion).values_list('cooperativa_id', flat=True).first()
+
+    @database_sync_to_async
+    def _proximas_a_cerrar(self):
+        # Las que vencen antes de la siguiente recarga (y las vencidas sin cerrar)
+        limite = timezone.now() + timedelta(seconds=self.recarga * 2)
+        return list(
+            Votacion.objects.filter(resultado_final__isnull=True, fecha_fin__lte=limite)
+            .values_list('id', 'fecha_fin')
+        )
+
+
+programador = ProgramadorCierres()
+
+def arrancar_en_proceso():
+    # Con un solo proceso daphne basta con esto; con varios, mejor el comando programar_cierres
+    if getattr(settings, 'VOTACIONES_CIERRES_EN_PROCESO', False):
+        programador.asegurar_en_marcha()
@@ -0,0 +1,123 @@
+# votaciones/conexiones.py
+import asyncio
+import json
+from collections import Counter
+
+from django.conf import settings
+
+# Valores por defecto; se pueden cambiar con VOTACIONES_SOCKETS en settings.py
+CONFIG_POR_DEFECTO = {
+    'MAX_POR_USUARIO': 10,    # Sockets abiertos a la vez por un mismo vecino (pestañas)
+    'MAX_POR_GRUPO': 2000,    # Sockets por votación (o por cooperativa en ws/votaciones/)
+    'LATIDO': 25,             # Segundos entre un "ping" y el siguiente
+    'INACTIVIDAD': 75,        # Segundos sin saber nada del navegador antes de echarlo
+}
+
+def config_sockets():
+    return {**CONFIG_POR_DEFECTO, **getattr(settings, 'VOTACIONES_SOCKETS', {})}
+
+# Código de cierre para los que no contestan a los "ping"
+CIERRE_INACTIVO = 4408
+
+
+# --- AFORO ---
+
+class Aforo:
+    """
+    Sockets abiertos en este proceso, por usuario y por grupo.
+
+    Todos los consumers de un proceso corren en el mismo bucle de asyncio, así que
+    no hace falta cerrojo. Con varios procesos daphne cada uno lleva su cuenta
+    (y los límites son por proceso).
+    """
+
+    def __init__(self, config=config_sockets):
+        self.config = config
+        self.por_usuario = Counter()
+        self.por_grupo = Counter()
+        self.rechazadas = Counter()
+        self.expulsadas = 0
+
+    def hay_sitio(self, usuario_id, grupo):
+        # Solo mira (y apunta el rechazo si no cabe): no ocupa nada
+        config = self.config()
+        if self.por_usuario[usuario_id] >= config['MAX_POR_USUARIO']:
+            self.rechazadas['usuario'] += 1
+            return False
+        if self.por_grupo[grupo] >= config['MAX_POR_GRUPO']:
+            self.rechazadas['grupo'] += 1
+            return False
+        return True
+
+    def entrar(self, usuario_id, grupo):
+        # Devuelve True si hay sitio (y lo ocupa)
+        if not self.hay_sitio(usuario_id, grupo):
+            return False
+        self.por_usuario[usuario_id] += 1
+        self.por_grupo[grupo] += 1
+        return True
+
+    def salir(self, usuario_id, grupo):
+        for contador, clave in ((self.por_usuario, usuario_id), (self.por_grupo, grupo)):
+            contador[clave] -= 1
+            if contador[clave] <= 0:
+                del contador[clave]
+
+    def metricas(self):
+        return {
+            'conexiones': sum(self.por_grupo.values()),
+            'usuarios': len(self.por_usuario),
+            'por_grupo': dict(self.por_grupo),
+            'rechazadas': dict(self.rechazadas),
+            'expulsadas_por_inactividad': self.expulsadas,
+        }
+
+
+aforo = Aforo()
+
+
+# --- LATIDO ---
+
+class SocketVigilado:
+    """
+    Para los consumers: ocupa plaza en el aforo y manda un {"tipo": "ping"} cada
+    LATIDO segundos. El navegador contesta con cualquier mensaje (el JS manda
+    {"accion": "pong"}); si en INACTIVIDAD segundos no ha dicho nada, se le saca
+    de sus grupos y se cierra el socket. Así los sockets muertos (móvil sin
+    cobertura, pestaña congelada) no se quedan recibiendo cada difusión.
+    """
+    plaza = None
+    latido = None
+
+    def ocupar_plaza(self, usuario_id, grupo):
+        if not aforo.entrar(usuario_id, grupo):
+            return False
+        self.plaza = (usuario_id, grupo)
+        self.senal_de_vida()
+        self.latido = asyncio.get_running_loop().create_task(self._latir())
+        return True
+
+    def liberar_plaza(self):
+        # Puede llamarse dos veces (al echarlo y luego en disconnect)
+        if self.plaza is not None:
+            aforo.salir(*self.plaza)
+            self.plaza = None
+        if self.latido is not None and self.latido is not asyncio.current_task():
+            self.latido.cancel()
+        self.latido = None
+
+    def senal_de_vida(self):
+        self.ultima_senal = asyncio.get_running_loop().time()
+
+    async def _latir(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            config = aforo.config()
+            await asyncio.sleep(config['LATIDO'])
+            if loop.time() - self.ultima_senal > config['INACTIVIDAD']:
+                aforo.expulsadas += 1
+                # Fuera de los grupos ya, sin esperar a que el servidor note la desconexión
+                await self.disconnect(CIERRE_INACTIVO)
+                await self.close(code=CIERRE_INACTIVO)
+                return
+            await self.send(text_data=json.dumps({'tipo': 'ping'}))
@@ -1,29 +1,220 @@
 # votaciones/consumers.py
 import json
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 
-class VotacionConsumer(AsyncWebsocketConsumer):
+from .cierre import arrancar_en_proceso
+from .conexiones import SocketVigilado
+from .models import Votacion
+from .novedades import ABIERTA
+from .pendientes import aestado_usuario, contar_pendientes
+from .resultados import (
+    grupo_votacion, grupo_detalle, grupo_cooperativa, grupo_usuario, formatear_detalle,
+    puede_ver_detalle, obtener_directorio, compactar_detalle, aobtener_resumen
+)
+
+# Votaciones que puede seguir a la vez un mismo socket de ws/votaciones/
+MAX_SUSCRIPCIONES = 200
+
+class VotacionConsumer(SocketVigilado, AsyncWebsocketConsumer):
     async def connect(self):
+        arrancar_en_proceso()
         self.id_votacion = self.scope['url_route']['kwargs']['id_votacion']
-        self.room_group_name = f'votacion_{self.id_votacion}'
+        self.room_group_name = grupo_votacion(self.id_votacion)
+        # ws/votacion/<id>/?formato=compacto: el detalle llega solo con ids
+        consulta = parse_qs(self.scope.get('query_string', b'').decode())
+        self.compacto = consulta.get('formato') == ['compacto']
+
+        # 1. Solo vecinos con sesión y de la cooperativa de la votación (antes de entrar en ningún grupo)
+        usuario = self.scope.get('user')
+        votacion = await self.votacion_de_su_cooperativa(usuario)
+        if votacion is None:
+            await self.close()
+            return
+
+        # 2. Aforo: sockets por vecino y por votación (ver votaciones/conexiones.py)
+        if not self.ocupar_plaza(usuario.id, self.room_group_name):
+            await self.close()
+            return
 
-        # Unirse al grupo de esta votación
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
+        # 3. El grupo con nombres solo para el presidente que tenga permiso
+        self.grupos = [self.room_group_name]
+        if puede_ver_detalle(usuario, votacion):
+            self.grupos.append(grupo_detalle(self.id_votacion))
+
+        # Unirse a los grupos de esta votación
+        for grupo in self.grupos:
+            await self.channel_layer.group_add(grupo, self.channel_name)
         await self.accept()
 
     async def disconnect(self, close_code):
-        # Salir del grupo
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+        # Salir de los grupos
+        self.liberar_plaza()
+        for grupo in getattr(self, 'grupos', []):
+            await self.channel_layer.group_discard(grupo, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # El navegador solo manda el "pong" del latido
+        self.senal_de_vida()
 
-    # Este método recibe el aviso del servidor y se lo pasa al navegador
+    @database_sync_to_async
+    def votacion_de_su_cooperativa(self, usuario):
+        if not usuario or not usuario.is_authenticated or not usuario.cooperativa_id:
+            return None
+        return Votacion.objects.select_related('cooperativa').filter(
+            id=self.id_votacion, cooperativa_id=usuario.cooperativa_id
+        ).first()
+
+    # Este método recibe los resultados nuevos y se los pasa tal cual al navegador
     async def evento_actualizacion(self, event):
         await self.send(text_data=json.dumps({
-            'tipo': 'actualizar',
-            'mensaje': 'Nuevos datos disponibles'
-        }))
\ No newline at end of file
+            'tipo': 'resultados',
+            **event['datos']
+        }))
+
+    # La votación ha llegado a su fecha_fin: van los números definitivos
+    async def evento_cierre(self, event):
+        await self.send(text_data=json.dumps({
+            'tipo': 'cerrada',
+            **event['datos']
+        }))
+
+    # Igual, pero con los nombres (el "(MI VOTO)" depende de quién está mirando)
+    async def evento_detalle(self, event):
+        if self.compacto:
+            directorio = await database_sync_to_async(obtener_directorio)(self.scope['user'].cooperativa_id)
+            datos = compactar_detalle(event['datos'], directorio)
+        else:
+            datos = formatear_detalle(event['datos'], self.scope['user'].id)
+        await self.send(text_data=json.dumps({'tipo': 'detalle', **datos}))
+
+
+class VotacionesConsumer(SocketVigilado, AsyncWebsocketConsumer):
+    """
+    Un solo socket por vecino (ws/votaciones/) para seguir todas las votaciones de
+    su cooperativa que quiera: la lista de votaciones usa este en vez de uno por tarjeta.
+
+    El navegador manda {"accion": "suscribir" | "cancelar", "votaciones": [ids]} y
+    recibe los mismos "resultados" y "cerrada" que ws/votacion/<id>/ (cada uno lleva
+    su id_votacion). Solo resultados públicos: el detalle sigue en su propio socket.
+
+    Sin suscribirse a nada recibe además las novedades de la cooperativa (ver
+    votaciones/novedades.py) y {"tipo": "pendientes", "pendientes": N} cuando cambia
+    el número de votaciones que le quedan por votar. Así se actualiza el panel.
+    """
+
+    async def connect(self):
+        arrancar_en_proceso()
+        usuario = self.scope.get('user')
+        if not usuario or not usuario.is_authenticated or not usuario.cooperativa_id:
+            await self.close()
+            return
+        self.cooperativa_id = usuario.cooperativa_id
+        if not self.ocupar_plaza(usuario.id, grupo_cooperativa(self.cooperativa_id)):
+            await self.close()
+            return
+        self.suscritas = set()
+        self.pendientes = None
+        # La pertenencia se mira una vez aquí: las de otra cooperativa nunca entran
+        self.permitidas = await self.votaciones_de_la_cooperativa()
+        self.grupos = [grupo_cooperativa(self.cooperativa_id), grupo_usuario(usuario.id)]
+        for grupo in self.grupos:
+            await self.channel_layer.group_add(grupo, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        self.liberar_plaza()
+        for id_votacion in getattr(self, 'suscritas', ()):
+            await self.channel_layer.group_discard(grupo_votacion(id_votacion), self.channel_name)
+        for grupo in getattr(self, 'grupos', []):
+            await self.channel_layer.group_discard(grupo, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        self.senal_de_vida()
+        try:
+            mensaje = json.loads(text_data or '')
+            accion = mensaje['accion']
+            if accion == 'pong':
+                return
+            ids = {int(id_votacion) for id_votacion in mensaje['votaciones']}
+        except (ValueError, KeyError, TypeError):
+            await self.enviar({'tipo': 'error', 'error': "Mensaje no válido."})
+            return
+
+        if accion == 'suscribir':
+            await self.suscribir(ids)
+        elif accion == 'cancelar':
+            await self.cancelar(ids)
+        else:
+            await self.enviar({'tipo': 'error', 'error': f"Acción desconocida: {accion}"})
+
+    async def suscribir(self, ids):
+        nuevas = ids - self.suscritas
+        if nuevas - self.permitidas:
+            # Puede que se haya creado alguna después de conectar
+            self.permitidas = await self.votaciones_de_la_cooperativa()
+        aceptadas = sorted(nuevas & self.permitidas)[:MAX_SUSCRIPCIONES - len(self.suscritas)]
+
+        for id_votacion in aceptadas:
+            await self.channel_layer.group_add(grupo_votacion(id_votacion), self.channel_name)
+        self.suscritas.update(aceptadas)
+        await self.enviar({
+            'tipo': 'suscrito',
+            'votaciones': aceptadas,
+            'rechazadas': sorted(nuevas.difference(aceptadas)),
+        })
+
+        # Cómo están ahora (de la caché): a partir de aquí, solo los cambios
+        async for votacion in Votacion.objects.select_related('resultado_final').filter(id__in=aceptadas):
+            resumen = await aobtener_resumen(votacion)
+            if votacion.activa:
+                await self.enviar({'tipo': 'resultados', **resumen})
+            else:
+                await self.enviar({'tipo': 'cerrada', **resumen, 'activa': False})
+
+    async def cancelar(self, ids):
+        quitadas = sorted(ids & self.suscritas)
+        for id_votacion in quitadas:
+            await self.channel_layer.group_discard(grupo_votacion(id_votacion), self.channel_name)
+        self.suscritas.difference_update(quitadas)
+        await self.enviar({'tipo': 'cancelado', 'votaciones': quitadas})
+
+    async def votaciones_de_la_cooperativa(self):
+        return {
+            id_votacion async for id_votacion in
+            Votacion.objects.filter(cooperativa_id=self.cooperativa_id).values_list('id', flat=True)
+        }
+
+    async def enviar(self, datos):
+        await self.send(text_data=json.dumps(datos))
+
+    # Los mismos eventos que manda el difusor a ws/votacion/<id>/
+    async def evento_actualizacion(self, event):
+        # Un aviso que ya venía en camino cuando se canceló la suscripción
+        if event['datos'].get('id_votacion') in self.suscritas:
+            await self.enviar({'tipo': 'resultados', **event['datos']})
+
+    async def evento_cierre(self, event):
+        if event['datos'].get('id_votacion') in self.suscritas:
+            await self.enviar({'tipo': 'cerrada', **event['datos']})
+
+    # Novedades de la cooperativa (votaciones/novedades.py): pasan tal cual
+    async def evento_novedad(self, event):
+        datos = event['datos']
+        if datos['tipo'] == ABIERTA:
+            self.permitidas.add(datos['id_votacion'])
+        await self.enviar(datos)
+        await self.enviar_pendientes()
+
+    # Este vecino ha votado (quizá desde otra pestaña)
+    async def evento_pendientes(self, event):
+        await self.enviar_pendientes()
+
+    async def enviar_pendientes(self):
+        # De su entrada en caché, la misma del panel: solo se manda si ha cambiado
+        pendientes = contar_pendientes(await aestado_usuario(self.scope['user']))
+        if pendientes != self.pendientes:
+            self.pendientes = pendientes
+            await self.enviar({'tipo': 'pendientes', 'pendientes': pendientes})
@@ -0,0 +1,152 @@
+# votaciones/contadores.py
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Value, When
+
+from .difusion import difusor
+from .models import Votacion, Opcion, Voto
+
+logger = logging.getLogger(__name__)
+
+TAM_LOTE = 200
+
+# Mientras está a True, avisar_voto_borrado (signals.py) no hace nada por cada voto:
+# quien borra en bloque sube las versiones y avisa él, una vez por votación
+_borrando_en_bloque = ContextVar('borrando_en_bloque', default=False)
+
+@contextmanager
+def borrado_en_bloque():
+    marca = _borrando_en_bloque.set(True)
+    try:
+        yield
+    finally:
+        _borrando_en_bloque.reset(marca)
+
+def borrando_en_bloque():
+    return _borrando_en_bloque.get()
+
+
+# --- CUADRE DE Opcion.votos_cantidad ---
+# El contador se suma con un UPDATE en registrar_voto (y se resta en descontar_votos),
+# pero puede descuadrarse (votos borrados a mano en el admin, fallos a medias...).
+# Esto lo compara con los Voto reales, lote a lote, y lo corrige. Así la lectura de
+# resultados se fía del contador y nunca tiene que hacer COUNT(*).
+
+def votaciones_a_revisar(todas=False):
+    # Las cerradas con resultado final ya no se leen del contador: se dejan como están
+    votaciones = Votacion.objects.all()
+    if not todas:
+        votaciones = votaciones.filter(resultado_final__isnull=True)
+    return votaciones.order_by('id')
+
+def cuadrar_lote(ids_votaciones, corregir=True):
+    """
+    Cuadra los contadores de un lote de votaciones con una sola consulta agrupada
+    de votos. Devuelve los descuadres [(id_votacion, id_opcion, contador, real)].
+
+    Las opciones del lote se bloquean mientras tanto: un voto que llegue a la vez
+    espera a que acabemos (registrar_voto empieza por el UPDATE del contador), así
+    que no se pisa ninguna suma.
+    """
+    with transaction.atomic():
+        contadores = list(
+            Opcion.objects.select_for_update()
+            .filter(votacion_id__in=ids_votaciones)
+            .values_list('id', 'votacion_id', 'votos_cantidad')
+        )
+        reales = dict(
+            Voto.objects.filter(votacion_id__in=ids_votaciones)
+            .values('opcion_elegida_id')
+            .annotate(votos=Count('id'))
+            .values_list('opcion_elegida_id', 'votos')
+        )
+        descuadres = [
+            (id_votacion, id_opcion, contador, reales.get(id_opcion, 0))
+            for id_opcion, id_votacion, contador in contadores
+            if contador != reales.get(id_opcion, 0)
+        ]
+        if not (corregir and descuadres):
+            return descuadres
+
+        for id_votacion, id_opcion, contador, real in descuadres:
+            Opcion.objects.filter(id=id_opcion).update(votos_cantidad=real)
+
+        # Nueva versión: fuera los resultados cacheados y aviso a los conectados
+        afectadas = {id_votacion for id_votacion, _, _, _ in descuadres}
+        Votacion.objects.filter(id__in=afectadas).update(version=F('version') + 1)
+
+        def avisar():
+            for id_votacion in afectadas:
+                difusor.notificar(id_votacion)
+        transaction.on_commit(avisar)
+    return descuadres
+
+def cuadrar_contadores(votaciones=None, corregir=True, tam_lote=TAM_LOTE):
+    """
+    Recorre las votaciones de tam_lote en tam_lote (por id, sin cargarlas todas)
+    y cuadra cada lote. Devuelve un informe con lo revisado y lo descuadrado.
+    """
+    if votaciones is None:
+        votaciones = votaciones_a_revisar()
+    informe = {'votaciones': 0, 'lotes': 0, 'descuadres': [], 'corregidos': corregir}
+
+    ultimo = 0
+    while True:
+        ids = list(votaciones.filter(id__gt=ultimo).order_by('id').values_list('id', flat=True)[:tam_lote])
+        if not ids:
+            break
+        descuadres = cuadrar_lote(ids, corregir)
+        for id_votacion, id_opcion, contador, real in descuadres:
+            logger.warning("Opción %s de la votación %s: el contador decía %s y hay %s votos%s",
+                           id_opcion, id_votacion, contador, real, " (corregido)" if corregir else "")
+        informe['votaciones'] += len(ids)
+        informe['lotes'] += 1
+        informe['descuadres'] += descuadres
+        ultimo = ids[-1]
+
+    return informe
+
+
+# --- VOTOS DE VECINOS QUE SE DAN DE BAJA ---
+
+def descontar_votos(ids_usuarios):
+    """
+    Borra los votos de estos usuarios restándolos de sus opciones con un solo
+    UPDATE, sube una vez la versión de cada votación afectada y la avisa una vez.
+    Devuelve los ids de esas votaciones. Va dentro de la transacción de la baja.
+    """
+    votos = Voto.objects.filter(usuario_id__in=ids_usuarios)
+    por_opcion = list(
+        votos.values('opcion_elegida_id', 'votacion_id')
+        .annotate(votos=Count('id'))
+        .values_list('opcion_elegida_id', 'votacion_id', 'votos')
+    )
+    if not por_opcion:
+        return set()
+
+    # Restar (y no poner un número): los votos que entren a la vez siguen sumando.
+    # Si el contador se había descuadrado a la baja se deja en 0: la columna es UNSIGNED
+    # y un negativo tumbaría el UPDATE y con él el lote de bajas, que se reintentaría
+    # sin fin. No vale GREATEST(votos - n, 0): en MySQL la resta sin signo ya falla.
+    # Lo que quede descuadrado lo arregla cuadrar_contadores
+    Opcion.objects.filter(id__in=[id_opcion for id_opcion, _, _ in por_opcion]).update(
+        votos_cantidad=Case(*[
+            When(id=id_opcion, votos_cantidad__gte=cuantos, then=F('votos_cantidad') - cuantos)
+            for id_opcion, _, cuantos in por_opcion
+        ], default=Value(0))
+    )
+    # Sin el aviso de cada voto: por su cuenta, cada uno subiría la versión y avisaría
+    with borrado_en_bloque():
+        votos.delete()
+
+    afectadas = {id_votacion for _, id_votacion, _ in por_opcion}
+    Votacion.objects.filter(id__in=afectadas).update(version=F('version') + 1)
+
+    def avisar():
+        for id_votacion in afectadas:
+            difusor.notificar(id_votacion)
+    transaction.on_commit(avisar)
+    return afectadas
@@ -0,0 +1,164 @@
+# votaciones/difusion.py
+import logging
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from core.asincrono import enviar_a_grupo
+
+from .models import Votacion
+from .resultados import grupo_votacion, grupo_detalle, obtener_resumen, obtener_detalle
+
+logger = logging.getLogger(__name__)
+
+# Valores por defecto; se pueden cambiar con VOTACIONES_DIFUSION en settings.py
+CONFIG_POR_DEFECTO = {
+    'VENTANA': 0.2,          # Segundos que esperamos para juntar avisos de la misma votación
+    'MAX_POR_SEGUNDO': 5,    # Tope de mensajes por segundo a cada grupo
+    'SINCRONO': False,       # True = mandar al momento, sin agrupar (útil en tests)
+}
+
+def config_difusion():
+    return {**CONFIG_POR_DEFECTO, **getattr(settings, 'VOTACIONES_DIFUSION', {})}
+
+
+def difundir_resultados(id_votacion):
+    # Mandamos los datos ya calculados: así los navegadores no tienen que pedirlos a la API
+    votacion = Votacion.objects.select_related('cooperativa').filter(id=id_votacion).first()
+    if votacion is None:
+        return # La han borrado entre el aviso y el envío
+    # Sale desde el hilo del difusor: enviar_a_grupo lo pasa al bucle del servidor
+    enviar_a_grupo(
+        grupo_votacion(id_votacion),
+        {
+            'type': 'evento_actualizacion', # Llama al método del Consumer
+            'datos': obtener_resumen(votacion),
+        }
+    )
+
+    # Los nombres solo salen si la cooperativa lo permite (y van a un grupo aparte)
+    if votacion.cooperativa.presidente_ve_votos:
+        enviar_a_grupo(
+            grupo_detalle(id_votacion),
+            {
+                'type': 'evento_detalle',
+                'datos': obtener_detalle(votacion),
+            }
+        )
+
+
+class DifusorAgrupado:
+    """
+    Junta los avisos de una misma votación y manda un solo mensaje por ventana.
+
+    El mensaje se calcula justo al enviarlo, así que siempre lleva el estado más
+    reciente aunque por medio hayan entrado cien votos. Además no deja pasar más
+    de MAX_POR_SEGUNDO mensajes por grupo aunque la ventana sea muy corta.
+    """
+
+    def __init__(self, enviar, config=config_difusion, reloj=time.monotonic):
+        self.enviar = enviar
+        self.config = config
+        self.reloj = reloj
+
+        self._pendientes = {}                # id_votacion -> momento en que toca enviar
+        self._envios = defaultdict(deque)    # id_votacion -> momentos de los últimos envíos
+        self._condicion = threading.Condition()
+        self._hilo = None
+
+        self.eventos_recibidos = Counter()
+        self.difusiones_enviadas = Counter()
+
+    def notificar(self, id_votacion):
+        config = self.config()
+        with self._condicion:
+            self.eventos_recibidos[id_votacion] += 1
+            if not config['SINCRONO']:
+                # Si ya hay un envío programado, este aviso viaja en él
+                if id_votacion not in self._pendientes:
+                    self._pendientes[id_votacion] = self._momento_de_envio(id_votacion, config)
+                    self._arrancar_hilo()
+                    self._condicion.notify()
+                return
+
+        self._enviar(id_votacion)
+
+    def vaciar(self):
+        # Envía ya todo lo pendiente, sin esperar a la ventana
+        with self._condicion:
+            listos = list(self._pendientes)
+            self._pendientes.clear()
+        for id_votacion in listos:
+            self._enviar(id_votacion)
+
+    def estadisticas(self):
+        with self._condicion:
+            return {
+                'eventos_recibidos': sum(self.eventos_recibidos.values()),
+                'difusiones_enviadas': sum(self.difusiones_enviadas.values()),
+                'pendientes': len(self._pendientes),
+                'por_votacion': {
+                    id_votacion: {
+                        'eventos_recibidos': recibidos,
+                        'difusiones_enviadas': self.difusiones_enviadas[id_votacion],
+                    }
+                    for id_votacion, recibidos in self.eventos_recibidos.items()
+                },
+            }
+
+    # --- INTERNOS ---
+
+    def _momento_de_envio(self, id_votacion, config):
+        ahora = self.reloj()
+        momento = ahora + config['VENTANA']
+
+        # Olvidamos los envíos de hace más de un segundo y, si el grupo ya gastó
+        # su cupo, esperamos a que caduque el más antiguo
+        envios = self._envios[id_votacion]
+        while envios and envios[0] <= ahora - 1:
+            envios.popleft()
+        if len(envios) >= config['MAX_POR_SEGUNDO']:
+            momento = max(momento, envios[0] + 1)
+        return momento
+
+    def _sacar_listos(self):
+        ahora = self.reloj()
+        listos = [id_votacion for id_votacion, momento in self._pendientes.items() if momento <= ahora]
+        for id_votacion in listos:
+            del self._pendientes[id_votacion]
+            self._envios[id_votacion].append(ahora)
+        return listos
+
+    def _enviar(self, id_votacion):
+        try:
+            self.enviar(id_votacion)
+            self.difusiones_enviadas[id_votacion] += 1
+        except Exception:
+            logger.exception("No se pudo difundir la votación %s", id_votacion)
+
+    def _arrancar_hilo(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._hilo = threading.Thread(target=self._bucle, name='difusor-votaciones', daemon=True)
+            self._hilo.start()
+
+    def _bucle(self):
+        while True:
+            with self._condicion:
+                while not self._pendientes:
+                    self._condicion.wait()
+                espera = min(self._pendientes.values()) - self.reloj()
+                if espera > 0:
+                    self._condicion.wait(espera)
+                    continue
+                listos = self._sacar_listos()
+
+            for id_votacion in listos:
+                self._enviar(id_votacion)
+            # Como al final de una petición: no dejamos conexiones a la BD colgando
+            close_old_connections()
+
+
+difusor = DifusorAgrupado(difundir_resultados)
@@ -0,0 +1,95 @@
+# votaciones/eventos.py
+import asyncio
+import json
+
+from channels.layers import get_channel_layer
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .conexiones import aforo
+from .resultados import (
+    grupo_votacion, grupo_detalle, aobtener_resumen, aobtener_detalle, aobtener_directorio,
+    formatear_detalle, compactar_detalle
+)
+
+# Segundos entre comentarios de latido: los proxies cortan las conexiones calladas
+LATIDO = 15
+# Lo que espera el navegador antes de reconectar (EventSource lo hace solo)
+REINTENTO_MS = 5000
+
+
+# --- SERVER-SENT EVENTS (PARA QUIEN NO PUEDE USAR WEBSOCKET) ---
+# Los mismos avisos que ws/votacion/<id>/, por una respuesta HTTP que no se acaba.
+# Cada "resultados" lleva como id su versión: al reconectar, el navegador manda
+# Last-Event-ID y solo recibe algo si se ha perdido alguna versión. Como cada aviso
+# trae el estado completo, basta con el último (no hace falta repetir el historial).
+
+def evento(datos, version=None):
+    lineas = [] if version is None else [f'id: {version}']
+    lineas.append('data: ' + json.dumps(datos, cls=DjangoJSONEncoder, ensure_ascii=False))
+    return '\n'.join(lineas) + '\n\n'
+
+async def detalle_para(usuario, detalle, compacto):
+    # Igual que VotacionConsumer.evento_detalle
+    if compacto:
+        return compactar_detalle(detalle, await aobtener_directorio(usuario.cooperativa_id))
+    return formatear_detalle(detalle, usuario.id)
+
+async def flujo_eventos(votacion, usuario, con_detalle, ultima_version=None, compacto=False, plaza=None):
+    """
+    Generador asíncrono para StreamingHttpResponse. No ocupa ningún hilo mientras
+    espera: un proceso aguanta miles de estos abiertos en su bucle de asyncio.
+
+    La plaza del aforo (usuario_id, grupo) se ocupa aquí dentro y no en la vista:
+    si el navegador se va antes de que Django empiece a leer el generador, este
+    no llega a arrancar y no se queda ninguna plaza ocupada para siempre.
+    """
+    layer = get_channel_layer()
+    grupos = [grupo_votacion(votacion.id)]
+    if con_detalle:
+        grupos.append(grupo_detalle(votacion.id))
+    canal = None
+
+    if plaza is not None and not aforo.entrar(*plaza):
+        # Se ha llenado entre la vista y aquí: EventSource volverá a probar pasado el retry
+        yield f'retry: {REINTENTO_MS}\n\n'
+        return
+    try:
+        canal = await layer.new_channel()
+        # 1. Primero al grupo y luego el estado actual: así no se pierde nada entre medias
+        for grupo in grupos:
+            await layer.group_add(grupo, canal)
+        yield f'retry: {REINTENTO_MS}\n\n'
+
+        # 2. Lo que se ha perdido (nada si ya tiene la última versión)
+        resumen = await aobtener_resumen(votacion)
+        if not votacion.activa:
+            yield evento({'tipo': 'cerrada', **resumen, 'activa': False}, resumen['version'])
+            return
+        if ultima_version is None or ultima_version < resumen['version']:
+            yield evento({'tipo': 'resultados', **resumen}, resumen['version'])
+            if con_detalle:
+                detalle = await detalle_para(usuario, await aobtener_detalle(votacion), compacto)
+                yield evento({'tipo': 'detalle', **detalle})
+
+        # 3. En vivo, hasta que cierre o el navegador se vaya (Django cancela el generador)
+        while True:
+            try:
+                mensaje = await asyncio.wait_for(layer.receive(canal), LATIDO)
+            except asyncio.TimeoutError:
+                yield ': latido\n\n'
+                continue
+
+            datos = mensaje['datos']
+            if mensaje['type'] == 'evento_actualizacion':
+                yield evento({'tipo': 'resultados', **datos}, datos['version'])
+            elif mensaje['type'] == 'evento_detalle':
+                yield evento({'tipo': 'detalle', **await detalle_para(usuario, datos, compacto)})
+            elif mensaje['type'] == 'evento_cierre':
+                yield evento({'tipo': 'cerrada', **datos}, datos['version'])
+                return
+    finally:
+        if plaza is not None:
+            aforo.salir(*plaza)
+        if canal is not None:
+            for grupo in grupos:
+                await layer.group_discard(grupo, canal)
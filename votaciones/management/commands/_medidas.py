@@ -0,0 +1,97 @@
+# Utilidades compartidas por los comandos benchmark_* (el "_" evita que Django lo tome por comando)
+import asyncio
+import statistics
+import threading
+import time
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+def percentiles(muestras):
+    # p50/p95/p99 de una lista de tiempos en segundos, devueltos en milisegundos
+    if not muestras:
+        return {'p50': 0, 'p95': 0, 'p99': 0, 'max': 0}
+    if len(muestras) == 1:
+        cortes = [muestras[0]] * 99
+    else:
+        cortes = statistics.quantiles(muestras, n=100, method='inclusive')
+    return {
+        'p50': round(cortes[49] * 1000, 2),
+        'p95': round(cortes[94] * 1000, 2),
+        'p99': round(cortes[98] * 1000, 2),
+        'max': round(max(muestras) * 1000, 2),
+    }
+
+
+def formatear(nombre, medidas):
+    return f"{nombre}: p50={medidas['p50']}ms p95={medidas['p95']}ms p99={medidas['p99']}ms max={medidas['max']}ms"
+
+
+async def peticion_asgi(aplicacion, ruta, metodo='GET', cabeceras=(), cuerpo=b'', cliente='127.0.0.1'):
+    """
+    Una petición HTTP hablando ASGI directamente con Django, como haría daphne.
+    Devuelve (estado, segundos).
+    """
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': metodo, 'scheme': 'http', 'path': ruta, 'raw_path': ruta.encode(),
+        'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'localhost'), *cabeceras],
+        'client': (cliente, 0), 'server': ('localhost', 80),
+    }
+    cuerpo_enviado = False
+    estado = None
+
+    async def receive():
+        nonlocal cuerpo_enviado
+        if not cuerpo_enviado:
+            cuerpo_enviado = True
+            return {'type': 'http.request', 'body': cuerpo, 'more_body': False}
+        # El cliente no se desconecta: Django cancela esta espera al terminar
+        await asyncio.Event().wait()
+
+    async def send(mensaje):
+        nonlocal estado
+        if mensaje['type'] == 'http.response.start':
+            estado = mensaje['status']
+
+    inicio = time.perf_counter()
+    await aplicacion(scope, receive, send)
+    return estado, time.perf_counter() - inicio
+
+
+class ContadorSQL:
+    """
+    Cuenta las consultas SQL de todas las conexiones, sean del hilo que sean: bajo ASGI
+    cada petición consulta desde su propio hilo (y su propia conexión), así que
+    CaptureQueriesContext, que solo mira la del hilo actual, no las vería.
+    Se usa con "with" y se lee .consultas antes y después de lo que se quiera medir.
+    """
+
+    def __init__(self):
+        self.consultas = 0
+        self.activo = False
+        self._cerrojo = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.activo:
+            with self._cerrojo:
+                self.consultas += 1
+        return execute(sql, params, many, context)
+
+    def enganchar(self, sender=None, connection=None, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        self.activo = True
+        connection_created.connect(self.enganchar)
+        for conexion in connections.all(initialized_only=True):
+            self.enganchar(connection=conexion)
+        return self
+
+    def __exit__(self, *exc):
+        # Las conexiones de otros hilos se quedan con el contador puesto, pero ya no suma
+        self.activo = False
+        connection_created.disconnect(self.enganchar)
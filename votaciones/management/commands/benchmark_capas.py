@@ -0,0 +1,98 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from core.capa_sqlite import SQLiteChannelLayer
+from ._medidas import percentiles, formatear
+
+GRUPO = 'benchmark_capas'
+
+
+async def escuchar(layer, receptores, mensajes, listo=None):
+    # Crea los canales, los mete en el grupo y devuelve las latencias de cada entrega
+    canales = [await layer.new_channel() for _ in range(receptores)]
+    for canal in canales:
+        await layer.group_add(GRUPO, canal)
+    if listo is not None:
+        listo.set()
+
+    async def recibir(canal):
+        latencias = []
+        for _ in range(mensajes):
+            mensaje = await layer.receive(canal)
+            latencias.append(time.time() - mensaje['enviado'])
+        return latencias
+
+    resultados = await asyncio.gather(*(recibir(c) for c in canales))
+    return [latencia for lista in resultados for latencia in lista]
+
+
+async def emitir(layer, mensajes, pausa):
+    for _ in range(mensajes):
+        await layer.group_send(GRUPO, {'type': 'benchmark', 'enviado': time.time()})
+        await asyncio.sleep(pausa)
+
+
+def receptor_en_proceso(ruta, receptores, mensajes, listo, salida):
+    # Se ejecuta en otro proceso, como si fuera otro worker de daphne
+    layer = SQLiteChannelLayer(ruta=ruta)
+    salida.put(asyncio.run(escuchar(layer, receptores, mensajes, listo)))
+
+
+class Command(BaseCommand):
+    help = "Compara la latencia de group_send (fan-out) entre la capa en memoria y la capa SQLite multiproceso."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--receptores', type=int, default=400, help="Sockets simulados en total.")
+        parser.add_argument('--mensajes', type=int, default=50)
+        parser.add_argument('--procesos', type=int, default=4, help="Procesos receptores para la capa SQLite.")
+        parser.add_argument('--pausa', type=float, default=0.02, help="Segundos entre un group_send y el siguiente.")
+
+    def handle(self, *args, **options):
+        receptores, mensajes, pausa = options['receptores'], options['mensajes'], options['pausa']
+
+        # 1. EN MEMORIA: todo dentro del mismo proceso (no puede ser de otra forma)
+        async def en_memoria():
+            layer = InMemoryChannelLayer(capacity=mensajes + 1)
+            listo = asyncio.Event()
+            escucha = asyncio.ensure_future(escuchar(layer, receptores, mensajes, listo))
+            await listo.wait()
+            await emitir(layer, mensajes, pausa)
+            return await escucha
+
+        self.stdout.write(formatear("InMemoryChannelLayer", percentiles(asyncio.run(en_memoria()))))
+
+        # 2. SQLITE: los receptores repartidos en varios procesos, el emisor en este
+        procesos = options['procesos']
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, 'canales.sqlite3')
+            contexto = multiprocessing.get_context('spawn')
+            salida = contexto.Queue()
+            listos = [contexto.Event() for _ in range(procesos)]
+            hijos = [
+                contexto.Process(
+                    target=receptor_en_proceso,
+                    args=(ruta, receptores // procesos, mensajes, listo, salida),
+                )
+                for listo in listos
+            ]
+            for hijo in hijos:
+                hijo.start()
+            for listo in listos:
+                listo.wait()
+
+            asyncio.run(emitir(SQLiteChannelLayer(ruta=ruta), mensajes, pausa))
+
+            latencias = []
+            for _ in hijos:
+                latencias.extend(salida.get())
+            for hijo in hijos:
+                hijo.join()
+
+        self.stdout.write(formatear(f"SQLiteChannelLayer ({procesos} procesos)", percentiles(latencias)))
+        self.stdout.write(f"Entregas por capa: {receptores // procesos * procesos * mensajes}")
@@ -0,0 +1,93 @@
+import json
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from usuarios.models import Cooperativa, Usuario
+from votaciones.models import Votacion, Opcion, Voto
+from votaciones.resultados import (
+    calcular_detalle, formatear_detalle, compactar_detalle, obtener_directorio, clave_directorio
+)
+from ._medidas import percentiles, formatear
+
+
+class Command(BaseCommand):
+    help = "Compara bytes y tiempo de serialización del detalle con nombres frente al formato compacto (ids)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vecinos', type=int, default=1000)
+        parser.add_argument('--opciones', type=int, default=4)
+        parser.add_argument('--participacion', type=float, default=0.6,
+                            help="Fracción de vecinos que han votado.")
+        parser.add_argument('--repeticiones', type=int, default=200)
+        parser.add_argument('--conservar', action='store_true',
+                            help="No borrar la cooperativa de prueba al terminar.")
+
+    def handle(self, *args, **options):
+        # 1. ESCENARIO: cooperativa con nombres realistas y una votación a medias
+        token = get_random_string(6).lower()
+        cooperativa = Cooperativa.objects.create(nombre=f"Benchmark {token}", presidente_ve_votos=True)
+        Usuario.objects.bulk_create([
+            Usuario(
+                username=f"bench_{token}_{i}",
+                password=make_password(None),
+                first_name=f"Nombre{i}",
+                last_name=f"Apellido Apellido{i}",
+                cooperativa=cooperativa,
+                rol=Usuario.VECINO,
+                requiere_cambio_pass=False,
+            )
+            for i in range(options['vecinos'])
+        ])
+        usuarios = list(Usuario.objects.filter(cooperativa=cooperativa))
+
+        votacion = Votacion.objects.create(
+            titulo=f"Benchmark {token}",
+            cooperativa=cooperativa,
+            fecha_fin=timezone.now() + timedelta(hours=1),
+        )
+        opciones = [
+            Opcion.objects.create(votacion=votacion, texto=f"Opción {i + 1}")
+            for i in range(options['opciones'])
+        ]
+        votantes = random.sample(usuarios, int(len(usuarios) * options['participacion']))
+        Voto.objects.bulk_create([
+            Voto(usuario=u, votacion=votacion, opcion_elegida=random.choice(opciones)) for u in votantes
+        ])
+
+        detalle = calcular_detalle(votacion)
+        cache.delete(clave_directorio(cooperativa.id))
+        directorio = obtener_directorio(cooperativa.id)
+        quien_mira = usuarios[0].id
+
+        # 2. MEDIDAS: lo que cuesta preparar cada aviso para un espectador
+        def medir(preparar):
+            muestras = []
+            for _ in range(options['repeticiones']):
+                inicio = time.perf_counter()
+                cuerpo = json.dumps(preparar()).encode()
+                muestras.append(time.perf_counter() - inicio)
+            return len(cuerpo), percentiles(muestras)
+
+        bytes_completo, tiempo_completo = medir(lambda: formatear_detalle(detalle, quien_mira))
+        bytes_compacto, tiempo_compacto = medir(lambda: compactar_detalle(detalle, directorio))
+        bytes_directorio = len(json.dumps({'nombres': directorio['nombres']}).encode())
+
+        self.stdout.write(f"Vecinos: {len(usuarios)} | Votos: {len(votantes)} | Opciones: {len(opciones)}")
+        self.stdout.write(f"Con nombres: {bytes_completo} bytes por aviso")
+        self.stdout.write(f"Compacto:    {bytes_compacto} bytes por aviso "
+                          f"({bytes_compacto / bytes_completo:.0%}) + directorio una vez: {bytes_directorio} bytes")
+        ahorro = bytes_completo - bytes_compacto
+        if ahorro > 0:
+            self.stdout.write(f"El directorio se amortiza a partir de {bytes_directorio / ahorro:.1f} avisos")
+        self.stdout.write(formatear("Serializar con nombres", tiempo_completo))
+        self.stdout.write(formatear("Serializar compacto   ", tiempo_compacto))
+
+        if not options['conservar']:
+            cooperativa.delete()
@@ -0,0 +1,429 @@
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+from datetime import timedelta
+from pathlib import Path
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from usuarios.management.commands.benchmark_login import CABECERAS, CSRF, PBKDF2Ajustable
+from usuarios.models import Cooperativa, Usuario
+from votaciones.contadores import borrado_en_bloque
+from votaciones.models import Votacion, Opcion, Voto, censo_actual
+from ._medidas import percentiles, formatear, peticion_asgi, ContadorSQL
+
+# Lo que debe contestar cada escenario cuando todo va bien
+ESPERADO = {
+    'panel_inicio': 200,
+    'ver_votacion': 200,
+    'datos_en_vivo': 200,
+    'votar': 302,
+    'login': 302,
+}
+ESPERA_SOCKET = 10  # Segundos que se espera un mensaje antes de darlo por perdido
+
+
+def cabeceras_de(datos, formulario=False):
+    # Bajo ASGI dos cabeceras "cookie" se juntan con "," y Django no lee la segunda:
+    # la sesión y el CSRF de los POST van en la misma
+    if not formulario:
+        return [(b'cookie', datos['cookie'].encode())]
+    return [(b'cookie', f"{datos['cookie']}; csrftoken={CSRF}".encode()), *CABECERAS[1:]]
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga de punta a punta: siembra cooperativas, vecinos, votaciones y votos, "
+        "ataca las vistas reales y los WebSockets con clientes a la vez y guarda las medidas "
+        "(p50/p95/p99, peticiones por segundo y consultas SQL por petición) en un JSON."
+    )
+
+    def add_arguments(self, parser):
+        # Tamaño de los datos
+        parser.add_argument('--cooperativas', type=int, default=2)
+        parser.add_argument('--vecinos', type=int, default=200, help="Vecinos por cooperativa.")
+        parser.add_argument('--votaciones', type=int, default=5, help="Votaciones abiertas por cooperativa.")
+        parser.add_argument('--opciones', type=int, default=3, help="Opciones por votación.")
+        parser.add_argument('--participacion', type=float, default=0.5,
+                            help="Fracción de vecinos que ya han votado en cada votación al empezar.")
+        # Carga
+        parser.add_argument('--clientes', type=int, default=50, help="Peticiones en vuelo a la vez.")
+        parser.add_argument('--peticiones', type=int, default=500, help="Peticiones por escenario HTTP.")
+        parser.add_argument('--sockets', type=int, default=200, help="WebSockets abiertos a la vez en una votación.")
+        parser.add_argument('--avisos', type=int, default=10,
+                            help="Votos que se mandan con los sockets abiertos para medir cuánto tardan en llegar.")
+        parser.add_argument('--iteraciones', type=int, default=None,
+                            help="Vueltas de PBKDF2 para el login (por defecto, las de Django).")
+        # Resultados
+        parser.add_argument('--salida', default='benchmark_sistema.json', help="Fichero JSON con las medidas.")
+        parser.add_argument('--comparar', default=None, help="JSON de una ejecución anterior con el que compararse.")
+        parser.add_argument('--conservar', action='store_true',
+                            help="No borrar las cooperativas de prueba al terminar.")
+
+    def handle(self, *args, **options):
+        if options['cooperativas'] < 1 or options['vecinos'] < 1 or options['votaciones'] < 1 or options['opciones'] < 1:
+            raise CommandError("Hace falta al menos una cooperativa con un vecino y una votación con una opción.")
+        anterior = self.leer_anterior(options['comparar'])
+
+        ajustes = {
+            'ALLOWED_HOSTS': ['localhost'],
+            # Sin tareas de fondo durante la medida
+            'VOTACIONES_CIERRES_EN_PROCESO': False,
+            'CORREO_EN_PROCESO': False,
+            'BAJAS_EN_PROCESO': False,
+            # Cada voto sale al momento desde la propia petición: así se mide el camino
+            # voto -> grupo -> socket sin la VENTANA de agrupado, que solo sumaría su espera
+            'VOTACIONES_DIFUSION': {**settings.VOTACIONES_DIFUSION, 'SINCRONO': True},
+            # Los límites de aforo no deben rechazar los sockets que se piden
+            'VOTACIONES_SOCKETS': {
+                **settings.VOTACIONES_SOCKETS,
+                'MAX_POR_USUARIO': max(settings.VOTACIONES_SOCKETS.get('MAX_POR_USUARIO', 10),
+                                       math.ceil(options['sockets'] / options['vecinos'])),
+                'MAX_POR_GRUPO': max(settings.VOTACIONES_SOCKETS.get('MAX_POR_GRUPO', 2000), options['sockets']),
+            },
+        }
+        if options['iteraciones']:
+            PBKDF2Ajustable.iterations = options['iteraciones']
+            ajustes['PASSWORD_HASHERS'] = [f'{PBKDF2Ajustable.__module__}.PBKDF2Ajustable']
+
+        with override_settings(**ajustes):
+            # 1. DATOS
+            inicio = time.perf_counter()
+            escenario = self.sembrar(options)
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"Datos: {escenario['datos']} ({time.perf_counter() - inicio:.1f}s)"
+            ))
+            # Los 429/503 también son medidas: que no llenen la salida de avisos
+            registro = logging.getLogger('django.request')
+            nivel = registro.level
+            try:
+                # 2. CARGA (la aplicación ASGI real: mismas urls, middleware y consumers que daphne)
+                from core.asgi import application
+                registro.setLevel(logging.CRITICAL)
+                with ContadorSQL() as contador:
+                    medidas = asyncio.run(self.cargar(application, escenario, contador, options))
+            finally:
+                registro.setLevel(nivel)
+                if not options['conservar']:
+                    self.limpiar(escenario['cooperativas'])
+
+        # 3. INFORME
+        informe = {
+            'fecha': timezone.now().isoformat(),
+            'parametros': {clave: options[clave] for clave in (
+                'cooperativas', 'vecinos', 'votaciones', 'opciones', 'participacion',
+                'clientes', 'peticiones', 'sockets', 'avisos', 'iteraciones',
+            )},
+            'datos': escenario['datos'],
+            'escenarios': medidas,
+        }
+        Path(options['salida']).write_text(json.dumps(informe, indent=2, ensure_ascii=False))
+        self.informar(medidas, anterior)
+        self.stdout.write(self.style.SUCCESS(f"Medidas guardadas en {options['salida']}"))
+
+    # --- DATOS ---
+
+    def sembrar(self, options):
+        """
+        Crea las cooperativas de prueba con bulk_create (sin señales ni avisos) y deja
+        los contadores de las opciones ya cuadrados con los votos sembrados.
+        """
+        token = get_random_string(6).lower()
+        clave = get_random_string(12)
+        # Todos con la misma contraseña: cifrarla una vez por vecino llevaría minutos
+        cifrada = make_password(clave)
+        fin = timezone.now() + timedelta(hours=2)
+
+        cooperativas = Cooperativa.objects.bulk_create([
+            Cooperativa(nombre=f"Benchmark {token} {c}") for c in range(options['cooperativas'])
+        ])
+        # Con MySQL bulk_create no devuelve los ids: se vuelven a leer
+        cooperativas = list(Cooperativa.objects.filter(nombre__startswith=f"Benchmark {token} ").order_by('id'))
+
+        Usuario.objects.bulk_create([
+            Usuario(username=f"bench_{token}_{c}_{i}", password=cifrada, cooperativa=cooperativa,
+                    rol=Usuario.VECINO, requiere_cambio_pass=False)
+            for c, cooperativa in enumerate(cooperativas)
+            for i in range(options['vecinos'])
+        ], batch_size=1000)
+        vecinos = {cooperativa.id: [] for cooperativa in cooperativas}
+        for usuario in Usuario.objects.filter(cooperativa__in=cooperativas).order_by('id'):
+            vecinos[usuario.cooperativa_id].append(usuario)
+
+        # bulk_create no pasa por save(): el censo se congela aquí, uno por cooperativa
+        Votacion.objects.bulk_create([
+            Votacion(titulo=f"Benchmark {token} {v}", cooperativa=cooperativa, fecha_fin=fin,
+                     censo=censo_actual(cooperativa.id).a_bytes())
+            for cooperativa in cooperativas
+            for v in range(options['votaciones'])
+        ])
+        votaciones = list(Votacion.objects.filter(cooperativa__in=cooperativas).order_by('id'))
+        Opcion.objects.bulk_create([
+            Opcion(votacion=votacion, texto=f"Opción {o + 1}")
+            for votacion in votaciones
+            for o in range(options['opciones'])
+        ])
+        opciones = {votacion.id: [] for votacion in votaciones}
+        for opcion in Opcion.objects.filter(votacion__in=votaciones).order_by('id'):
+            opciones[opcion.votacion_id].append(opcion)
+
+        # Votos ya emitidos y sus contadores
+        votados = set()
+        votos = []
+        for votacion in votaciones:
+            censo = vecinos[votacion.cooperativa_id]
+            for usuario in random.sample(censo, int(len(censo) * options['participacion'])):
+                opcion = random.choice(opciones[votacion.id])
+                opcion.votos_cantidad += 1
+                votos.append(Voto(usuario=usuario, votacion=votacion, opcion_elegida=opcion))
+                votados.add((usuario.id, votacion.id))
+        Voto.objects.bulk_create(votos, batch_size=1000)
+        Opcion.objects.bulk_update([o for lista in opciones.values() for o in lista], ['votos_cantidad'], batch_size=1000)
+
+        # Sesiones abiertas: tantas como clientes o sockets haya a la vez
+        con_sesion = []
+        por_cooperativa = math.ceil(max(options['clientes'], options['sockets']) / len(cooperativas))
+        for cooperativa in cooperativas:
+            for usuario in vecinos[cooperativa.id][:por_cooperativa]:
+                cliente = Client()
+                cliente.force_login(usuario)
+                sesion = cliente.cookies[settings.SESSION_COOKIE_NAME].value
+                con_sesion.append({
+                    'usuario': usuario,
+                    'cookie': f"{settings.SESSION_COOKIE_NAME}={sesion}",
+                    'votaciones': [v.id for v in votaciones if v.cooperativa_id == cooperativa.id],
+                })
+
+        return {
+            'cooperativas': cooperativas,
+            'vecinos': vecinos,
+            'votaciones': votaciones,
+            'opciones': opciones,
+            'votados': votados,
+            'con_sesion': con_sesion,
+            'clave': clave,
+            'datos': {
+                'cooperativas': len(cooperativas),
+                'vecinos': sum(len(lista) for lista in vecinos.values()),
+                'votaciones': len(votaciones),
+                'opciones': sum(len(lista) for lista in opciones.values()),
+                'votos': len(votos),
+            },
+        }
+
+    def limpiar(self, cooperativas):
+        # Sin el aviso de cada voto: cada uno subiría la versión y avisaría por su cuenta
+        with borrado_en_bloque():
+            Voto.objects.filter(votacion__cooperativa__in=cooperativas).delete()
+        for cooperativa in cooperativas:
+            cooperativa.delete()
+
+    # --- CARGA ---
+
+    async def cargar(self, aplicacion, escenario, contador, options):
+        con_sesion = escenario['con_sesion']
+        n = options['peticiones']
+
+        def sesion(i):
+            return con_sesion[i % len(con_sesion)]
+
+        def ver(ruta_de):
+            def peticion(i):
+                datos = sesion(i)
+                return peticion_asgi(aplicacion, ruta_de(datos, i), cabeceras=cabeceras_de(datos))
+            return peticion
+
+        # Votos nuevos: parejas (vecino con sesión, votación de su cooperativa) que aún no han votado
+        pendientes = [
+            (datos, id_votacion) for datos in con_sesion for id_votacion in datos['votaciones']
+            if (datos['usuario'].id, id_votacion) not in escenario['votados']
+        ]
+        random.shuffle(pendientes)
+        # Los primeros se guardan para los avisos por WebSocket
+        votacion_sockets = escenario['votaciones'][0]
+        para_avisos = [p for p in pendientes if p[1] == votacion_sockets.id][:options['avisos']]
+        para_votar = [p for p in pendientes if p not in para_avisos][:n]
+
+        def votar(i):
+            datos, id_votacion = para_votar[i]
+            return self.votar(aplicacion, datos, id_votacion, escenario)
+
+        # Vecinos sin sesión que entran cada uno desde su IP
+        todos = [u for lista in escenario['vecinos'].values() for u in lista]
+        entrantes = random.sample(todos, min(n, len(todos)))
+
+        def entrar(i):
+            cuerpo = urlencode({'username': entrantes[i].username, 'password': escenario['clave']}).encode()
+            return peticion_asgi(aplicacion, '/', 'POST', CABECERAS, cuerpo, cliente=f'10.{i // 62500}.{i // 250 % 250}.{i % 250 + 1}')
+
+        escenarios = {
+            'panel_inicio': (ver(lambda datos, i: '/inicio/'), n),
+            'ver_votacion': (ver(lambda datos, i: f"/votaciones/{datos['votaciones'][i % len(datos['votaciones'])]}/"), n),
+            'datos_en_vivo': (ver(lambda datos, i: f"/api/votacion/{datos['votaciones'][i % len(datos['votaciones'])]}/"), n),
+            'votar': (votar, len(para_votar)),
+            'login': (entrar, len(entrantes)),
+        }
+
+        medidas = {}
+        for nombre, (peticion, cuantas) in escenarios.items():
+            # Una primera petición fuera de la medida: cachés calientes y nada de arranque en frío
+            if nombre not in ('votar', 'login'):
+                await peticion(cuantas)
+            medidas[nombre] = await self.rafaga(nombre, peticion, cuantas, options['clientes'], contador)
+
+        medidas['websocket'] = await self.sockets(aplicacion, votacion_sockets, escenario, para_avisos, contador, options)
+        return medidas
+
+    async def votar(self, aplicacion, datos, id_votacion, escenario):
+        opcion = random.choice(escenario['opciones'][id_votacion])
+        cuerpo = urlencode({'btn_votar': '1', 'opcion_seleccionada': opcion.id}).encode()
+        return await peticion_asgi(aplicacion, f'/votaciones/{id_votacion}/', 'POST', cabeceras_de(datos, True), cuerpo)
+
+    async def rafaga(self, nombre, peticion, cuantas, clientes, contador):
+        """
+        Lanza `cuantas` peticiones con como mucho `clientes` a la vez (cada cliente
+        pide la siguiente en cuanto le contestan) y resume lo medido.
+        """
+        siguiente = iter(range(cuantas))
+        resultados = []
+
+        async def cliente():
+            for i in siguiente:
+                resultados.append(await peticion(i))
+
+        consultas = contador.consultas
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente() for _ in range(min(clientes, cuantas))))
+        total = time.perf_counter() - inicio
+        consultas = contador.consultas - consultas
+
+        estados = {}
+        for estado, _ in resultados:
+            estados[str(estado)] = estados.get(str(estado), 0) + 1
+        correctas = [duracion for estado, duracion in resultados if estado == ESPERADO[nombre]]
+        return {
+            'peticiones': len(resultados),
+            'correctas': len(correctas),
+            'estados': dict(sorted(estados.items())),
+            'segundos': round(total, 3),
+            'por_segundo': round(len(resultados) / total, 1) if total else 0,
+            'latencia_ms': percentiles(correctas),
+            'sql_por_peticion': round(consultas / len(resultados), 2) if resultados else 0,
+        }
+
+    async def sockets(self, aplicacion, votacion, escenario, para_avisos, contador, options):
+        """
+        Abre `sockets` conexiones a ws/votacion/<id>/ (con la sesión de cada vecino, por
+        el AuthMiddlewareStack real) y mide cuánto tarda cada voto en llegar a todas.
+        """
+        from channels.testing import WebsocketCommunicator
+
+        de_la_cooperativa = [datos for datos in escenario['con_sesion'] if votacion.id in datos['votaciones']]
+        if not options['sockets'] or not de_la_cooperativa:
+            return {'conexiones': 0}
+        limite = asyncio.Semaphore(options['clientes'])
+
+        async def conectar(i):
+            datos = de_la_cooperativa[i % len(de_la_cooperativa)]
+            comunicador = WebsocketCommunicator(
+                aplicacion, f'/ws/votacion/{votacion.id}/', headers=[(b'cookie', datos['cookie'].encode())]
+            )
+            async with limite:
+                inicio = time.perf_counter()
+                conectado, _ = await comunicador.connect(timeout=ESPERA_SOCKET)
+                return comunicador, conectado, time.perf_counter() - inicio
+
+        # 1. CONEXIONES
+        consultas = contador.consultas
+        inicio = time.perf_counter()
+        abiertos = await asyncio.gather(*(conectar(i) for i in range(options['sockets'])))
+        total_conexion = time.perf_counter() - inicio
+        consultas = contador.consultas - consultas
+        comunicadores = [comunicador for comunicador, conectado, _ in abiertos if conectado]
+        aceptadas = len(comunicadores)
+
+        # 2. AVISOS: un voto por la vista real y lo que tarda en verlo cada socket
+        entregas = []
+        perdidos = 0
+        for datos, id_votacion in para_avisos:
+            inicio = time.perf_counter()
+            await self.votar(aplicacion, datos, id_votacion, escenario)
+            llegadas = await asyncio.gather(*(self.esperar_resultados(c, inicio) for c in comunicadores))
+            entregas += [llegada for llegada in llegadas if llegada is not None]
+            perdidos += llegadas.count(None)
+            # Al vencer la espera el comunicador corta su socket: ya no cuenta para los siguientes
+            comunicadores = [c for c, llegada in zip(comunicadores, llegadas) if llegada is not None]
+
+        for comunicador in comunicadores:
+            await comunicador.disconnect()
+
+        return {
+            'conexiones': len(abiertos),
+            'aceptadas': aceptadas,
+            'segundos_conectando': round(total_conexion, 3),
+            'conexiones_por_segundo': round(len(abiertos) / total_conexion, 1) if total_conexion else 0,
+            'conexion_ms': percentiles([duracion for _, conectado, duracion in abiertos if conectado]),
+            'sql_por_conexion': round(consultas / len(abiertos), 2),
+            'avisos': len(para_avisos),
+            'entregas': len(entregas),
+            'perdidos': perdidos,
+            'entrega_ms': percentiles(entregas),
+        }
+
+    async def esperar_resultados(self, comunicador, inicio):
+        # Hasta el siguiente "resultados" (los "ping" del latido no cuentan)
+        try:
+            while True:
+                mensaje = json.loads(await comunicador.receive_from(timeout=ESPERA_SOCKET))
+                if mensaje.get('tipo') == 'resultados':
+                    return time.perf_counter() - inicio
+        except asyncio.TimeoutError:
+            return None
+
+    # --- INFORME ---
+
+    def leer_anterior(self, ruta):
+        if not ruta:
+            return None
+        try:
+            return json.loads(Path(ruta).read_text())['escenarios']
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"No se puede leer {ruta}: {e}")
+
+    def informar(self, medidas, anterior):
+        for nombre, medida in medidas.items():
+            if nombre == 'websocket':
+                continue
+            linea = (formatear(f"{nombre:>14}", medida['latencia_ms'])
+                     + f" | {medida['por_segundo']} pet/s | {medida['sql_por_peticion']} SQL/pet"
+                     + f" | respuestas {medida['estados']}")
+            self.stdout.write(linea + self.diferencia(anterior, nombre, 'latencia_ms', 'sql_por_peticion', medida))
+
+        socket = medidas['websocket']
+        if socket.get('conexiones'):
+            self.stdout.write(formatear(f"{'ws conexión':>14}", socket['conexion_ms'])
+                              + f" | {socket['aceptadas']}/{socket['conexiones']} aceptadas"
+                              + f" | {socket['sql_por_conexion']} SQL/conexión"
+                              + self.diferencia(anterior, 'websocket', 'conexion_ms', 'sql_por_conexion', socket))
+            self.stdout.write(formatear(f"{'ws voto->socket':>14}", socket['entrega_ms'])
+                              + f" | {socket['entregas']} entregas, {socket['perdidos']} perdidas"
+                              + self.diferencia(anterior, 'websocket', 'entrega_ms', None, socket))
+
+    def diferencia(self, anterior, nombre, latencia, sql, medida):
+        # Cambio del p95 (y de las consultas) frente a la ejecución con la que se compara
+        previa = (anterior or {}).get(nombre)
+        if not previa or latencia not in previa:
+            return ''
+        texto = f" | p95 {medida[latencia]['p95'] - previa[latencia]['p95']:+.2f}ms"
+        if sql and sql in previa:
+            texto += f", SQL {medida[sql] - previa[sql]:+.2f}"
+        return texto + " vs. anterior"
@@ -0,0 +1,186 @@
+import asyncio
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.hashers import make_password
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.test import Client, override_settings
+from django.urls import path
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import get_random_string
+
+from usuarios.models import Cooperativa, Usuario
+from votaciones.models import Votacion, Opcion
+from votaciones.resultados import (
+    obtener_resumen, obtener_detalle, formatear_detalle, puede_ver_detalle, detalle_vacio,
+    datos_grafica, etiqueta_resultados, cambios_desde, obtener_directorio, compactar_detalle, resultado_final
+)
+from votaciones.servicios import registrar_voto
+from votaciones.views import datos_en_vivo, CACHE_HTTP_CERRADAS
+from ._medidas import percentiles, formatear, peticion_asgi
+
+
+# La vista datos_en_vivo tal cual era antes de pasarla a async (mismo código, misma respuesta),
+# solo para poder compararlas. Usa las mismas funciones síncronas de resultados.py que entonces.
+@login_required(login_url='login')
+def datos_en_vivo_sincrona(request, id_votacion):
+    votacion = get_object_or_404(
+        Votacion.objects.select_related('cooperativa', 'resultado_final'),
+        id=id_votacion, cooperativa_id=request.user.cooperativa_id
+    )
+    permiso_ver_detalles = puede_ver_detalle(request.user, votacion)
+
+    # 1. ¿Tiene el navegador ya esta versión? Entonces no calculamos nada
+    etiqueta = etiqueta_resultados(votacion, request.user, permiso_ver_detalles)
+    respuesta = get_conditional_response(request, etag=etiqueta)
+
+    # 2. Solo ids y cuentas: el navegador ya tiene los nombres
+    datos = None
+    if respuesta is None and request.GET.get('formato') == 'compacto':
+        resumen = obtener_resumen(votacion)
+        datos = {
+            'formato': 'compacto',
+            'parcial': False,
+            'version': resumen['version'],
+            'activa': resumen['activa'],
+            'total_votos': resumen['total_votos'],
+            'abstencion': resumen['abstencion'],
+            'ids_opciones': resumen['ids_opciones'],
+            'votos_opciones': resumen['votos_opciones'],
+        }
+        if permiso_ver_detalles:
+            directorio = obtener_directorio(votacion.cooperativa_id)
+            datos.update(compactar_detalle(obtener_detalle(votacion), directorio))
+
+    # 3. Solo los cambios, si nos dicen desde qué versión y aún la tenemos en caché
+    elif respuesta is None and request.GET.get('since', '').isdigit():
+        datos = cambios_desde(votacion, int(request.GET['since']), request.user.id, permiso_ver_detalles)
+
+    # 4. Todo completo
+    if respuesta is None and datos is None:
+        resumen = obtener_resumen(votacion)
+        if permiso_ver_detalles:
+            detalle = formatear_detalle(obtener_detalle(votacion), request.user.id)
+        else:
+            detalle = detalle_vacio()
+
+        datos = {
+            'parcial': False,
+            'version': resumen['version'],
+            'activa': resumen['activa'],
+            'total_votos': resumen['total_votos'],
+            'abstencion': resumen['abstencion'],
+            'ids_opciones': resumen['ids_opciones'],
+            'nombres_opciones': resumen['nombres_opciones'],
+            'votos_opciones': resumen['votos_opciones'],
+            'porcentajes': [barra['porcentaje'] for barra in datos_grafica(resumen)],
+            'mapa_votos': detalle['mapa_votos'],
+            'lista_abstencion': detalle['lista_abstencion'],
+            'lista_participacion': detalle['lista_participacion']
+        }
+
+    if respuesta is None:
+        respuesta = JsonResponse(datos)
+    respuesta['ETag'] = etiqueta
+
+    if resultado_final(votacion) is not None:
+        patch_cache_control(respuesta, private=True, max_age=CACHE_HTTP_CERRADAS, immutable=True)
+    else:
+        patch_cache_control(respuesta, private=True, no_cache=True)
+    return respuesta
+
+
+# Este mismo módulo hace de urls.py mientras dura la prueba
+urlpatterns = [
+    path('sincrona/<int:id_votacion>/', datos_en_vivo_sincrona),
+    path('asincrona/<int:id_votacion>/', datos_en_vivo),
+]
+
+
+async def pedir(aplicacion, ruta, cookie):
+    estado, duracion = await peticion_asgi(aplicacion, ruta, cabeceras=[(b'cookie', cookie)])
+    if estado != 200:
+        raise CommandError(f"{ruta} devolvió {estado}")
+    return duracion
+
+
+class Command(BaseCommand):
+    help = "Compara la API en vivo síncrona y asíncrona con cientos de espectadores a la vez."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--espectadores', type=int, default=300)
+        parser.add_argument('--rondas', type=int, default=5,
+                            help="Veces que todos los espectadores piden a la vez.")
+        parser.add_argument('--conservar', action='store_true',
+                            help="No borrar la cooperativa de prueba al terminar.")
+
+    def handle(self, *args, **options):
+        # 1. ESCENARIO: una cooperativa con sus espectadores ya logueados
+        token = get_random_string(6).lower()
+        cooperativa = Cooperativa.objects.create(nombre=f"Benchmark {token}")
+        Usuario.objects.bulk_create([
+            Usuario(
+                username=f"bench_{token}_{i}",
+                password=make_password(None),
+                cooperativa=cooperativa,
+                rol=Usuario.VECINO,
+                requiere_cambio_pass=False,
+            )
+            for i in range(options['espectadores'])
+        ])
+        usuarios = list(Usuario.objects.filter(cooperativa=cooperativa))
+        votacion = Votacion.objects.create(
+            titulo=f"Benchmark {token}",
+            cooperativa=cooperativa,
+            fecha_fin=timezone.now() + timedelta(hours=1),
+        )
+        opcion = Opcion.objects.create(votacion=votacion, texto="Sí")
+        Opcion.objects.create(votacion=votacion, texto="No")
+        for usuario in usuarios[::3]:
+            registrar_voto(usuario, votacion, opcion.id)
+
+        cookies = []
+        clientes = []
+        for usuario in usuarios:
+            cliente = Client()
+            cliente.force_login(usuario)
+            sesion = cliente.cookies[settings.SESSION_COOKIE_NAME].value
+            cookies.append(f"{settings.SESSION_COOKIE_NAME}={sesion}".encode())
+            clientes.append(cliente)
+
+        # 2. CARGA: todos a la vez, varias rondas, primero una vista y luego la otra
+        try:
+            with override_settings(ROOT_URLCONF=__name__, ALLOWED_HOSTS=['localhost']):
+                # Solo vale comparar si las dos contestan exactamente lo mismo
+                respuestas = [
+                    clientes[0].get(f'/{modo}/{votacion.id}/', HTTP_HOST='localhost').json()
+                    for modo in ('sincrona', 'asincrona')
+                ]
+                if respuestas[0] != respuestas[1]:
+                    raise CommandError("La vista síncrona y la asíncrona no devuelven lo mismo.")
+
+                aplicacion = get_asgi_application()
+                for modo in ('sincrona', 'asincrona'):
+                    ruta = f'/{modo}/{votacion.id}/'
+                    muestras, total = asyncio.run(self.cargar(aplicacion, ruta, cookies, options['rondas']))
+                    peticiones = len(muestras)
+                    self.stdout.write(formatear(f"{modo:>9}", percentiles(muestras))
+                                      + f" | {peticiones / total:.0f} peticiones/s")
+        finally:
+            if not options['conservar']:
+                cooperativa.delete()
+
+    async def cargar(self, aplicacion, ruta, cookies, rondas):
+        # Una primera petición para que la caché de resultados esté caliente en los dos casos
+        await pedir(aplicacion, ruta, cookies[0])
+        muestras = []
+        inicio = time.perf_counter()
+        for _ in range(rondas):
+            muestras += await asyncio.gather(*(pedir(aplicacion, ruta, cookie) for cookie in cookies))
+        return muestras, time.perf_counter() - inicio
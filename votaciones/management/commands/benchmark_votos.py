@@ -0,0 +1,104 @@
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from usuarios.models import Cooperativa, Usuario
+from votaciones.contadores import borrado_en_bloque
+from votaciones.models import Votacion, Opcion, Voto
+from votaciones.servicios import registrar_voto, VotoDuplicado
+
+
+class Command(BaseCommand):
+    help = "Lanza miles de votos en paralelo y comprueba que los contadores cuadran con los Voto guardados."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--votantes', type=int, default=2000)
+        parser.add_argument('--opciones', type=int, default=4)
+        parser.add_argument('--hilos', type=int, default=32)
+        parser.add_argument('--duplicados', type=float, default=0.1,
+                            help="Fracción de vecinos que intentan votar dos veces a la vez.")
+        parser.add_argument('--conservar', action='store_true',
+                            help="No borrar la cooperativa de prueba al terminar.")
+
+    def handle(self, *args, **options):
+        # 1. ESCENARIO: una cooperativa de usar y tirar con sus vecinos y una votación abierta
+        token = get_random_string(6).lower()
+        cooperativa = Cooperativa.objects.create(nombre=f"Benchmark {token}")
+        Usuario.objects.bulk_create([
+            Usuario(
+                username=f"bench_{token}_{i}",
+                password=make_password(None),
+                cooperativa=cooperativa,
+                rol=Usuario.VECINO,
+                requiere_cambio_pass=False,
+            )
+            for i in range(options['votantes'])
+        ])
+        usuarios = list(Usuario.objects.filter(cooperativa=cooperativa))
+
+        votacion = Votacion.objects.create(
+            titulo=f"Benchmark {token}",
+            cooperativa=cooperativa,
+            fecha_fin=timezone.now() + timedelta(hours=1),
+        )
+        opciones = [
+            Opcion.objects.create(votacion=votacion, texto=f"Opción {i + 1}")
+            for i in range(options['opciones'])
+        ]
+
+        # 2. TAREAS: un voto por vecino y unos cuantos repetidos mezclados
+        tareas = [(u, random.choice(opciones).id) for u in usuarios]
+        repetidos = random.sample(usuarios, int(len(usuarios) * options['duplicados']))
+        tareas += [(u, random.choice(opciones).id) for u in repetidos]
+        random.shuffle(tareas)
+
+        def votar(tarea):
+            usuario, opcion_id = tarea
+            try:
+                registrar_voto(usuario, votacion, opcion_id)
+                return 'registrados'
+            except VotoDuplicado:
+                return 'duplicados'
+            except Exception as e:
+                return type(e).__name__
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['hilos']) as pool:
+            resultados = Counter(pool.map(votar, tareas))
+        duracion = time.perf_counter() - inicio
+
+        # 3. COMPROBACIÓN: contador de cada opción contra COUNT(*) real
+        contadores = dict(Opcion.objects.filter(votacion=votacion).values_list('id', 'votos_cantidad'))
+        reales = dict(
+            Voto.objects.filter(votacion=votacion)
+            .values('opcion_elegida_id')
+            .annotate(n=Count('id'))
+            .values_list('opcion_elegida_id', 'n')
+        )
+        desajustes = {
+            op_id: (cantidad, reales.get(op_id, 0))
+            for op_id, cantidad in contadores.items()
+            if cantidad != reales.get(op_id, 0)
+        }
+
+        self.stdout.write(f"Intentos: {len(tareas)} en {duracion:.2f}s ({len(tareas) / duracion:.0f} votos/s)")
+        for clave, cantidad in sorted(resultados.items()):
+            self.stdout.write(f"  {clave}: {cantidad}")
+        self.stdout.write(f"Votos guardados: {sum(reales.values())} | Suma de contadores: {sum(contadores.values())}")
+
+        if not options['conservar']:
+            # En cascada, sin descontar ni avisar voto a voto: se va todo
+            with borrado_en_bloque():
+                cooperativa.delete()
+
+        if desajustes:
+            raise CommandError(f"Contadores descuadrados (contador, real): {desajustes}")
+        self.stdout.write(self.style.SUCCESS("Contadores correctos."))
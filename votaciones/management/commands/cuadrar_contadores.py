@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from votaciones.contadores import cuadrar_contadores, votaciones_a_revisar, TAM_LOTE
+
+
+class Command(BaseCommand):
+    help = "Compara Opcion.votos_cantidad con los votos reales, lote a lote, e informa (y corrige) los descuadres."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=TAM_LOTE, help="Votaciones por consulta agrupada.")
+        parser.add_argument('--todas', action='store_true',
+                            help="Incluir también las cerradas que ya tienen resultado final.")
+        parser.add_argument('--solo-informe', action='store_true', help="Informar sin corregir nada.")
+        parser.add_argument('--cada', type=int, default=0,
+                            help="Repetir cada N segundos (0 = una sola pasada, para cron).")
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                self.pasada(options)
+                if not options['cada']:
+                    break
+                time.sleep(options['cada'])
+        except KeyboardInterrupt:
+            pass
+
+    def pasada(self, options):
+        informe = cuadrar_contadores(
+            votaciones_a_revisar(todas=options['todas']),
+            corregir=not options['solo_informe'],
+            tam_lote=options['lote'],
+        )
+        for id_votacion, id_opcion, contador, real in informe['descuadres']:
+            self.stdout.write(f"Votación {id_votacion}, opción {id_opcion}: contador {contador}, votos reales {real}")
+
+        accion = "corregidos" if informe['corregidos'] else "sin corregir"
+        estilo = self.style.WARNING if informe['descuadres'] else self.style.SUCCESS
+        self.stdout.write(estilo(
+            f"{informe['votaciones']} votaciones revisadas en {informe['lotes']} lotes: "
+            f"{len(informe['descuadres'])} descuadres {accion}."
+        ))
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from votaciones.models import Votacion
+from votaciones.resultados import finalizar_votacion, MARGEN_CIERRE
+
+
+class Command(BaseCommand):
+    help = "Escribe el resultado final de las votaciones ya cerradas que aún no lo tienen (o lo tienen sin detalle)."
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(seconds=MARGEN_CIERRE)
+        pendientes = Votacion.objects.filter(fecha_fin__lte=limite).filter(
+            Q(resultado_final__isnull=True) | Q(resultado_final__detalle__isnull=True)
+        ).values_list('id', flat=True)
+
+        hechas = 0
+        for id_votacion in list(pendientes):
+            if finalizar_votacion(id_votacion) is not None:
+                hechas += 1
+
+        self.stdout.write(self.style.SUCCESS(f"{hechas} votaciones cerradas materializadas."))
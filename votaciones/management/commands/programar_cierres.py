@@ -0,0 +1,20 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from votaciones.cierre import ProgramadorCierres
+
+
+class Command(BaseCommand):
+    help = "Proceso que cierra cada votación justo en su fecha_fin y avisa a los conectados."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recarga', type=int, default=30,
+                            help="Cada cuántos segundos se buscan votaciones nuevas o cambiadas.")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Programador de cierres en marcha (Ctrl+C para parar).")
+        try:
+            asyncio.run(ProgramadorCierres(recarga=options['recarga']).ejecutar())
+        except KeyboardInterrupt:
+            pass
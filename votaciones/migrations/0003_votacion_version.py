@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votaciones', '0002_remove_votacion_activa_votacion_votos_totales_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='votacion',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
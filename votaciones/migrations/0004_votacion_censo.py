@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:09
+
+import sys
+from array import array
+
+from django.db import migrations, models
+
+
+def censo_a_bytes(ids):
+    # Copia del formato de votaciones/censo.py de cuando se escribió esta migración
+    # (enteros de 4 bytes, little-endian, ordenados y sin repetir): si Censo cambia, esto no
+    ids = array('I', sorted(set(ids)))
+    if sys.byteorder == 'big':
+        ids.byteswap()
+    return ids.tobytes()
+
+
+def congelar_censos(apps, schema_editor):
+    # Las votaciones ya creadas no tienen foto: usamos el censo de hoy, que es lo mejor que hay
+    Votacion = apps.get_model('votaciones', 'Votacion')
+    Usuario = apps.get_model('usuarios', 'Usuario')
+    for votacion in Votacion.objects.filter(censo__isnull=True).only('id', 'cooperativa_id'):
+        ids = Usuario.objects.filter(
+            cooperativa_id=votacion.cooperativa_id
+        ).exclude(rol='SA').values_list('id', flat=True)
+        votacion.censo = censo_a_bytes(ids)
+        votacion.save(update_fields=['censo'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0003_cooperativa_presidente_ve_votos'),
+        ('votaciones', '0003_votacion_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='votacion',
+            name='censo',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.RunPython(congelar_censos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votaciones', '0004_votacion_censo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultadoFinal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resumen', models.JSONField()),
+                ('fecha_cierre', models.DateTimeField(auto_now_add=True)),
+                ('votacion', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='resultado_final', to='votaciones.votacion')),
+            ],
+        ),
+    ]
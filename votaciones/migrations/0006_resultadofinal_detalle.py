@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votaciones', '0005_resultadofinal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resultadofinal',
+            name='detalle',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
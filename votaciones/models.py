@@ -1,6 +1,7 @@
 from django.db import models
 from django.utils import timezone  # <--- IMPORTANTE PARA LA HORA
 from usuarios.models import Usuario, Cooperativa
+from .censo import Censo
 
 class Votacion(models.Model):
     titulo = models.CharField(max_length=200, verbose_name="Título de la votación")
@@ -16,6 +17,53 @@ class Votacion(models.Model):
     # Campo de resultados cacheados (opcional, pero útil)
     votos_totales = models.ManyToManyField(Usuario, through='Voto', related_name='votos_emitidos')
 
+    # Sube cada vez que cambian los resultados: el navegador descarta avisos más viejos que lo que ya pinta
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    # Foto del censo al crear la votación (ver votaciones/censo.py): quien entre después no cuenta
+    censo = models.BinaryField(null=True)
+
+    # Campos que cambian lo que ven los conectados (fecha_fin decide si está activa)
+    CAMPOS_EN_VIVO = ('fecha_fin',)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Guardamos cómo venía de la BD para saber luego si un save() cambió algo que importe
+        instancia = super().from_db(db, field_names, values)
+        instancia._valores_guardados = dict(zip(field_names, values))
+        return instancia
+
+    def cambios_en_vivo(self, campos=CAMPOS_EN_VIVO):
+        # Sin foto de la BD no sabemos qué había: lo damos por cambiado
+        guardados = getattr(self, '_valores_guardados', {})
+        return [
+            campo for campo in campos
+            if campo not in guardados or guardados[campo] != getattr(self, campo)
+        ]
+
+    def marcar_guardado(self, campos=CAMPOS_EN_VIVO):
+        guardados = self.__dict__.setdefault('_valores_guardados', {})
+        for campo in campos:
+            guardados[campo] = getattr(self, campo)
+
+    def save(self, *args, **kwargs):
+        # Congelamos el censo en el momento de crearla
+        if self._state.adding and self.censo is None:
+            self.censo = censo_actual(self.cooperativa_id).a_bytes()
+        # version solo sube con UPDATE ... F('version') + 1: una instancia cargada antes
+        # de unos votos no debe devolverla a lo que tenía en memoria al guardarse
+        elif not self._state.adding:
+            campos = kwargs.get('update_fields')
+            if campos is None:
+                campos = [f.name for f in self._meta.concrete_fields if not f.primary_key]
+            kwargs['update_fields'] = [campo for campo in campos if campo != 'version']
+        super().save(*args, **kwargs)
+
+    def obtener_censo(self):
+        if self.censo is None:
+            return censo_actual(self.cooperativa_id)
+        return Censo.desde_bytes(self.censo)
+
     # --- LA MAGIA: PROPIEDAD AUTOMÁTICA ---
     @property
     def activa(self):
@@ -25,6 +73,14 @@ class Votacion(models.Model):
     def __str__(self):
         return self.titulo
 
+def censo_actual(cooperativa_id):
+    # Censo: todos menos superadmin
+    return Censo(
+        Usuario.objects.filter(cooperativa_id=cooperativa_id)
+        .exclude(rol=Usuario.SUPERADMIN)
+        .values_list('id', flat=True)
+    )
+
 class Opcion(models.Model):
     votacion = models.ForeignKey(Votacion, related_name='opciones', on_delete=models.CASCADE)
     texto = models.CharField(max_length=200)
@@ -40,4 +96,15 @@ class Voto(models.Model):
     fecha_voto = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        unique_together = ('usuario', 'votacion')
\ No newline at end of file
+        unique_together = ('usuario', 'votacion')
+
+class ResultadoFinal(models.Model):
+    # Foto de los resultados en el momento del cierre: una votación cerrada ya no cambia
+    votacion = models.OneToOneField(Votacion, on_delete=models.CASCADE, related_name='resultado_final')
+    resumen = models.JSONField()
+    # Quién votó qué, con los nombres tal como estaban al cerrar (solo lo ve el presidente con permiso)
+    detalle = models.JSONField(null=True, blank=True)
+    fecha_cierre = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Resultado final: {self.votacion}"
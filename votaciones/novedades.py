@@ -0,0 +1,49 @@
+# votaciones/novedades.py
+import logging
+
+from channels.layers import get_channel_layer
+from django.utils import timezone
+
+from core.asincrono import enviar_a_grupo
+
+from .resultados import grupo_cooperativa, grupo_usuario
+
+logger = logging.getLogger(__name__)
+
+
+# --- NOVEDADES DE LA COOPERATIVA ---
+# Mensajes cortos (solo ids, título y fecha) para el panel y la lista de votaciones:
+# se pintan en su sitio sin recargar la página. Cada socket de ws/votaciones/ recalcula
+# además las pendientes de su vecino y se las manda si han cambiado.
+
+ABIERTA = 'votacion_abierta'    # nueva, o con otra fecha_fin y todavía activa
+CERRADA = 'votacion_cerrada'
+BORRADA = 'votacion_borrada'
+
+def datos_votacion(votacion):
+    return {
+        'id_votacion': votacion.id,
+        'titulo': votacion.titulo,
+        'fecha_fin': timezone.localtime(votacion.fecha_fin).isoformat(),
+        'activa': votacion.activa,
+    }
+
+def mensaje_novedad(tipo, datos):
+    return {'type': 'evento_novedad', 'datos': {'tipo': tipo, **datos}}
+
+def avisar_cooperativa(cooperativa_id, tipo, datos):
+    # Se llama desde on_commit: un fallo de la capa de canales no tumba la petición
+    try:
+        enviar_a_grupo(grupo_cooperativa(cooperativa_id), mensaje_novedad(tipo, datos))
+    except Exception:
+        logger.exception("No se pudo avisar a la cooperativa %s (%s)", cooperativa_id, tipo)
+
+async def aavisar_cooperativa(cooperativa_id, tipo, datos):
+    await get_channel_layer().group_send(grupo_cooperativa(cooperativa_id), mensaje_novedad(tipo, datos))
+
+def avisar_pendientes(usuario_id):
+    # Ha votado (o se le ha quitado un voto): sus pestañas vuelven a contar las pendientes
+    try:
+        enviar_a_grupo(grupo_usuario(usuario_id), {'type': 'evento_pendientes'})
+    except Exception:
+        logger.exception("No se pudo avisar al usuario %s", usuario_id)
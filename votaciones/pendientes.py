@@ -0,0 +1,92 @@
+# votaciones/pendientes.py
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from usuarios.models import Usuario
+from .censo import Censo
+from .models import Votacion, Voto
+from .resultados import TIEMPO_CACHE, aleer_cache
+
+
+# --- CLAVES ---
+# Cada vecino tiene una entrada con las votaciones en las que ya votó y las abiertas
+# que le faltan. La cooperativa tiene una "generación": al abrirse (o cambiar de fecha,
+# o borrarse) una votación se cambia, y las entradas de todos sus vecinos dejan de valer
+# sin tener que ir borrándolas una a una.
+
+def clave_usuario(usuario_id):
+    return f'votaciones:estado_usuario:{usuario_id}'
+
+def clave_generacion(cooperativa_id):
+    return f'votaciones:generacion:{cooperativa_id}'
+
+def renovar_cooperativa(cooperativa_id):
+    # Un valor nuevo cada vez (y no un contador): aunque la caché lo pierda, nunca se repite
+    cache.set(clave_generacion(cooperativa_id), time.time_ns(), None)
+
+def olvidar_usuario(usuario_id):
+    cache.delete(clave_usuario(usuario_id))
+
+
+# --- ESTADO DE UN VECINO ---
+
+def en_censo(usuario, censo):
+    # censo: los bytes de Votacion.censo. Sin foto (votaciones de antes de congelarlo)
+    # vale el de ahora, que es toda la cooperativa menos el superadmin
+    if censo is None:
+        return usuario.rol != Usuario.SUPERADMIN
+    return usuario.id in Censo.desde_bytes(censo)
+
+def calcular_estado(usuario, generacion):
+    """
+    Dos consultas: las abiertas sin voto suyo (un solo NOT EXISTS) y los ids
+    de todas las votaciones en las que ha votado. Las abiertas de cuyo censo
+    no forma parte no son pendientes: registrar_voto no le dejaría votar.
+    """
+    ya_votada = Voto.objects.filter(usuario_id=usuario.id, votacion=OuterRef('pk'))
+    abiertas = Votacion.objects.filter(
+        cooperativa_id=usuario.cooperativa_id,
+        fecha_fin__gt=timezone.now()
+    ).filter(~Exists(ya_votada)).values_list('id', 'fecha_fin', 'censo')
+
+    return {
+        'generacion': generacion,
+        'cooperativa_id': usuario.cooperativa_id,
+        'votadas': set(Voto.objects.filter(usuario_id=usuario.id).values_list('votacion_id', flat=True)),
+        # Con su fecha_fin: las que van cerrando se descuentan al leer, sin invalidar nada
+        'pendientes': [
+            (id_votacion, fecha_fin) for id_votacion, fecha_fin, censo in abiertas
+            if en_censo(usuario, censo)
+        ],
+    }
+
+def _vigente(estado, usuario, generacion):
+    return (
+        estado is not None
+        and estado['generacion'] == generacion
+        and estado['cooperativa_id'] == usuario.cooperativa_id
+    )
+
+def estado_usuario(usuario):
+    # La generación se lee ANTES de calcular: si cambia mientras tanto, lo guardado ya nace caducado
+    generacion = cache.get_or_set(clave_generacion(usuario.cooperativa_id), time.time_ns, None)
+    estado = cache.get(clave_usuario(usuario.id))
+    if not _vigente(estado, usuario, generacion):
+        estado = calcular_estado(usuario, generacion)
+        cache.set(clave_usuario(usuario.id), estado, TIEMPO_CACHE)
+    return estado
+
+async def aestado_usuario(usuario):
+    generacion = await aleer_cache(clave_generacion(usuario.cooperativa_id))
+    estado = await aleer_cache(clave_usuario(usuario.id))
+    if generacion is not None and _vigente(estado, usuario, generacion):
+        return estado
+    return await sync_to_async(estado_usuario)(usuario)
+
+def contar_pendientes(estado):
+    ahora = timezone.now()
+    return sum(1 for _, fecha_fin in estado['pendientes'] if fecha_fin > ahora)
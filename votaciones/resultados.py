@@ -0,0 +1,400 @@
+# votaciones/resultados.py
+import hashlib
+import json
+from collections import Counter
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from usuarios.models import Usuario
+from .models import Votacion, Voto, ResultadoFinal
+
+# Las claves llevan la versión de la votación: un voto nuevo cambia la clave y lo viejo
+# se queda sin usar hasta que caduca. No hay que borrar nada a mano.
+TIEMPO_CACHE = 60 * 60
+
+# Segundos de cortesía tras fecha_fin para que terminen los votos que iban en vuelo
+# antes de congelar los resultados
+MARGEN_CIERRE = 1.0
+
+DADO_DE_BAJA = "(Vecino dado de baja)"
+
+
+# --- NOMBRES DE LOS GRUPOS DEL WEBSOCKET ---
+
+def grupo_votacion(id_votacion):
+    # Todo el que mira la votación (vecinos y presidente)
+    return f'votacion_{id_votacion}'
+
+def grupo_detalle(id_votacion):
+    # Solo presidentes con permiso para ver quién votó qué
+    return f'votacion_{id_votacion}_detalle'
+
+def grupo_cooperativa(cooperativa_id):
+    # Novedades de la cooperativa: votaciones que se abren, se cierran o se borran
+    return f'cooperativa_{cooperativa_id}'
+
+def grupo_usuario(usuario_id):
+    # Todas las pestañas de un mismo vecino (su número de votaciones pendientes)
+    return f'usuario_{usuario_id}'
+
+
+# --- LECTURA (CON CACHÉ) ---
+
+def _clave(tipo, id_votacion, version):
+    return f'votaciones:{tipo}:{id_votacion}:v{version}'
+
+def clave_cache(tipo, votacion):
+    return _clave(tipo, votacion.id, votacion.version)
+
+def _cacheado(tipo, votacion, calcular):
+    clave = clave_cache(tipo, votacion)
+    datos = cache.get(clave)
+    if datos is None:
+        datos = calcular(votacion)
+        cache.set(clave, datos, TIEMPO_CACHE)
+    return datos
+
+def obtener_resumen(votacion):
+    # Cerrada: la foto del cierre, tal cual
+    final = resultado_final(votacion)
+    if final is not None:
+        return final.resumen
+    # "activa" depende de la hora, así que no se guarda: se mira al leer
+    return {**_cacheado('resumen', votacion, calcular_resumen), 'activa': votacion.activa}
+
+def obtener_detalle(votacion):
+    final = resultado_final(votacion)
+    if final is not None and final.detalle is not None:
+        return final.detalle
+    return _cacheado('detalle', votacion, calcular_detalle)
+
+# Lo mismo para las vistas asíncronas: si está en caché (o la votación viene con su
+# resultado_final por select_related) se responde sin salir del bucle de eventos.
+# Solo los cálculos, cuando toca hacerlos, van a un hilo.
+
+async def aleer_cache(clave):
+    # La caché en memoria no hace E/S: se lee en el propio bucle, sin saltar a un hilo
+    if isinstance(caches['default'], LocMemCache):
+        return cache.get(clave)
+    return await cache.aget(clave)
+
+async def _acacheado(tipo, votacion, calcular):
+    clave = clave_cache(tipo, votacion)
+    datos = await aleer_cache(clave)
+    if datos is None:
+        datos = await sync_to_async(calcular)(votacion)
+        await cache.aset(clave, datos, TIEMPO_CACHE)
+    return datos
+
+async def aobtener_resumen(votacion):
+    final = await aresultado_final(votacion)
+    if final is not None:
+        return final.resumen
+    return {**await _acacheado('resumen', votacion, calcular_resumen), 'activa': votacion.activa}
+
+async def aobtener_detalle(votacion):
+    final = await aresultado_final(votacion)
+    if final is not None and final.detalle is not None:
+        return final.detalle
+    return await _acacheado('detalle', votacion, calcular_detalle)
+
+def datos_grafica(resumen):
+    # Barras de "Resultados Públicos": votos y porcentaje de cada opción
+    total_votos = resumen['total_votos']
+    datos = []
+    for texto, votos in zip(resumen['nombres_opciones'], resumen['votos_opciones']):
+        porcentaje = (votos / total_votos * 100) if total_votos > 0 else 0
+        datos.append({'texto': texto, 'votos': votos, 'porcentaje': round(porcentaje, 1)})
+    return datos
+
+def detalle_vacio():
+    return {'mapa_votos': {}, 'lista_participacion': [], 'lista_abstencion': []}
+
+
+# --- CÁLCULO DE RESULTADOS ---
+
+def calcular_resumen(votacion):
+    """
+    Cuentas públicas de la votación: votos por opción, total y abstención.
+    Es lo que se empuja por el WebSocket a todos los conectados.
+    """
+    opciones = list(votacion.opciones.order_by('id').values_list('id', 'texto', 'votos_cantidad'))
+    # Cada voto suma en su opción: el total sale de los contadores, sin COUNT(*) de votos
+    # (el comando cuadrar_contadores se encarga de que no se descuadren)
+    total_votos = sum(cantidad for _, _, cantidad in opciones)
+
+    # El censo viaja congelado dentro de la votación: contarlo no cuesta consultas
+    total_censo = len(votacion.obtener_censo())
+
+    return {
+        'id_votacion': votacion.id,
+        'version': votacion.version,
+        'activa': votacion.activa,
+        'total_votos': total_votos,
+        'total_censo': total_censo,
+        'abstencion': total_censo - total_votos,
+        'ids_opciones': [opcion_id for opcion_id, _, _ in opciones],
+        'nombres_opciones': [texto for _, texto, _ in opciones],
+        'votos_opciones': [cantidad for _, _, cantidad in opciones],
+    }
+
+def calcular_detalle(votacion, resumen=None):
+    """
+    Quién votó qué, todo con ids de vecino (los nombres van aparte, una vez cada uno).
+
+    Son dos consultas, votos y censo, tenga la votación 2 opciones o 20: los
+    votantes se reparten por opción aquí, no con una consulta por opción.
+    Las opciones salen del resumen, que normalmente ya está en caché.
+    """
+    if resumen is None:
+        resumen = obtener_resumen(votacion)
+    posiciones = {opcion_id: i for i, opcion_id in enumerate(resumen['ids_opciones'])}
+    votantes = [[] for _ in posiciones]
+    nombres = {}
+
+    # 1. Todos los votos de la votación, con el nombre del que votó
+    votos = Voto.objects.filter(votacion=votacion).values_list(
+        'opcion_elegida_id', 'usuario_id', 'usuario__first_name', 'usuario__last_name'
+    ).order_by('id')
+    for opcion_id, usuario_id, nombre, apellido in votos:
+        votantes[posiciones[opcion_id]].append(usuario_id)
+        nombres[usuario_id] = f"{nombre} {apellido}"
+
+    # 2. Participación y abstención son cruces de conjuntos con el censo congelado;
+    #    solo hace falta ir a la BD a por los nombres de los que no han votado
+    participacion, abstencion = votacion.obtener_censo().repartir(nombres)
+    if abstencion:
+        pendientes = Usuario.objects.filter(id__in=abstencion).values_list('id', 'first_name', 'last_name')
+        for usuario_id, nombre, apellido in pendientes:
+            nombres[usuario_id] = f"{nombre} {apellido}"
+
+    return {
+        'id_votacion': votacion.id,
+        'version': votacion.version,
+        'opciones': [list(par) for par in zip(resumen['ids_opciones'], resumen['nombres_opciones'])],
+        'votantes': votantes,
+        'participacion': participacion,
+        'abstencion': abstencion,
+        # Lista de pares y no dict: las claves numéricas no sobreviven a JSON
+        'nombres': [list(par) for par in nombres.items()],
+    }
+
+def calcular_final(votacion):
+    # Todo lo que se congela al cerrar: cuentas, porcentajes y quién votó qué
+    resumen = calcular_resumen(votacion)
+    resumen['activa'] = False
+    resumen['porcentajes'] = [barra['porcentaje'] for barra in datos_grafica(resumen)]
+    return resumen, calcular_detalle(votacion, resumen)
+
+def formatear_detalle(detalle, id_usuario):
+    """
+    Pasa el detalle a nombres legibles, resaltando al usuario que lo va a ver.
+    """
+    directorio = dict(detalle['nombres'])
+
+    def nombres(ids, marca=''):
+        # Si alguien del censo se ha dado de baja ya no tenemos su nombre
+        return [
+            directorio.get(uid, DADO_DE_BAJA) + (marca if uid == id_usuario else '')
+            for uid in ids
+        ]
+
+    return {
+        'version': detalle['version'],
+        'mapa_votos': {
+            texto: nombres(ids, " <strong>(MI VOTO)</strong>")
+            for (_, texto), ids in zip(detalle['opciones'], detalle['votantes'])
+        },
+        'lista_participacion': nombres(detalle['participacion'], " <strong>(YO)</strong>"),
+        'lista_abstencion': nombres(detalle['abstencion']),
+    }
+
+def puede_ver_detalle(usuario, votacion):
+    return (
+        usuario.is_authenticated
+        and usuario.es_presidente
+        and usuario.cooperativa_id == votacion.cooperativa_id
+        and votacion.cooperativa.presidente_ve_votos
+    )
+
+def etiqueta_resultados(votacion, usuario, con_detalle):
+    """
+    ETag de la API: cambia con cada voto o cambio de estado (version), al pasar la
+    fecha_fin (activa) y con lo que este usuario puede ver.
+    """
+    return f'"{votacion.id}-{votacion.version}-{votacion.activa:d}-{con_detalle:d}-{usuario.id}"'
+
+
+# --- FORMATO COMPACTO (IDS + DIRECTORIO DE NOMBRES) ---
+
+def clave_directorio(cooperativa_id):
+    return f'votaciones:directorio:{cooperativa_id}'
+
+def obtener_directorio(cooperativa_id):
+    """
+    Nombres de los vecinos de la cooperativa como pares [id, nombre], con su ETag.
+
+    El navegador lo pide una vez y a partir de ahí los resultados le llegan solo
+    con ids. Se borra de la caché cuando cambia algún vecino (ver signals.py).
+    """
+    clave = clave_directorio(cooperativa_id)
+    directorio = cache.get(clave)
+    if directorio is None:
+        nombres = [
+            [usuario_id, f"{nombre} {apellido}"]
+            for usuario_id, nombre, apellido in Usuario.objects.filter(cooperativa_id=cooperativa_id)
+            .exclude(rol=Usuario.SUPERADMIN)
+            .order_by('id')
+            .values_list('id', 'first_name', 'last_name')
+        ]
+        huella = hashlib.sha1(json.dumps(nombres).encode()).hexdigest()[:16]
+        directorio = {'etiqueta': f'"{huella}"', 'nombres': nombres}
+        cache.set(clave, directorio, TIEMPO_CACHE)
+    return directorio
+
+async def aobtener_directorio(cooperativa_id):
+    directorio = await aleer_cache(clave_directorio(cooperativa_id))
+    if directorio is None:
+        directorio = await sync_to_async(obtener_directorio)(cooperativa_id)
+    return directorio
+
+def compactar_detalle(detalle, directorio):
+    """
+    El detalle solo con ids: el nombre y el "(MI VOTO)" los pone el navegador.
+    Solo viajan los nombres que no están en el directorio (vecinos ya dados de baja
+    que siguen en la foto de una votación cerrada).
+    """
+    conocidos = {usuario_id for usuario_id, _ in directorio['nombres']}
+    return {
+        'version': detalle['version'],
+        'votantes': detalle['votantes'],
+        'ids_abstencion': detalle['abstencion'],
+        'nombres': [par for par in detalle['nombres'] if par[0] not in conocidos],
+    }
+
+
+# --- CAMBIOS DESDE UNA VERSIÓN ---
+
+def diferencias(anterior, actual):
+    # Como multiconjuntos: dos vecinos pueden llamarse igual
+    antes, ahora = Counter(anterior), Counter(actual)
+    return {'altas': list((ahora - antes).elements()), 'bajas': list((antes - ahora).elements())}
+
+def cambios_desde(votacion, desde, id_usuario, con_detalle):
+    """
+    Lo que ha cambiado desde la versión "desde": estado, opciones cuyos votos se
+    han movido y, si hay permiso, los nombres que entran o salen de cada lista.
+
+    La base es lo que se sirvió en esa versión, que sigue en la caché (lo pusieron
+    ahí la API o el WebSocket al mandarlo). Si ya no está devuelve None y toca
+    mandar los datos completos.
+    """
+    resumen = obtener_resumen(votacion)
+    cambios = {
+        'parcial': True,
+        'desde': desde,
+        'version': resumen['version'],
+        'activa': resumen['activa'],
+        'total_votos': resumen['total_votos'],
+        'abstencion': resumen['abstencion'],
+        'votos_cambiados': [],
+    }
+    if con_detalle:
+        cambios['detalle'] = {'mapa_votos': {}, 'lista_participacion': diferencias([], []),
+                              'lista_abstencion': diferencias([], [])}
+    if desde == resumen['version']:
+        return cambios
+    if desde > resumen['version']:
+        return None
+
+    base = cache.get(_clave('resumen', votacion.id, desde))
+    if base is None or base['ids_opciones'] != resumen['ids_opciones']:
+        return None
+    cambios['votos_cambiados'] = [
+        [opcion_id, votos]
+        for opcion_id, votos, antes in zip(resumen['ids_opciones'], resumen['votos_opciones'], base['votos_opciones'])
+        if votos != antes
+    ]
+
+    if con_detalle:
+        base = cache.get(_clave('detalle', votacion.id, desde))
+        if base is None:
+            return None
+        viejo = formatear_detalle(base, id_usuario)
+        nuevo = formatear_detalle(obtener_detalle(votacion), id_usuario)
+        for texto, nombres in nuevo['mapa_votos'].items():
+            cambio = diferencias(viejo['mapa_votos'].get(texto, []), nombres)
+            if cambio['altas'] or cambio['bajas']:
+                cambios['detalle']['mapa_votos'][texto] = cambio
+        for lista in ('lista_participacion', 'lista_abstencion'):
+            cambios['detalle'][lista] = diferencias(viejo[lista], nuevo[lista])
+
+    return cambios
+
+
+
+# --- RESULTADOS FINALES (VOTACIONES CERRADAS) ---
+
+def finalizar_votacion(id_votacion):
+    """
+    Escribe el ResultadoFinal de una votación ya vencida (solo la primera vez).
+    Devuelve el resultado, o None si la votación no existe o aún no ha vencido.
+    """
+    with transaction.atomic():
+        votacion = Votacion.objects.select_for_update().filter(id=id_votacion).first()
+        if votacion is None or votacion.activa:
+            return None
+
+        existente = ResultadoFinal.objects.filter(votacion=votacion).first()
+        if existente is not None:
+            if existente.detalle is None:
+                # Cerrada antes de que se guardara el detalle: lo completamos con lo que hay
+                existente.detalle = calcular_detalle(votacion, existente.resumen)
+                existente.resumen.setdefault(
+                    'porcentajes', [barra['porcentaje'] for barra in datos_grafica(existente.resumen)]
+                )
+                existente.save(update_fields=['resumen', 'detalle'])
+            return existente
+
+        resumen, detalle = calcular_final(votacion)
+        try:
+            with transaction.atomic():
+                return ResultadoFinal.objects.create(votacion=votacion, resumen=resumen, detalle=detalle)
+        except IntegrityError:
+            # Otro proceso lo ha escrito a la vez que nosotros
+            return ResultadoFinal.objects.get(votacion=votacion)
+
+def resultado_final(votacion):
+    """
+    El ResultadoFinal de una votación cerrada, o None si aún hay que leerla en vivo.
+
+    Si el programador de cierres no ha pasado todavía se escribe aquí mismo,
+    así la primera visita tras el cierre deja la foto hecha para las demás.
+    """
+    if votacion.activa:
+        return None
+    try:
+        return votacion.resultado_final
+    except ResultadoFinal.DoesNotExist:
+        pass
+
+    if timezone.now() < votacion.fecha_fin + timedelta(seconds=MARGEN_CIERRE):
+        return None
+    final = finalizar_votacion(votacion.id)
+    if final is not None:
+        votacion.resultado_final = final
+    return final
+
+async def aresultado_final(votacion):
+    if votacion.activa:
+        return None
+    if Votacion.resultado_final.is_cached(votacion):
+        final = getattr(votacion, 'resultado_final', None)
+        if final is not None:
+            return final
+    return await sync_to_async(resultado_final)(votacion)
@@ -0,0 +1,84 @@
+# votaciones/servicios.py
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Votacion, Opcion, Voto
+
+
+# --- ERRORES DE VOTO ---
+# Todos heredan de VotoRechazado para que la vista pueda capturarlos de golpe
+# y mostrar el mensaje tal cual al vecino.
+
+class VotoRechazado(Exception):
+    pass
+
+class VotacionCerrada(VotoRechazado):
+    pass
+
+class OpcionInvalida(VotoRechazado):
+    pass
+
+class VotoDuplicado(VotoRechazado):
+    pass
+
+class FueraDelCenso(VotoRechazado):
+    pass
+
+
+# --- REGISTRO DE VOTOS ---
+
+def registrar_voto(usuario, votacion, opcion_id):
+    """
+    Guarda el voto y suma 1 al contador de la opción en una sola transacción.
+
+    No se consulta antes si el usuario ya votó: el unique_together de Voto es
+    el que decide, así dos peticiones simultáneas nunca cuentan doble.
+    """
+    if not votacion.activa:
+        raise VotacionCerrada("La votación ha finalizado.")
+
+    # Solo votan los que estaban en la cooperativa cuando se abrió la votación
+    if usuario.id not in votacion.obtener_censo():
+        raise FueraDelCenso("No estabas en el censo cuando se abrió esta votación.")
+
+    try:
+        opcion_id = int(opcion_id)
+    except (TypeError, ValueError):
+        raise OpcionInvalida("Debes elegir una opción válida.")
+
+    try:
+        with transaction.atomic():
+            # 1. Subimos la versión (los resultados cacheados dejan de valer) ANTES de insertar:
+            #    el bloqueo exclusivo de la votación tiene que ir el primero. Después, el INSERT
+            #    del voto comprueba la clave ajena con un bloqueo compartido sobre esa misma
+            #    fila, y si el UPDATE fuera detrás, dos votos a la vez se esperarían el uno al
+            #    otro (deadlock en InnoDB). En SQLite, además, una transacción que empieza
+            #    leyendo no puede pasar luego a escribir si otra ya escribe: falla sin esperar
+            Votacion.objects.filter(id=votacion.id).update(version=F('version') + 1)
+
+            # 2. La votación que se cargó al principio de la petición puede haber cerrado
+            #    mientras tanto: se vuelve a mirar fecha_fin en la fila ya bloqueada, así
+            #    nadie la cierra (ni la alarga) hasta que este voto termine
+            fecha_fin = Votacion.objects.select_for_update().filter(
+                id=votacion.id
+            ).values_list('fecha_fin', flat=True).first()
+            if fecha_fin is None or fecha_fin <= timezone.now():
+                raise VotacionCerrada("La votación ha finalizado.")
+
+            # 3. Sumamos en la propia base de datos (UPDATE ... SET votos = votos + 1).
+            #    Si la opción no es de esta votación no se toca ninguna fila.
+            actualizadas = Opcion.objects.filter(
+                id=opcion_id,
+                votacion=votacion
+            ).update(votos_cantidad=F('votos_cantidad') + 1)
+
+            if not actualizadas:
+                raise OpcionInvalida("Debes elegir una opción válida.")
+
+            # 4. Insertamos el voto. Si ya existía, el IntegrityError deshace también la suma.
+            voto = Voto.objects.create(usuario=usuario, votacion=votacion, opcion_elegida_id=opcion_id)
+    except IntegrityError:
+        raise VotoDuplicado("Ya has votado.")
+
+    return voto
@@ -1,32 +1,98 @@
 # votaciones/signals.py
-from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from .models import Voto, Votacion
+from usuarios.models import Usuario
+from .models import Voto, Votacion, ResultadoFinal
+from .contadores import borrando_en_bloque
+from .difusion import difusor
+from . import novedades
+from .pendientes import olvidar_usuario, renovar_cooperativa
+from .resultados import clave_directorio
+
+# Los avisos no salen aquí: se encolan cuando la transacción se confirma (así nadie se
+# entera de un voto que aún no puede leer) y el difusor los manda desde su propio hilo.
+
+def invalidar(funcion, *args):
+    # Ya y otra vez al confirmar: si alguien lee entre medias y cachea lo de antes,
+    # el segundo borrado se lo lleva
+    funcion(*args)
+    transaction.on_commit(lambda: funcion(*args))
 
 @receiver(post_save, sender=Voto)
 def avisar_nuevo_voto(sender, instance, created, **kwargs):
     if created:
-        channel_layer = get_channel_layer()
-        grupo = f'votacion_{instance.votacion.id}'
-        
-        async_to_sync(channel_layer.group_send)(
-            grupo,
-            {
-                'type': 'evento_actualizacion', # Llama al método del Consumer
-            }
-        )
+        # La versión ya la ha subido registrar_voto, antes del INSERT (ver servicios.py)
+        id_votacion = instance.votacion_id
+        invalidar(olvidar_usuario, instance.usuario_id)
+        transaction.on_commit(lambda: difusor.notificar(id_votacion))
+        transaction.on_commit(lambda: novedades.avisar_pendientes(instance.usuario_id))
+
+@receiver(post_delete, sender=Voto)
+def avisar_voto_borrado(sender, instance, **kwargs):
+    # descontar_votos (bajas de vecinos) ya lo hace una vez para todos
+    if borrando_en_bloque():
+        return
+    # Al subir la versión, los resultados cacheados de esta votación dejan de usarse
+    id_votacion = instance.votacion_id
+    Votacion.objects.filter(id=id_votacion).update(version=F('version') + 1)
+    invalidar(olvidar_usuario, instance.usuario_id)
+    transaction.on_commit(lambda: difusor.notificar(id_votacion))
+    transaction.on_commit(lambda: novedades.avisar_pendientes(instance.usuario_id))
 
 @receiver(post_save, sender=Votacion)
-def avisar_cambio_estado(sender, instance, **kwargs):
-    # Avisar si el admin cierra la votación o cambia algo
-    channel_layer = get_channel_layer()
-    grupo = f'votacion_{instance.id}'
-    
-    async_to_sync(channel_layer.group_send)(
-        grupo,
-        {
-            'type': 'evento_actualizacion',
-        }
-    )
\ No newline at end of file
+def avisar_cambio_estado(sender, instance, created, update_fields=None, **kwargs):
+    # Avisar si el admin cierra la votación o cambia algo que se vea en vivo
+    # (una votación recién creada todavía no tiene a nadie escuchando)
+    campos = [c for c in Votacion.CAMPOS_EN_VIVO if update_fields is None or c in update_fields]
+    cambios = [] if created else instance.cambios_en_vivo(campos)
+    instance.marcar_guardado(campos)
+
+    # Nueva o con otra fecha_fin: cambian las pendientes de todos los vecinos
+    if created or cambios:
+        invalidar(renovar_cooperativa, instance.cooperativa_id)
+        # Si ya ha vencido, el "cerrada" lo manda el programador de cierres con los resultados
+        if instance.activa:
+            cooperativa_id, datos = instance.cooperativa_id, novedades.datos_votacion(instance)
+            transaction.on_commit(
+                lambda: novedades.avisar_cooperativa(cooperativa_id, novedades.ABIERTA, datos)
+            )
+    if not cambios:
+        return
+
+    id_votacion = instance.id
+    # Reabierta (fecha_fin movida al futuro): la foto del cierre anterior ya no vale,
+    # al volver a cerrar se hace otra con los votos nuevos
+    if instance.activa:
+        ResultadoFinal.objects.filter(votacion_id=id_votacion).delete()
+    Votacion.objects.filter(id=id_votacion).update(version=F('version') + 1)
+    transaction.on_commit(lambda: difusor.notificar(id_votacion))
+
+@receiver(post_delete, sender=Votacion)
+def avisar_votacion_borrada(sender, instance, **kwargs):
+    invalidar(renovar_cooperativa, instance.cooperativa_id)
+    cooperativa_id, datos = instance.cooperativa_id, {'id_votacion': instance.id}
+    transaction.on_commit(lambda: novedades.avisar_cooperativa(cooperativa_id, novedades.BORRADA, datos))
+
+# Campos de Usuario que salen en el directorio de nombres del formato compacto
+CAMPOS_DIRECTORIO = {'first_name', 'last_name', 'cooperativa', 'rol'}
+
+@receiver(post_save, sender=Usuario)
+def renovar_directorio(sender, instance, update_fields=None, **kwargs):
+    # El login guarda last_login en cada entrada: eso no toca el directorio
+    if update_fields is not None and not CAMPOS_DIRECTORIO.intersection(update_fields):
+        return
+    cache.delete(clave_directorio(instance.cooperativa_id))
+
+    # Si se ha cambiado de cooperativa, en la de antes tampoco debe seguir saliendo
+    guardados = instance.__dict__.setdefault('_valores_guardados', {})
+    anterior = guardados.get('cooperativa_id', instance.cooperativa_id)
+    if anterior != instance.cooperativa_id:
+        cache.delete(clave_directorio(anterior))
+    guardados['cooperativa_id'] = instance.cooperativa_id
+
+@receiver(post_delete, sender=Usuario)
+def renovar_directorio_baja(sender, instance, **kwargs):
+    cache.delete(clave_directorio(instance.cooperativa_id))
@@ -1,3 +1,1296 @@
-from django.test import TestCase
+import asyncio
+import gc
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.asincrono import recordar_bucle
+from core.capa_sqlite import SQLiteChannelLayer
+from usuarios.models import Cooperativa, Usuario
+from .models import Votacion, Opcion, Voto, ResultadoFinal
+from . import actas
+from .apps import comprobar_cache_compartida
+from . import cierre, conexiones, eventos
+from .conexiones import Aforo, CIERRE_INACTIVO
+from .consumers import VotacionConsumer, VotacionesConsumer
+from .censo import Censo
+from .contadores import cuadrar_contadores, votaciones_a_revisar
+from .cierre import ProgramadorCierres, finalizar_votacion
+from .difusion import DifusorAgrupado, difusor, difundir_resultados
+from .resultados import grupo_votacion, grupo_detalle, grupo_cooperativa, calcular_detalle, calcular_resumen, obtener_resumen
+from .servicios import registrar_voto, VotacionCerrada, OpcionInvalida, VotoDuplicado, FueraDelCenso
+
+
+def crear_votacion(cooperativa, textos=('Sí', 'No'), **kwargs):
+    kwargs.setdefault('fecha_fin', timezone.now() + timedelta(days=1))
+    votacion = Votacion.objects.create(titulo="Derrama Tejado", cooperativa=cooperativa, **kwargs)
+    for texto in textos:
+        Opcion.objects.create(votacion=votacion, texto=texto)
+    return votacion
+
+
+class RegistrarVotoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooperativa = Cooperativa.objects.create(nombre="Los Olivos")
+        cls.vecino = Usuario.objects.create_user('vecino', password='x', cooperativa=cls.cooperativa)
+        cls.votacion = crear_votacion(cls.cooperativa)
+        cls.si, cls.no = cls.votacion.opciones.order_by('id')
+
+    def test_suma_el_voto_en_la_opcion(self):
+        registrar_voto(self.vecino, self.votacion, self.si.id)
+
+        self.si.refresh_from_db()
+        self.assertEqual(self.si.votos_cantidad, 1)
+        self.assertTrue(Voto.objects.filter(usuario=self.vecino, votacion=self.votacion).exists())
+
+    def test_segundo_voto_no_cuenta(self):
+        registrar_voto(self.vecino, self.votacion, self.si.id)
+
+        with self.assertRaises(VotoDuplicado):
+            registrar_voto(self.vecino, self.votacion, self.no.id)
+
+        self.si.refresh_from_db()
+        self.no.refresh_from_db()
+        self.assertEqual((self.si.votos_cantidad, self.no.votos_cantidad), (1, 0))
+
+    def test_sube_la_version_antes_de_insertar(self):
+        # Con el UPDATE detrás del INSERT dos votos a la vez se bloquean en InnoDB
+        with CaptureQueriesContext(connection) as consultas:
+            registrar_voto(self.vecino, self.votacion, self.si.id)
+
+        sentencias = [consulta['sql'] for consulta in consultas.captured_queries]
+        version = next(i for i, sql in enumerate(sentencias) if sql.startswith('UPDATE "votaciones_votacion"'))
+        insercion = next(i for i, sql in enumerate(sentencias) if sql.startswith('INSERT INTO "votaciones_voto"'))
+        self.assertLess(version, insercion)
+        self.assertEqual(Votacion.objects.get(id=self.votacion.id).version, 1)
+
+    def test_cierra_mientras_se_vota(self):
+        # La votación se cargó abierta, pero cuando llega a guardar el voto ya ha cerrado
+        Votacion.objects.filter(id=self.votacion.id).update(fecha_fin=timezone.now() - timedelta(seconds=1))
+
+        with self.assertRaises(VotacionCerrada):
+            registrar_voto(self.vecino, self.votacion, self.si.id)
+
+        self.assertTrue(self.votacion.activa)
+        self.assertFalse(Voto.objects.exists())
+        self.assertEqual(Votacion.objects.get(id=self.votacion.id).version, 0)
+        self.si.refresh_from_db()
+        self.assertEqual(self.si.votos_cantidad, 0)
+
+    def test_opcion_de_otra_votacion(self):
+        otra = crear_votacion(self.cooperativa)
+
+        with self.assertRaises(OpcionInvalida):
+            registrar_voto(self.vecino, self.votacion, otra.opciones.first().id)
+
+        self.assertFalse(Voto.objects.exists())
+
+    def test_votacion_cerrada(self):
+        cerrada = crear_votacion(self.cooperativa, fecha_fin=timezone.now() - timedelta(minutes=1))
+
+        with self.assertRaises(VotacionCerrada):
+            registrar_voto(self.vecino, cerrada, cerrada.opciones.first().id)
+
+
+@override_settings(VOTACIONES_DIFUSION={'SINCRONO': True})
+class DifusionResultadosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooperativa = Cooperativa.objects.create(nombre="Los Olivos", presidente_ve_votos=True)
+        cls.vecino = Usuario.objects.create_user('vecino', password='x', cooperativa=cls.cooperativa,
+                                                 first_name='Ana', last_name='Gil')
+        cls.votacion = crear_votacion(cls.cooperativa)
+
+    def setUp(self):
+        cache.clear()
+        self.layer = get_channel_layer()
+        async_to_sync(self.layer.flush)()
+
+    def escuchar(self, grupo):
+        canal = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(grupo, canal)
+        return canal
+
+    def recibir(self, canal):
+        return async_to_sync(self.layer.receive)(canal)
+
+    def test_el_aviso_lleva_los_resultados(self):
+        canal = self.escuchar(grupo_votacion(self.votacion.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_voto(self.vecino, self.votacion, self.votacion.opciones.order_by('id').first().id)
+
+        datos = self.recibir(canal)['datos']
+        self.assertEqual(datos['version'], 1)
+        self.assertEqual(datos['votos_opciones'], [1, 0])
+        self.assertEqual((datos['total_votos'], datos['abstencion']), (1, 0))
+
+    def test_el_detalle_va_por_su_propio_grupo(self):
+        canal = self.escuchar(grupo_detalle(self.votacion.id))
+        si = self.votacion.opciones.order_by('id').first()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_voto(self.vecino, self.votacion, si.id)
+
+        mensaje = self.recibir(canal)
+        self.assertEqual(mensaje['type'], 'evento_detalle')
+        self.assertEqual(mensaje['datos']['votantes'], [[self.vecino.id], []])
+        self.assertIn([self.vecino.id, 'Ana Gil'], mensaje['datos']['nombres'])
+
+    def test_no_avisa_antes_del_commit(self):
+        with mock.patch.object(difusor, 'notificar') as notificar:
+            with self.captureOnCommitCallbacks(execute=True):
+                registrar_voto(self.vecino, self.votacion, self.votacion.opciones.first().id)
+                notificar.assert_not_called()
+
+        notificar.assert_called_once_with(self.votacion.id)
+
+    def test_cambio_de_estado_solo_si_cambia_algo_en_vivo(self):
+        votacion = Votacion.objects.get(id=self.votacion.id)
+
+        with mock.patch.object(difusor, 'notificar') as notificar:
+            with self.captureOnCommitCallbacks(execute=True):
+                votacion.titulo = "Otro título"
+                votacion.save()
+            notificar.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                votacion.fecha_fin = timezone.now()
+                votacion.save()
+            notificar.assert_called_once_with(votacion.id)
+
+
+class ResultadosCacheadosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooperativa = Cooperativa.objects.create(nombre="Los Olivos", presidente_ve_votos=True)
+        cls.presidente = Usuario.objects.create_user('presi', password='x', cooperativa=cls.cooperativa,
+                                                     rol=Usuario.PRESIDENTE, first_name='Eva', last_name='Ruiz')
+        cls.votacion = crear_votacion(cls.cooperativa)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.presidente)
+        self.url = reverse('datos_en_vivo', args=[self.votacion.id])
+
+    def test_segunda_lectura_sale_de_cache(self):
+        self.client.get(self.url)
+
+        # Sesión, usuario y la votación: los resultados ya no tocan la BD
+        with self.assertNumQueries(3):
+            datos = self.client.get(self.url).json()
+        self.assertEqual(datos['abstencion'], 1)
+
+    def test_un_voto_cambia_la_version(self):
+        self.client.get(self.url)
+        opcion = self.votacion.opciones.order_by('id').first()
+
+        registrar_voto(self.presidente, self.votacion, opcion.id)
+
+        datos = self.client.get(self.url).json()
+        self.assertEqual(datos['version'], 1)
+        self.assertEqual(datos['votos_opciones'], [1, 0])
+        self.assertEqual(datos['mapa_votos'][opcion.texto], ['Eva Ruiz <strong>(MI VOTO)</strong>'])
+
+    def test_borrar_un_voto_cambia_la_version(self):
+        opcion = self.votacion.opciones.first()
+        voto = registrar_voto(self.presidente, self.votacion, opcion.id)
+        self.client.get(self.url)
+
+        voto.delete()
+
+        self.assertEqual(self.client.get(self.url).json()['version'], 2)
+
+    def test_guardar_una_instancia_vieja_no_baja_la_version(self):
+        otro = Usuario.objects.create_user('otro', cooperativa=self.cooperativa)
+        votacion = crear_votacion(self.cooperativa)
+        vieja = Votacion.objects.get(id=votacion.id)
+        opciones = list(votacion.opciones.order_by('id'))
+        registrar_voto(self.presidente, votacion, opciones[0].id)
+
+        vieja.titulo = "Derrama Tejado y Fachada"
+        vieja.save()
+        registrar_voto(otro, votacion, opciones[1].id)
+
+        votacion = Votacion.objects.get(id=votacion.id)
+        self.assertEqual(votacion.version, 2)
+        self.assertEqual(votacion.titulo, "Derrama Tejado y Fachada")
+        self.assertEqual(obtener_resumen(votacion)['total_votos'], 2)
+
+
+class VistasAsincronasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooperativa = Cooperativa.objects.create(nombre="Los Olivos", presidente_ve_votos=True)
+        cls.presidente = Usuario.objects.create_user('presi', password='x', cooperativa=cls.cooperativa,
+                                                     rol=Usuario.PRESIDENTE, first_name='Eva', last_name='Ruiz')
+        cls.votacion = crear_votacion(cls.cooperativa)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.presidente)
+        self.url = reverse('ver_votacion', args=[self.votacion.id])
+
+    def test_la_pagina_se_pinta_sin_consultas_desde_la_plantilla(self):
+        respuesta = self.client.get(self.url)
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, "Derrama Tejado")
+        self.assertEqual([o.texto for o in respuesta.context['opciones']], ['Sí', 'No'])
+
+    def test_votar_desde_la_vista(self):
+        opcion = self.votacion.opciones.order_by('id').last()
+
+        respuesta = self.client.post(self.url, {'btn_votar': '1', 'opcion_seleccionada': opcion.id}, follow=True)
+
+        self.assertRedirects(respuesta, self.url)
+        self.assertContains(respuesta, "¡Tu voto ha sido registrado!")
+        self.assertTrue(Voto.objects.filter(usuario=self.presidente, opcion_elegida=opcion).exists())
+        # La entrada en caché del vecino se ha renovado con el voto
+        self.assertTrue(respuesta.context['ya_voto'])
+
+class RespuestasCondicionalesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooperativa = Cooperativa.objects.create(nombre="Los Olivos", presidente_ve_votos=True)
+        cls.presidente = Usuario.objects.create_user('presi', password='x', cooperativa=cls.cooperativa,
+                                                     rol=Usuario.PRESIDENTE, first_name='Eva', last_name='Ruiz')
+        cls.vecino = Usuario.objects.create_user('vecino', cooperativa=cls.cooperativa,
+                                                 first_name='Luis', last_name='Gil')
+        cls.votacion = crear_votacion(cls.cooperativa)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.presidente)
+        self.url = reverse('datos_en_vivo', args=[self.votacion.id])
+
+    def test_304_si_no_ha_cambiado(self):
+        etiqueta = self.client.get(self.url)['ETag']
+
+        # Sesión, usuario y la votación: ni resultados ni cuerpo
+        with self.assertNumQueries(3):
+            respuesta = self.client.get(self.url, HTTP_IF_NONE_MATCH=etiqueta)
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta.content, b'')
+
+        registrar_voto(self.vecino, self.votacion, self.votacion.opciones.first().id)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etiqueta).status_code, 200)
+
+    def test_since_manda_solo_los_cambios(self):
+        version = self.client.get(self.url).json()['version']
+        si, no = self.votacion.opciones.order_by('id')
+
+        registrar_voto(self.vecino, self.votacion, no.id)
+
+        datos = self.client.get(self.url, {'since': version}).json()
+        self.assertTrue(datos['parcial'])
+        self.assertEqual(datos['votos_cambiados'], [[no.id, 1]])
+        self.assertEqual(datos['detalle']['mapa_votos'], {'No': {'altas': ['Luis Gil'], 'bajas': []}})
+        self.assertEqual(datos['detalle']['lista_abstencion'], {'altas': [], 'bajas': ['Luis Gil']})
+        self.assertNotIn('nombres_opciones', datos)
+
+    def test_since_sin_base_manda_todo(self):
+        version = self.client.get(self.url).json()['version']
+        registrar_voto(self.vecino, self.votacion, self.votacion.opciones.first().id)
+        cache.clear()
+
+        datos = self.client.get(self.url, {'since': version}).json()
+
+        self.assertFalse(datos['parcial'])
+        self.assertEqual(datos['votos_opciones'], [1, 0])
+
+class DetallePresidenteConsultasTests(TestCase):
+    """
+    El detalle no puede hacer una consulta por opción ni por vecino.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooperativa = Cooperativa.objects.create(nombre="Los Olivos", presidente_ve_votos=True)
+        cls.presidente = Usuario.objects.create_user('presi', password='x', cooperativa=cls.cooperativa,
+                                                     rol=Usuario.PRESIDENTE)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.presidente)
+
+    def preparar(self, opciones, votantes):
+        vecinos = [
+            Usuario.objects.create_user(f'v{opciones}_{i}', cooperativa=self.cooperativa)
+            for i in range(votantes)
+        ]
+        votacion = crear_votacion(self.cooperativa, textos=[f"Opción {i}" for i in range(opciones)])
+        ids_opciones = list(votacion.opciones.values_list('id', flat=True))
+        for i, vecino in enumerate(vecinos):
+            registrar_voto(vecino, votacion, ids_opciones[i % opciones])
+        return votacion
+
+    def consultas_api(self, votacion):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse('datos_en_vivo', args=[votacion.id]))
+        self.assertEqual(respuesta.status_code, 200)
+        return len(consultas)
+
+    def test_detalle_en_dos_consultas(self):
+        votacion = self.preparar(opciones=5, votantes=12)
+        obtener_resumen(votacion)
+
+        with self.assertNumQueries(2):
+            detalle = calcular_detalle(votacion)
+
+        self.assertEqual([len(ids) for ids in detalle['votantes']], [3, 3, 2, 2, 2])
+        self.assertEqual(detalle['abstencion'], [self.presidente.id])
+
+
+    def test_las_consultas_no_crecen_con_opciones_ni_votantes(self):
+        pequena = self.preparar(opciones=2, votantes=1)
+        grande = self.preparar(opciones=8, votantes=20)
+
+        self.assertEqual(self.consultas_api(pequena), self.consultas_api(grande))
+
+class CensoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooperativa = Cooperativa.objects.create(nombre="Los Olivos")
+        cls.vecinos = [
+            Usuario.objects.create_user(f'vecino{i}', cooperativa=cls.cooperativa) for i in range(3)
+        ]
+        Usuario.objects.create_user('admin', cooperativa=cls.cooperativa, rol=Usuario.SUPERADMIN)
+        cls.votacion = crear_votacion(cls.cooperativa)
+
+    def test_ida_y_vuelta_en_bytes(self):
+        censo = Censo([70000, 3, 12, 3])
+
+        copia = Censo.desde_bytes(censo.a_bytes())
+
+        self.assertEqual(list(copia), [3, 12, 70000])
+        self.assertEqual(len(censo.a_bytes()), 12)
+        self.assertIn(12, copia)
+        self.assertNotIn(13, copia)
+
+    def test_se_congela_al_crear_la_votacion(self):
+        nuevo = Usuario.objects.create_user('recien_llegado', cooperativa=self.cooperativa)
+        votacion = Votacion.objects.get(id=self.votacion.id)
+
+        self.assertEqual(list(votacion.obtener_censo()), [v.id for v in self.vecinos])
+        with self.assertRaises(FueraDelCenso):
+            registrar_voto(nuevo, votacion, votacion.opciones.first().id)
+
+    def test_reparto_de_participacion(self):
+        censo = self.votacion.obtener_censo()
+
+        participacion, abstencion = censo.repartir({self.vecinos[1].id, 999})
+
+        self.assertEqual(participacion, [self.vecinos[1].id])
+        self.assertEqual(abstencion, [self.vecinos[0].id, self.vecinos[2].id])
+
+class CierreVotacionesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooperativa = Cooperativa.objects.create(nombre="Los Olivos")
+        cls.vecino = Usuario.objects.create_user('vecino', cooperativa=cls.cooperativa)
+        cls.votacion = crear_votacion(cls.cooperativa)
+        registrar_voto(cls.vecino, cls.votacion, cls.votacion.opciones.order_by('id').first().id)
+        Votacion.objects.filter(id=cls.votacion.id).update(fecha_fin=timezone.now() - timedelta(seconds=1))
+
+    def test_el_resultado_final_se_escribe_una_vez(self):
+        primero = finalizar_votacion(self.votacion.id)
+        segundo = finalizar_votacion(self.votacion.id)
+
+        self.assertEqual(primero.pk, segundo.pk)
+        self.assertEqual(primero.resumen['votos_opciones'], [1, 0])
+        self.assertFalse(primero.resumen['activa'])
+
+    def test_no_cierra_las_que_siguen_abiertas(self):
+        abierta = crear_votacion(self.cooperativa)
+
+        self.assertIsNone(finalizar_votacion(abierta.id))
+        self.assertFalse(ResultadoFinal.objects.filter(votacion=abierta).exists())
+
+class FormatoCompactoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooperativa = Cooperativa.objects.create(nombre="Los Olivos", presidente_ve_votos=True)
+        cls.presidente = Usuario.objects.create_user('presi', password='x', cooperativa=cls.cooperativa,
+                                                     rol=Usuario.PRESIDENTE, first_name='Eva', last_name='Ruiz')
+        cls.vecino = Usuario.objects.create_user('vecino', cooperativa=cls.cooperativa,
+                                                 first_name='Luis', last_name='Gil')
+        cls.votacion = crear_votacion(cls.cooperativa)
+        registrar_voto(cls.vecino, cls.votacion, cls.votacion.opciones.order_by('id').first().id)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.presidente)
+
+    def test_solo_ids_y_cuentas(self):
+        datos = self.client.get(reverse('datos_en_vivo', args=[self.votacion.id]), {'formato': 'compacto'}).json()
+
+        self.assertEqual(datos['votantes'], [[self.vecino.id], []])
+        self.assertEqual(datos['ids_abstencion'], [self.presidente.id])
+        self.assertEqual(datos['nombres'], [])
+        self.assertNotIn('mapa_votos', datos)
+
+    def test_directorio_con_etag_y_renovado_al_cambiar_vecinos(self):
+        url = reverse('directorio_vecinos')
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.json()['nombres'], [[self.presidente.id, 'Eva Ruiz'], [self.vecino.id, 'Luis Gil']])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 304)
+
+        Usuario.objects.create_user('nueva', cooperativa=self.cooperativa, first_name='Ana', last_name='Sanz')
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 200)
+
+    def test_quien_se_cambia_de_cooperativa_sale_del_directorio_de_la_vieja(self):
+        url = reverse('directorio_vecinos')
+        self.client.get(url)
+
+        vecino = Usuario.objects.get(id=self.vecino.id)
+        vecino.cooperativa = Cooperativa.objects.create(nombre="Otra")
+        vecino.save()
+
+        self.assertEqual(self.client.get(url).json()['nombres'], [[self.presidente.id, 'Eva Ruiz']])
+
+    def test_directorio_solo_para_presidente_con_permiso(self):
+        self.client.force_login(self.vecino)
+
+        self.assertEqual(self.client.get(reverse('directorio_vecinos')).status_code, 403)
+
+class ResultadosFinalesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooperativa = Cooperativa.objects.create(nombre="Los Olivos", presidente_ve_votos=True)
+        cls.presidente = Usuario.objects.create_user('presi', password='x', cooperativa=cls.cooperativa,
+                                                     rol=Usuario.PRESIDENTE, first_name='Eva', last_name='Ruiz')
+        cls.vecino = Usuario.objects.create_user('vecino', cooperativa=cls.cooperativa,
+                                                 first_name='Luis', last_name='Gil')
+        cls.votacion = crear_votacion(cls.cooperativa, textos=('Sí', 'No', 'Blanco'))
+        registrar_voto(cls.vecino, cls.votacion, cls.votacion.opciones.order_by('id').first().id)
+        Votacion.objects.filter(id=cls.votacion.id).update(fecha_fin=timezone.now() - timedelta(minutes=1))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.presidente)
+        self.url = reverse('datos_en_vivo', args=[self.votacion.id])
+
+    def test_la_primera_visita_congela_los_resultados(self):
+        respuesta = self.client.get(self.url)
+
+        final = ResultadoFinal.objects.get(votacion=self.votacion)
+        self.assertEqual(final.resumen['porcentajes'], [100.0, 0, 0])
+        self.assertEqual(respuesta.json()['mapa_votos']['Sí'], ['Luis Gil'])
+        self.assertIn('max-age=60', respuesta['Cache-Control'])
+        self.assertIn('private', respuesta['Cache-Control'])
+        self.assertNotIn('immutable', respuesta['Cache-Control'])
+
+    def test_cerrada_se_sirve_de_la_foto(self):
+        self.client.get(self.url)
+        # Aunque el vecino se dé de baja, lo que se votó ya no cambia
+        self.vecino.delete()
+
+        # Sesión, usuario y la votación (con su resultado en la misma consulta)
+        with self.assertNumQueries(3):
+            datos = self.client.get(self.url).json()
+        self.assertEqual(datos['votos_opciones'], [1, 0, 0])
+        self.assertEqual(datos['mapa_votos']['Sí'], ['Luis Gil'])
+        self.assertFalse(datos['activa'])
+
+    def test_reabrirla_tira_la_foto_y_al_cerrar_se_hace_otra(self):
+        etiqueta = self.client.get(self.url)['ETag']
+        votacion = Votacion.objects.get(id=self.votacion.id)
+
+        votacion.fecha_fin = timezone.now() + timedelta(hours=1)
+        votacion.save()
+        self.assertFalse(ResultadoFinal.objects.filter(votacion=votacion).exists())
+        # Lo que guardaba el navegador de la cerrada ya no vale al revalidar
+        respuesta = self.client.get(self.url, headers={'If-None-Match': etiqueta})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.json()['activa'])
+        registrar_voto(self.presidente, votacion, votacion.opciones.order_by('id').last().id)
+        Votacion.objects.filter(id=votacion.id).update(fecha_fin=timezone.now() - timedelta(minutes=1))
+
+        datos = self.client.get(self.url).json()
+        self.assertEqual(datos['votos_opciones'], [1, 0, 1])
+        self.assertEqual(ResultadoFinal.objects.get(votacion=votacion).resumen['total_votos'], 2)
+
+    def test_las_abiertas_no_se_cachean_en_el_navegador(self):
+        abierta = crear_votacion(self.cooperativa)
+
+        respuesta = self.client.get(reverse('datos_en_vivo', args=[abierta.id]))
+
+        self.assertNotIn('immutable', respuesta['Cache-Control'])
+        self.assertFalse(ResultadoFinal.objects.filter(votacion=abierta).exists())
+
+    def test_comando_de_relleno(self):
+        # Una cerrada con resultado antiguo (sin detalle) y otra sin resultado
+        ResultadoFinal.objects.create(votacion=self.votacion, resumen=calcular_resumen(self.votacion))
+        otra = crear_votacion(self.cooperativa, fecha_fin=timezone.now() - timedelta(minutes=1))
+
+        call_command('materializar_resultados', stdout=StringIO())
+
+        antigua = ResultadoFinal.objects.get(votacion=self.votacion)
+        self.assertEqual(antigua.detalle['votantes'], [[self.vecino.id], [], []])
+        self.assertIn('porcentajes', antigua.resumen)
+        self.assertTrue(ResultadoFinal.objects.filter(votacion=otra).exists())
+
+
+
+class ProgramadorCierresTests(TransactionTestCase):
+    # Los accesos a la BD desde asyncio cierran conexiones: no valen dentro de una transacción de test
+
+    def setUp(self):
+        self.layer = get_channel_layer()
+        async_to_sync(self.layer.flush)()
+        self.cooperativa = Cooperativa.objects.create(nombre="Los Olivos")
+        vecino = Usuario.objects.create_user('vecino', cooperativa=self.cooperativa)
+        self.votacion = crear_votacion(self.cooperativa)
+        registrar_voto(vecino, self.votacion, self.votacion.opciones.order_by('id').first().id)
+        Votacion.objects.filter(id=self.votacion.id).update(fecha_fin=timezone.now() - timedelta(seconds=1))
+
+    def test_al_cerrar_avisa_con_los_numeros_definitivos(self):
+        canal = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(grupo_votacion(self.votacion.id), canal)
+
+        async_to_sync(ProgramadorCierres().cerrar)(self.votacion.id)
+
+        mensaje = async_to_sync(self.layer.receive)(canal)
+        self.assertEqual(mensaje['type'], 'evento_cierre')
+        self.assertEqual((mensaje['datos']['total_votos'], mensaje['datos']['activa']), (1, False))
+
+    def test_al_cerrar_avisa_a_la_cooperativa(self):
+        canal = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(grupo_cooperativa(self.cooperativa.id), canal)
+
+        async_to_sync(ProgramadorCierres().cerrar)(self.votacion.id)
+
+        mensaje = async_to_sync(self.layer.receive)(canal)
+        self.assertEqual(mensaje['datos'], {'tipo': 'votacion_cerrada', 'id_votacion': self.votacion.id, 'activa': False})
+
+    def test_solo_programa_las_que_vencen_pronto(self):
+        lejana = crear_votacion(self.cooperativa, fecha_fin=timezone.now() + timedelta(hours=1))
+        programador = ProgramadorCierres(recarga=30, margen=3600)
+
+        async def programar():
+            await programador.programar()
+            programadas = set(programador._temporizadores)
+            for _, handle in programador._temporizadores.values():
+                handle.cancel()
+            return programadas
+
+        self.assertEqual(async_to_sync(programar)(), {self.votacion.id})
+        self.assertNotIn(lejana.id, async_to_sync(programar)())
+
+    def test_guarda_la_tarea_de_cierre_hasta_que_acaba(self):
+        programador = ProgramadorCierres(margen=0)
+
+        async def programar_y_soltar():
+            # Un cierre que no acaba hasta que se le deja
+            soltar = asyncio.Event()
+            async def cerrar(id_votacion):
+                await soltar.wait()
+            programador.cerrar = cerrar
+
+            await programador.programar()
+            while not programador._cierres:   # hasta que salta el temporizador
+                await asyncio.sleep(0.01)
+            gc.collect()
+            en_curso = len(programador._cierres)
+            soltar.set()
+            await asyncio.gather(*programador._cierres)
+            return en_curso
+
+        self.assertEqual(async_to_sync(programar_y_soltar)(), 1)
+        self.assertEqual(programador._cierres, set())
+
+class DifusorAgrupadoTests(TestCase):
+    def crear_difusor(self, **config):
+        config = {'VENTANA': 60, 'MAX_POR_SEGUNDO': 5, 'SINCRONO': False, **config}
+        self.enviados = []
+        self.ahora = 100.0
+        return DifusorAgrupado(self.enviados.append, config=lambda: config, reloj=lambda: self.ahora)
+
+    def test_junta_los_avisos_de_la_ventana(self):
+        difusor = self.crear_difusor()
+        for _ in range(50):
+            difusor.notificar(7)
+        difusor.notificar(8)
+
+        difusor.vaciar()
+
+        self.assertEqual(sorted(self.enviados), [7, 8])
+        estadisticas = difusor.estadisticas()
+        self.assertEqual(estadisticas['eventos_recibidos'], 51)
+        self.assertEqual(estadisticas['difusiones_enviadas'], 2)
+        self.assertEqual(estadisticas['por_votacion'][7], {'eventos_recibidos': 50, 'difusiones_enviadas': 1})
+
+    def test_respeta_el_tope_por_segundo(self):
+        difusor = self.crear_difusor(VENTANA=0.2, MAX_POR_SEGUNDO=2)
+        difusor._envios[7].extend([99.5, 99.8])
+
+        difusor.notificar(7)
+
+        # El cupo se libera cuando caduca el envío de las 99.5
+        self.assertEqual(difusor._pendientes[7], 100.5)
+
+
+class DifusorEnHiloTests(TransactionTestCase):
+    # El hilo del difusor abre su propia conexión: tiene que ver los datos ya confirmados
+
+    def setUp(self):
+        async_to_sync(get_channel_layer().flush)()
+        self.cooperativa = Cooperativa.objects.create(nombre="Los Olivos")
+        self.votacion = crear_votacion(self.cooperativa)
+
+    async def test_el_hilo_despierta_al_que_espera(self):
+        layer = get_channel_layer()
+        recordar_bucle()   # lo que hace core.asgi con la primera conexión
+        canal = await layer.new_channel()
+        await layer.group_add(grupo_votacion(self.votacion.id), canal)
+        config = {'VENTANA': 0.01, 'MAX_POR_SEGUNDO': 5, 'SINCRONO': False}
+        difusor = DifusorAgrupado(difundir_resultados, config=lambda: config)
+
+        # El envío sale del hilo difusor-votaciones, no de este bucle
+        inicio = time.monotonic()
+        difusor.notificar(self.votacion.id)
+        mensaje = await asyncio.wait_for(layer.receive(canal), timeout=5)
+
+        # Desde otro bucle solo llegaría cuando venciera la espera del que recibe
+        self.assertLess(time.monotonic() - inicio, 0.5)
+        self.assertEqual(mensaje['type'], 'evento_actualizacion')
+        self.assertEqual(mensaje['datos']['id_votacion'], self.votacion.id)
+
+
+@override_settings(VOTACIONES_CIERRES_EN_PROCESO=False, VOTACIONES_DIFUSION={'VENTANA': 0.01})
+class VotoEnVivoTests(TransactionTestCase):
+    # Todo el camino de verdad: socket por core.asgi, voto confirmado y aviso desde el hilo del difusor
+
+    def setUp(self):
+        async_to_sync(get_channel_layer().flush)()
+        self.cooperativa = Cooperativa.objects.create(nombre="Los Olivos")
+        self.vecino = Usuario.objects.create_user('vecino', cooperativa=self.cooperativa)
+        self.votacion = crear_votacion(self.cooperativa)
+        self.client.force_login(self.vecino)
+        self.sesion = self.client.cookies['sessionid'].value
+
+    async def test_el_voto_llega_al_socket_que_espera(self):
+        from core.asgi import application
+        socket = WebsocketCommunicator(application, f'/ws/votacion/{self.votacion.id}/',
+                                       headers=[(b'cookie', f'sessionid={self.sesion}'.encode())])
+        conectado, _ = await socket.connect()
+        self.assertTrue(conectado)
+
+        opcion = await self.votacion.opciones.order_by('id').afirst()
+        inicio = time.monotonic()
+        await sync_to_async(registrar_voto)(self.vecino, self.votacion, opcion.id)
+        mensaje = await socket.receive_json_from(timeout=5)
+
+        self.assertLess(time.monotonic() - inicio, 0.5)
+        self.assertEqual((mensaje['tipo'], mensaje['total_votos']), ('resultados', 1))
+        await socket.disconnect()
+
+
+class CapaSQLiteTests(SimpleTestCase):
+    def test_group_send_llega_a_otro_proceso(self):
+        # Dos instancias sobre el mismo fichero se comportan como dos workers distintos
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, 'canales.sqlite3')
+            worker_a, worker_b = SQLiteChannelLayer(ruta=ruta), SQLiteChannelLayer(ruta=ruta)
+
+            async def probar():
+                canal = await worker_a.new_channel()
+                await worker_a.group_add('votacion_1', canal)
+                await worker_b.group_send('votacion_1', {'type': 'evento_actualizacion', 'datos': {'version': 3}})
+                mensaje = await asyncio.wait_for(worker_a.receive(canal), timeout=5)
+
+                await worker_a.group_discard('votacion_1', canal)
+                await worker_b.group_send('votacion_1', {'type': 'evento_actualizacion'})
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncio.wait_for(worker_a.receive(canal), timeout=0.2)
+                return mensaje
+
+            self.assertEqual(asyncio.run(probar())['datos'], {'version': 3})
+
+    def test_no_pierde_lo_que_llega_sin_nadie_esperando(self):
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, 'canales.sqlite3')
+            worker_a, worker_b = SQLiteChannelLayer(ruta=ruta), SQLiteChannelLayer(ruta=ruta)
+
+            async def probar():
+                # Otro socket del proceso ya está recibiendo: el lector común está en marcha
+                ocupado = await worker_a.new_channel()
+                esperando = asyncio.ensure_future(worker_a.receive(ocupado))
+
+                # Como el SSE: entra en el grupo y calcula su estado antes del primer receive()
+                canal = await worker_a.new_channel()
+                await worker_a.group_add('votacion_1', canal)
+                await worker_b.group_send('votacion_1', {'type': 'evento_actualizacion', 'datos': {'version': 1}})
+                await asyncio.sleep(0.2)
+                primero = await asyncio.wait_for(worker_a.receive(canal), timeout=1)
+
+                # Un latido (wait_for que vence) tampoco le quita lo que llegue después
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncio.wait_for(worker_a.receive(canal), timeout=0.05)
+                await worker_b.group_send('votacion_1', {'type': 'evento_actualizacion', 'datos': {'version': 2}})
+                await asyncio.sleep(0.2)
+                segundo = await asyncio.wait_for(worker_a.receive(canal), timeout=1)
+
+                # Fuera de su último grupo el canal se da por descartado
+                await worker_a.group_discard('votacion_1', canal)
+                descartado = canal not in worker_a._colas
+                esperando.cancel()
+                return primero['datos'], segundo['datos'], descartado
+
+            self.assertEqual(asyncio.run(probar()), ({'version': 1}, {'version': 2}, True))
+
+    def test_con_varios_procesos_la_cache_es_compartida(self):
+        with self.settings(CHANNEL_LAYERS={'default': {'BACKEND': 'core.capa_sqlite.SQLiteChannelLayer'}}):
+            with self.assertRaises(ImproperlyConfigured):
+                comprobar_cache_compartida()
+
+            with tempfile.TemporaryDirectory() as carpeta, self.settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': carpeta,
+            }}):
+                comprobar_cache_compartida()
+
+
+class ActasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooperativa = Cooperativa.objects.create(nombre="Los Olivos", presidente_ve_votos=True)
+        cls.presidente = Usuario.objects.create_user('presi', password='x', cooperativa=cls.cooperativa,
+                                                     rol=Usuario.PRESIDENTE)
+        cls.vecinos = [
+            Usuario.objects.create_user(f'vecino{i}', cooperativa=cls.cooperativa, first_name='Vecino',
+                                        last_name=str(i), numero_vivienda=f'{i}A')
+            for i in range(5)
+        ]
+        cls.votacion = crear_votacion(cls.cooperativa)
+        cls.otra = crear_votacion(cls.cooperativa, textos=('Azul', 'Verde'))
+        si, no = cls.votacion.opciones.order_by('id')
+        for i, vecino in enumerate(cls.vecinos):
+            registrar_voto(vecino, cls.votacion, (si if i < 3 else no).id)
+        registrar_voto(cls.vecinos[0], cls.otra, cls.otra.opciones.first().id)
+
+    def setUp(self):
+        cache.clear()
+
+    async def descargar(self, url, usuario=None):
+        await self.async_client.aforce_login(usuario or self.presidente)
+        respuesta = await self.async_client.get(url)
+        trozos = [trozo async for trozo in respuesta.streaming_content]
+        return respuesta, trozos
+
+    async def test_csv_por_trozos_con_votantes(self):
+        url = reverse('acta_votacion', args=[self.votacion.id, 'csv'])
+
+        with mock.patch.object(actas, 'TAM_TROZO', 2):
+            respuesta, trozos = await self.descargar(url)
+
+        self.assertEqual(respuesta['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn(f'acta-votacion-{self.votacion.id}.csv', respuesta['Content-Disposition'])
+        # Cabecera + 5 votos de 2 en 2: cada trozo sale por separado
+        self.assertEqual(len(trozos), 4)
+        lineas = b''.join(trozos).decode('utf-8-sig').splitlines()
+        self.assertEqual(lineas[0], 'votacion_id;votacion;opcion;fecha_voto;usuario;votante;vivienda')
+        self.assertEqual(len(lineas), 6)
+        self.assertTrue(lineas[1].startswith(f'{self.votacion.id};Derrama Tejado;Sí;'))
+        self.assertTrue(lineas[1].endswith(';vecino0;Vecino 0;0A'))
+        self.assertTrue(lineas[5].endswith(';vecino4;Vecino 4;4A'))
+
+    async def test_csv_sin_formulas_para_excel(self):
+        await Usuario.objects.filter(id=self.vecinos[0].id).aupdate(username='=HYPERLINK("http://x")', first_name='+Pepe')
+
+        _, trozos = await self.descargar(reverse('acta_votacion', args=[self.votacion.id, 'csv']))
+
+        linea = b''.join(trozos).decode('utf-8-sig').splitlines()[1]
+        self.assertTrue(linea.endswith(''';"'=HYPERLINK(""http://x"")";'+Pepe 0;0A'''), linea)
+
+    async def test_sin_permiso_no_salen_votantes(self):
+        await Cooperativa.objects.filter(id=self.cooperativa.id).aupdate(presidente_ve_votos=False)
+
+        _, trozos = await self.descargar(reverse('acta_votacion', args=[self.votacion.id, 'csv']))
+
+        contenido = b''.join(trozos).decode('utf-8-sig')
+        self.assertEqual(contenido.splitlines()[0], 'votacion_id;votacion;opcion;fecha_voto')
+        self.assertNotIn('vecino', contenido)
+        self.assertNotIn('0A', contenido)
+
+    async def test_ndjson_de_toda_la_cooperativa(self):
+        respuesta, trozos = await self.descargar(reverse('actas_cooperativa', args=['ndjson']))
+
+        self.assertEqual(respuesta['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        lineas = [json.loads(linea) for linea in b''.join(trozos).decode().splitlines()]
+        self.assertEqual([linea['tipo'] for linea in lineas], ['votacion'] + ['voto'] * 5 + ['votacion', 'voto'])
+        self.assertEqual(lineas[0]['resultados'], {'Sí': 3, 'No': 2})
+        self.assertEqual(lineas[0]['total_votos'], 5)
+        self.assertEqual(lineas[-1]['votacion_id'], self.otra.id)
+        self.assertEqual(lineas[-1]['vivienda'], '0A')
+
+    def test_una_consulta_por_trozo(self):
+        votaciones = Votacion.objects.select_related('cooperativa').filter(id=self.votacion.id)
+
+        def consultas_de_votos(tam):
+            with CaptureQueriesContext(connection) as consultas:
+                async_to_sync(self.leer)(actas.acta_csv(votaciones, True, tam))
+            return len([c for c in consultas if 'votaciones_voto' in c['sql']])
+
+        # 5 votos: de 1 en 1 (y una última vacía), de 5 en 5 (ídem) o todos de una
+        self.assertEqual(consultas_de_votos(1), 6)
+        self.assertEqual(consultas_de_votos(5), 2)
+        self.assertEqual(consultas_de_votos(10), 1)
+
+    async def leer(self, generador):
+        return [trozo async for trozo in generador]
+
+    async def test_solo_el_presidente_de_la_cooperativa(self):
+        await self.async_client.aforce_login(self.vecinos[0])
+        respuesta = await self.async_client.get(reverse('actas_cooperativa', args=['csv']))
+        self.assertEqual(respuesta.status_code, 302)
+
+        ajena = await Cooperativa.objects.acreate(nombre="Ajena")
+        otro = await Usuario.objects.acreate(username='otro_presi', cooperativa=ajena, rol=Usuario.PRESIDENTE)
+        await self.async_client.aforce_login(otro)
+        respuesta = await self.async_client.get(reverse('acta_votacion', args=[self.votacion.id, 'csv']))
+        self.assertEqual(respuesta.status_code, 404)
+
+        respuesta = await self.async_client.get(reverse('actas_cooperativa', args=['xml']))
+        self.assertEqual(respuesta.status_code, 404)
+
+
+class CuadreContadoresTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooperativa = Cooperativa.objects.create(nombre="Los Olivos")
+        cls.vecinos = [Usuario.objects.create_user(f'vecino{i}', cooperativa=cls.cooperativa) for i in range(4)]
+        cls.votaciones = [crear_votacion(cls.cooperativa) for _ in range(3)]
+        for votacion in cls.votaciones:
+            si = votacion.opciones.order_by('id').first()
+            for vecino in cls.vecinos:
+                registrar_voto(vecino, votacion, si.id)
+
+    def contadores(self):
+        return list(Opcion.objects.order_by('id').values_list('votos_cantidad', flat=True))
+
+    def test_cuadrado_no_toca_nada(self):
+        informe = cuadrar_contadores()
+
+        self.assertEqual((informe['votaciones'], informe['descuadres']), (3, []))
+        self.assertEqual(self.contadores(), [4, 0] * 3)
+
+    def test_baja_de_vecino_y_cambio_a_mano(self):
+        # Los votos del vecino se van en cascada sin descontar nada
+        self.vecinos[0].delete()
+        Opcion.objects.filter(id=self.votaciones[2].opciones.order_by('id').last().id).update(votos_cantidad=7)
+        versiones = dict(Votacion.objects.values_list('id', 'version'))
+
+        with mock.patch.object(difusor, 'notificar') as notificar, self.captureOnCommitCallbacks(execute=True), \
+                self.assertLogs('votaciones.contadores', 'WARNING'):
+            informe = cuadrar_contadores(tam_lote=2)
+
+        self.assertEqual(informe['lotes'], 2)
+        self.assertEqual(len(informe['descuadres']), 4)
+        self.assertIn((self.votaciones[2].id, self.votaciones[2].opciones.order_by('id').last().id, 7, 0),
+                      informe['descuadres'])
+        self.assertEqual(self.contadores(), [3, 0] * 3)
+        # Resultados cacheados fuera y aviso a los conectados, una vez por votación
+        for votacion in self.votaciones:
+            self.assertGreater(Votacion.objects.get(id=votacion.id).version, versiones[votacion.id])
+        self.assertEqual(sorted(c.args[0] for c in notificar.call_args_list), [v.id for v in self.votaciones])
+
+    def test_solo_informe(self):
+        Opcion.objects.update(votos_cantidad=9)
+
+        with self.assertLogs('votaciones.contadores', 'WARNING'):
+            informe = cuadrar_contadores(corregir=False)
+
+        self.assertEqual(len(informe['descuadres']), 6)
+        self.assertEqual(self.contadores(), [9] * 6)
+
+    def test_una_consulta_agrupada_por_lote(self):
+        with CaptureQueriesContext(connection) as consultas:
+            cuadrar_contadores(tam_lote=2)
+
+        de_votos = [c for c in consultas if 'votaciones_voto' in c['sql']]
+        self.assertEqual(len(de_votos), 2)
+        self.assertTrue(all('GROUP BY' in c['sql'] for c in de_votos))
+
+    def test_las_cerradas_con_resultado_final_se_dejan(self):
+        cerrada = self.votaciones[0]
+        Votacion.objects.filter(id=cerrada.id).update(fecha_fin=timezone.now() - timedelta(hours=1))
+        finalizar_votacion(cerrada.id)
+
+        self.assertNotIn(cerrada.id, votaciones_a_revisar().values_list('id', flat=True))
+        self.assertIn(cerrada.id, votaciones_a_revisar(todas=True).values_list('id', flat=True))
+
+    def test_comando(self):
+        Opcion.objects.update(votos_cantidad=0)
+        salida = StringIO()
+
+        with self.assertLogs('votaciones.contadores', 'WARNING'):
+            call_command('cuadrar_contadores', '--lote', '1', stdout=salida)
+
+        self.assertIn("3 votaciones revisadas en 3 lotes: 3 descuadres corregidos.", salida.getvalue())
+        self.assertEqual(self.contadores(), [4, 0] * 3)
+
+    def test_el_resumen_no_cuenta_votos(self):
+        votacion = Votacion.objects.get(id=self.votaciones[0].id)
+
+        with CaptureQueriesContext(connection) as consultas:
+            resumen = calcular_resumen(votacion)
+
+        self.assertEqual(resumen['total_votos'], 4)
+        self.assertFalse([c for c in consultas if 'votaciones_voto' in c['sql']])
+
+
+@override_settings(VOTACIONES_CIERRES_EN_PROCESO=False)
+class SocketMultiplexadoTests(TransactionTestCase):
+    # Channels cierra conexiones viejas en cada evento: no vale dentro de una transacción de test
+
+    def setUp(self):
+        cache.clear()
+        async_to_sync(get_channel_layer().flush)()
+        self.cooperativa = Cooperativa.objects.create(nombre="Los Olivos")
+        self.vecino = Usuario.objects.create_user('vecino', password='x', cooperativa=self.cooperativa)
+        self.votaciones = [crear_votacion(self.cooperativa) for _ in range(3)]
+        self.otra = Cooperativa.objects.create(nombre="Otra")
+        self.ajena = crear_votacion(self.otra)
+
+    async def conectar(self, usuario):
+        socket = WebsocketCommunicator(VotacionesConsumer.as_asgi(), '/ws/votaciones/')
+        socket.scope['user'] = usuario
+        conectado, _ = await socket.connect()
+        return socket, conectado
+
+    async def test_un_socket_para_varias_votaciones(self):
+        socket, conectado = await self.conectar(self.vecino)
+        self.assertTrue(conectado)
+        ids = [votacion.id for votacion in self.votaciones]
+
+        await socket.send_json_to({'accion': 'suscribir', 'votaciones': ids + [self.ajena.id]})
+        respuesta = await socket.receive_json_from()
+        self.assertEqual(respuesta, {'tipo': 'suscrito', 'votaciones': ids, 'rechazadas': [self.ajena.id]})
+        # Cómo está cada una al suscribirse
+        iniciales = [await socket.receive_json_from() for _ in ids]
+        self.assertEqual(sorted(mensaje['id_votacion'] for mensaje in iniciales), ids)
+
+        # Un voto en la segunda llega por el mismo socket, con su id
+        segunda = self.votaciones[1]
+        with self.settings(VOTACIONES_DIFUSION={'SINCRONO': True}):
+            await sync_to_async(registrar_voto)(self.vecino, segunda, await self.primera_opcion(segunda))
+        mensaje = await socket.receive_json_from()
+        self.assertEqual((mensaje['tipo'], mensaje['id_votacion'], mensaje['total_votos']),
+                         ('resultados', segunda.id, 1))
+        self.assertEqual(await socket.receive_json_from(), {'tipo': 'pendientes', 'pendientes': 2})
+
+        # Cancelada, ya no llega nada de ella
+        await socket.send_json_to({'accion': 'cancelar', 'votaciones': [segunda.id]})
+        self.assertEqual(await socket.receive_json_from(), {'tipo': 'cancelado', 'votaciones': [segunda.id]})
+        await get_channel_layer().group_send(grupo_votacion(segunda.id), {
+            'type': 'evento_actualizacion', 'datos': {'id_votacion': segunda.id},
+        })
+        self.assertTrue(await socket.receive_nothing())
+        await socket.disconnect()
+
+    async def primera_opcion(self, votacion):
+        return (await votacion.opciones.order_by('id').afirst()).id
+
+    async def test_novedades_y_pendientes_sin_suscribirse(self):
+        socket, _ = await self.conectar(self.vecino)
+
+        # Una nueva en su cooperativa: llega y sube su número de pendientes
+        nueva = await sync_to_async(crear_votacion)(self.cooperativa)
+        mensaje = await socket.receive_json_from()
+        self.assertEqual((mensaje['tipo'], mensaje['id_votacion'], mensaje['activa']),
+                         ('votacion_abierta', nueva.id, True))
+        self.assertEqual(await socket.receive_json_from(), {'tipo': 'pendientes', 'pendientes': 4})
+
+        # La de otra cooperativa no
+        await sync_to_async(crear_votacion)(self.otra)
+        self.assertTrue(await socket.receive_nothing())
+
+        # Vota (en otra pestaña): solo cambia su número
+        await sync_to_async(registrar_voto)(self.vecino, nueva, await self.primera_opcion(nueva))
+        self.assertEqual(await socket.receive_json_from(), {'tipo': 'pendientes', 'pendientes': 3})
+
+        # Y si se borra una, desaparece de la lista
+        id_nueva = nueva.id
+        await nueva.adelete()
+        self.assertEqual(await socket.receive_json_from(), {'tipo': 'votacion_borrada', 'id_votacion': id_nueva})
+        self.assertTrue(await socket.receive_nothing())
+        await socket.disconnect()
+
+    async def test_sin_sesion_no_conecta(self):
+        _, conectado = await self.conectar(AnonymousUser())
+        self.assertFalse(conectado)
+
+    async def test_mensaje_no_valido(self):
+        socket, _ = await self.conectar(self.vecino)
+        await socket.send_to(text_data='hola')
+        self.assertEqual((await socket.receive_json_from())['tipo'], 'error')
+        await socket.disconnect()
+
+
+@override_settings(VOTACIONES_CIERRES_EN_PROCESO=False)
+class SocketsVigiladosTests(TransactionTestCase):
+    # Channels cierra conexiones viejas en cada evento: no vale dentro de una transacción de test
+
+    def setUp(self):
+        async_to_sync(get_channel_layer().flush)()
+        self.cooperativa = Cooperativa.objects.create(nombre="Los Olivos")
+        self.vecino = Usuario.objects.create_user('vecino', cooperativa=self.cooperativa)
+        self.otro = Usuario.objects.create_user('otro', cooperativa=self.cooperativa)
+        self.intruso = Usuario.objects.create_user('intruso', cooperativa=Cooperativa.objects.create(nombre="Otra"))
+        self.votacion = crear_votacion(self.cooperativa)
+
+        aforo = mock.patch.object(conexiones, 'aforo', Aforo())
+        self.aforo = aforo.start()
+        self.addCleanup(aforo.stop)
+
+    async def conectar(self, usuario):
+        socket = WebsocketCommunicator(VotacionConsumer.as_asgi(), f'/ws/votacion/{self.votacion.id}/')
+        socket.scope['user'] = usuario
+        socket.scope['url_route'] = {'kwargs': {'id_votacion': self.votacion.id}}
+        conectado, _ = await socket.connect()
+        return socket, conectado
+
+    async def test_solo_vecinos_de_la_cooperativa(self):
+        for usuario in (AnonymousUser(), self.intruso):
+            _, conectado = await self.conectar(usuario)
+            self.assertFalse(conectado)
+        # Rechazados antes de entrar en ningún grupo
+        self.assertEqual(self.aforo.metricas()['conexiones'], 0)
+
+        socket, conectado = await self.conectar(self.vecino)
+        self.assertTrue(conectado)
+        self.assertEqual(self.aforo.metricas()['por_grupo'], {grupo_votacion(self.votacion.id): 1})
+        await socket.disconnect()
+        self.assertEqual(self.aforo.metricas()['conexiones'], 0)
+
+    async def test_limites_por_usuario_y_por_grupo(self):
+        with self.settings(VOTACIONES_SOCKETS={'MAX_POR_USUARIO': 1, 'MAX_POR_GRUPO': 2}):
+            primero, _ = await self.conectar(self.vecino)
+            _, conectado = await self.conectar(self.vecino)
+            self.assertFalse(conectado)
+
+            segundo, conectado = await self.conectar(self.otro)
+            self.assertTrue(conectado)
+            _, conectado = await self.conectar(self.vecino)
+            self.assertFalse(conectado)
+
+            # Al cerrar una pestaña vuelve a haber sitio
+            await primero.disconnect()
+            tercero, conectado = await self.conectar(self.vecino)
+            self.assertTrue(conectado)
+
+        self.assertEqual(self.aforo.metricas()['rechazadas'], {'usuario': 2})
+        await segundo.disconnect()
+        await tercero.disconnect()
+
+    async def test_latido_echa_a_los_que_no_contestan(self):
+        with self.settings(VOTACIONES_SOCKETS={'LATIDO': 0.05, 'INACTIVIDAD': 0.12}):
+            vivo, _ = await self.conectar(self.vecino)
+            muerto, _ = await self.conectar(self.otro)
+
+            # El que contesta a los ping sigue dentro; el otro sale de los grupos y se cierra
+            for _ in range(4):
+                self.assertEqual(await vivo.receive_json_from(timeout=1), {'tipo': 'ping'})
+                await vivo.send_json_to({'accion': 'pong'})
+            salidas = [await muerto.receive_output(timeout=1)]
+            while salidas[-1]['type'] != 'websocket.close':
+                salidas.append(await muerto.receive_output(timeout=1))
+
+        self.assertEqual(salidas[-1]['code'], CIERRE_INACTIVO)
+        metricas = self.aforo.metricas()
+        self.assertEqual((metricas['conexiones'], metricas['expulsadas_por_inactividad']), (1, 1))
+        # Ya no recibe las difusiones
+        await get_channel_layer().group_send(grupo_votacion(self.votacion.id), {
+            'type': 'evento_actualizacion', 'datos': {'id_votacion': self.votacion.id},
+        })
+        self.assertEqual((await vivo.receive_json_from())['tipo'], 'resultados')
+        self.assertTrue(await muerto.receive_nothing())
+        await vivo.disconnect()
+
+
+class EstadoConexionesTests(TestCase):
+    def test_solo_administradores(self):
+        cooperativa = Cooperativa.objects.create(nombre="Los Olivos")
+        self.client.force_login(Usuario.objects.create_user('vecino', cooperativa=cooperativa))
+        self.assertEqual(self.client.get(reverse('estado_conexiones')).status_code, 403)
+
+        self.client.force_login(Usuario.objects.create_user('admin', is_staff=True))
+        datos = self.client.get(reverse('estado_conexiones')).json()
+        self.assertEqual(set(datos), {'sockets', 'difusion'})
+        self.assertIn('conexiones', datos['sockets'])
+
+
+@override_settings(VOTACIONES_CIERRES_EN_PROCESO=False)
+class EventosEnVivoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cooperativa = Cooperativa.objects.create(nombre="Los Olivos")
+        cls.vecino = Usuario.objects.create_user('vecino', cooperativa=cls.cooperativa)
+        cls.votacion = crear_votacion(cls.cooperativa)
+        cls.url = reverse('eventos_en_vivo', args=[cls.votacion.id])
+
+    def setUp(self):
+        cache.clear()
+        async_to_sync(get_channel_layer().flush)()
+
+    async def abrir(self, **cabeceras):
+        await self.async_client.aforce_login(self.vecino)
+        respuesta = await self.async_client.get(self.url, headers=cabeceras)
+        self.assertEqual(respuesta['Content-Type'], 'text/event-stream; charset=utf-8')
+        flujo = aiter(respuesta.streaming_content)
+        self.assertEqual(await anext(flujo), b'retry: 5000\n\n')
+        return flujo
+
+    async def cortar(self, flujo):
+        # Como Django cuando el navegador se va: cancela la espera del siguiente trozo
+        siguiente = asyncio.ensure_future(anext(flujo))
+        await asyncio.sleep(0.01)
+        siguiente.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await siguiente
+
+    def leer(self, trozo):
+        # "id: N\ndata: {...}\n\n" -> (N, datos)
+        lineas = dict(linea.split(': ', 1) for linea in trozo.decode().strip().split('\n'))
+        return int(lineas['id']), json.loads(lineas['data'])
+
+    async def test_estado_actual_y_luego_los_avisos(self):
+        en_marcha = conexiones.aforo.metricas()['conexiones']
+        flujo = await self.abrir()
+
+        version, datos = self.leer(await anext(flujo))
+        self.assertEqual((version, datos['tipo'], datos['total_votos']), (0, 'resultados', 0))
+        self.assertEqual(conexiones.aforo.metricas()['conexiones'], en_marcha + 1)
+
+        await get_channel_layer().group_send(grupo_votacion(self.votacion.id), {
+            'type': 'evento_actualizacion', 'datos': {'version': 1, 'total_votos': 1},
+        })
+        self.assertEqual(self.leer(await anext(flujo)), (1, {'tipo': 'resultados', 'version': 1, 'total_votos': 1}))
+
+        # El navegador se va: fuera del grupo y del aforo
+        await self.cortar(flujo)
+        self.assertEqual(conexiones.aforo.metricas()['conexiones'], en_marcha)
+
+    async def test_si_se_va_antes_de_empezar_no_ocupa_plaza(self):
+        en_marcha = conexiones.aforo.metricas()['conexiones']
+        await self.async_client.aforce_login(self.vecino)
+
+        respuesta = await self.async_client.get(self.url)
+        # Django nunca llega a leer el flujo (el navegador se ha ido antes)
+        await respuesta.streaming_content.aclose()
+
+        self.assertEqual(conexiones.aforo.metricas()['conexiones'], en_marcha)
+
+    async def test_al_reconectar_solo_lo_que_falta(self):
+        with mock.patch.object(eventos, 'LATIDO', 0.05):
+            # Ya tiene la versión 0: no se le repite, solo latidos hasta que haya algo nuevo
+            flujo = await self.abrir(**{'Last-Event-ID': '0'})
+            self.assertEqual(await anext(flujo), b': latido\n\n')
+            await self.cortar(flujo)
+
+        await Votacion.objects.filter(id=self.votacion.id).aupdate(version=3)
+        flujo = await self.abrir(**{'Last-Event-ID': '1'})
+        self.assertEqual(self.leer(await anext(flujo))[0], 3)
+        await self.cortar(flujo)
+
+    async def test_cerrada_manda_el_final_y_no_vuelve(self):
+        await Votacion.objects.filter(id=self.votacion.id).aupdate(fecha_fin=timezone.now() - timedelta(seconds=5))
+        flujo = await self.abrir()
+        version, datos = self.leer(await anext(flujo))
+        self.assertEqual((datos['tipo'], datos['activa']), ('cerrada', False))
+        with self.assertRaises(StopAsyncIteration):
+            await anext(flujo)
+
+        # Con el resultado final ya en el navegador: 204 y EventSource deja de reconectar
+        respuesta = await self.async_client.get(self.url, headers={'Last-Event-ID': str(version)})
+        self.assertEqual(respuesta.status_code, 204)
+
+    async def test_no_da_eventos_de_otra_cooperativa(self):
+        intruso = await Usuario.objects.acreate(username='intruso', cooperativa=await Cooperativa.objects.acreate(nombre="Otra"))
+        await self.async_client.aforce_login(intruso)
+        respuesta = await self.async_client.get(self.url)
+        self.assertEqual(respuesta.status_code, 404)
+
+
+@override_settings(VOTACIONES_CIERRES_EN_PROCESO=True)
+class CierreSoloConEventosTests(TransactionTestCase):
+    # El programador de cierres va a la BD desde asyncio: no vale dentro de una transacción de test
+
+    def setUp(self):
+        cache.clear()
+        async_to_sync(get_channel_layer().flush)()
+        self.cooperativa = Cooperativa.objects.create(nombre="Los Olivos")
+        self.vecino = Usuario.objects.create_user('vecino', cooperativa=self.cooperativa)
+        self.votacion = crear_votacion(self.cooperativa, fecha_fin=timezone.now() + timedelta(seconds=1))
+        # Un programador propio: en este proceso todavía no ha conectado ningún WebSocket
+        programador = mock.patch.object(cierre, 'programador', ProgramadorCierres(margen=0.1))
+        self.programador = programador.start()
+        self.addCleanup(programador.stop)
+
+    async def test_el_cierre_llega_al_cliente_sse(self):
+        await self.async_client.aforce_login(self.vecino)
+        respuesta = await self.async_client.get(reverse('eventos_en_vivo', args=[self.votacion.id]))
+        flujo = aiter(respuesta.streaming_content)
+        self.assertEqual(await anext(flujo), b'retry: 5000\n\n')
+        self.assertIn(b'"tipo": "resultados"', await anext(flujo))
+
+        try:
+            cerrada = await asyncio.wait_for(anext(flujo), timeout=5)
+        finally:
+            if self.programador._tarea is not None:
+                self.programador._tarea.cancel()
+        self.assertIn(b'"tipo": "cerrada"', cerrada)
+        self.assertTrue(await ResultadoFinal.objects.filter(votacion_id=self.votacion.id).aexists())
+
+
+class BenchmarkSistemaTests(TransactionTestCase):
+    # Las peticiones van por hilos con su propia conexión: tienen que ver los datos sembrados
+
+    def setUp(self):
+        async_to_sync(get_channel_layer().flush)()
+        aforo = mock.patch.object(conexiones, 'aforo', Aforo())
+        aforo.start()
+        self.addCleanup(aforo.stop)
+
+    def test_mide_todos_los_escenarios_y_limpia(self):
+        with tempfile.TemporaryDirectory() as carpeta:
+            salida = os.path.join(carpeta, 'medidas.json')
+            call_command(
+                'benchmark_sistema', '--cooperativas', '1', '--vecinos', '6', '--votaciones', '2',
+                '--peticiones', '4', '--clientes', '2', '--sockets', '3', '--avisos', '1',
+                '--iteraciones', '1', '--salida', salida, stdout=StringIO(),
+            )
+            with open(salida) as fichero:
+                informe = json.load(fichero)
+
+        self.assertEqual(informe['datos']['votos'], 6)
+        escenarios = informe['escenarios']
+        for nombre in ('panel_inicio', 'ver_votacion', 'datos_en_vivo', 'votar', 'login'):
+            self.assertEqual(escenarios[nombre]['correctas'], escenarios[nombre]['peticiones'], nombre)
+            self.assertGreater(escenarios[nombre]['sql_por_peticion'], 0)
+            self.assertEqual(set(escenarios[nombre]['latencia_ms']), {'p50', 'p95', 'p99', 'max'})
+        self.assertEqual(escenarios['websocket']['aceptadas'], 3)
+        self.assertEqual(escenarios['websocket']['entregas'], 3)
+        # Sin --conservar no queda nada sembrado
+        self.assertFalse(Cooperativa.objects.exists())
+        self.assertFalse(Voto.objects.exists())
@@ -1,23 +1,43 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, aget_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
-from django.http import JsonResponse  # <--- IMPORTANTE: Necesario para la API en vivo
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse, Http404  # <--- IMPORTANTE: Necesario para la API en vivo
+from django.utils.cache import get_conditional_response, patch_cache_control
 import json
 
+from core.asincrono import usuario_de
+
 # --- IMPORTACIONES LIMPIAS ---
 # 1. Modelos y Forms de ESTA carpeta (votaciones)
-from .models import Votacion, Opcion, Voto
+from .models import Votacion, Opcion
+from usuarios.models import Cooperativa, Usuario
 from .forms import VotacionForm
-
-# 2. Modelos de la OTRA carpeta (usuarios)
-from usuarios.models import Usuario
+from .servicios import registrar_voto, VotoRechazado, VotoDuplicado
+from .pendientes import aestado_usuario, en_censo
+from .actas import FORMATOS
+from .conexiones import aforo
+from .eventos import flujo_eventos
+from .cierre import arrancar_en_proceso
+from .difusion import difusor
+from .resultados import (
+    aobtener_resumen, aobtener_detalle, aresultado_final, formatear_detalle, puede_ver_detalle,
+    datos_grafica, detalle_vacio, etiqueta_resultados, cambios_desde,
+    obtener_directorio, aobtener_directorio, compactar_detalle, grupo_votacion
+)
 # -----------------------------
 
+# Una votación cerrada casi nunca cambia, pero se puede reabrir (moviendo su fecha_fin):
+# el navegador se guarda la respuesta un minuto y después pregunta con el ETag (304)
+CACHE_HTTP_CERRADAS = 60
+
 @login_required(login_url='login')
 def listar_votaciones(request):
     # Mostramos todas (activas y cerradas) ordenadas por fecha
-    votaciones = Votacion.objects.filter(cooperativa=request.user.cooperativa).order_by('-fecha_creacion')
+    votaciones = Votacion.objects.filter(
+        cooperativa=request.user.cooperativa
+    ).defer('censo').order_by('-fecha_creacion')
     return render(request, 'votaciones/listar_votaciones.html', {'votaciones': votaciones})
 
 @login_required(login_url='login')
@@ -55,160 +75,241 @@ def crear_votacion(request):
     return render(request, 'votaciones/crear_votacion.html', {'form': form})
 
 @login_required(login_url='login')
-def ver_votacion(request, id_votacion):
-    votacion = get_object_or_404(Votacion, id=id_votacion, cooperativa=request.user.cooperativa)
-    ya_voto = Voto.objects.filter(usuario=request.user, votacion=votacion).exists()
+async def ver_votacion(request, id_votacion):
+    # Vista asíncrona: las lecturas van por el ORM async y la caché, sin pasar por el pool de hilos
+    usuario = await usuario_de(request)
+    votacion = await aget_object_or_404(
+        Votacion.objects.select_related('cooperativa', 'resultado_final'),
+        id=id_votacion, cooperativa_id=usuario.cooperativa_id
+    )
+    # Las votaciones en las que ya votó salen de su entrada en caché (la misma del panel)
+    ya_voto = votacion.id in (await aestado_usuario(usuario))['votadas']
+    # Quien entró en la cooperativa después de abrirse no está en su censo: sin formulario
+    fuera_del_censo = votacion.activa and not ya_voto and not en_censo(usuario, votacion.censo)
     
-    # 1. LOGICA DE VOTO
+    # 1. LOGICA DE VOTO (la transacción sí va a un hilo)
     if request.method == 'POST' and 'btn_votar' in request.POST:
-        if not votacion.activa:
-            messages.error(request, "La votación ha finalizado.")
-        elif ya_voto:
-            messages.warning(request, "Ya has votado.")
+        try:
+            await sync_to_async(registrar_voto)(usuario, votacion, request.POST.get('opcion_seleccionada'))
+        except VotoDuplicado as e:
+            messages.warning(request, str(e))
+        except VotoRechazado as e:
+            messages.error(request, str(e))
         else:
-            opcion_id = request.POST.get('opcion_seleccionada')
-            if opcion_id:
-                opcion = get_object_or_404(Opcion, id=opcion_id)
-                Voto.objects.create(usuario=request.user, votacion=votacion, opcion_elegida=opcion)
-                opcion.votos_cantidad += 1
-                opcion.save()
-                messages.success(request, "¡Tu voto ha sido registrado!")
-                return redirect('ver_votacion', id_votacion=votacion.id)
-
-    # 2. CÁLCULOS ESTÁNDAR
-    opciones = votacion.opciones.all()
-    total_votos = votacion.votos_totales.count()
-    
-    # Censo: todos menos superadmin
-    total_censo = Usuario.objects.filter(
-        cooperativa=votacion.cooperativa
-    ).exclude(rol=Usuario.SUPERADMIN).count()
-    
-    abstencion = total_censo - total_votos
-    
-    datos_grafica = []
-    nombres_opciones = []
-    votos_opciones = []
-    mapa_votos_nombres = {} 
-    
-    permiso_ver_detalles = request.user.es_presidente and votacion.cooperativa.presidente_ve_votos
-
-    if opciones:
-        for op in opciones:
-            porcentaje = (op.votos_cantidad / total_votos * 100) if total_votos > 0 else 0
-            datos_grafica.append({
-                'texto': op.texto,
-                'votos': op.votos_cantidad,
-                'porcentaje': round(porcentaje, 1)
-            })
-            nombres_opciones.append(op.texto)
-            votos_opciones.append(op.votos_cantidad)
-            
-            if permiso_ver_detalles:
-                votantes = Voto.objects.filter(votacion=votacion, opcion_elegida=op).select_related('usuario')
-                nombres = []
-                for v in votantes:
-                    nombre = f"{v.usuario.first_name} {v.usuario.last_name}"
-                    if v.usuario == request.user:
-                        nombre += " <strong>(MI VOTO)</strong>"
-                    nombres.append(nombre)
-                mapa_votos_nombres[op.texto] = nombres
-
-    lista_abstencion = []
-    lista_participacion = []
-    
+            messages.success(request, "¡Tu voto ha sido registrado!")
+            return redirect('ver_votacion', id_votacion=votacion.id)
+
+    # 2. RESULTADOS (compartidos con la API y cacheados por versión; si está cerrada, la foto final)
+    resumen = await aobtener_resumen(votacion)
+    permiso_ver_detalles = puede_ver_detalle(usuario, votacion)
     if permiso_ver_detalles:
-        ids_votaron = Voto.objects.filter(votacion=votacion).values_list('usuario_id', flat=True)
-        base_usuarios = Usuario.objects.filter(cooperativa=votacion.cooperativa).exclude(rol=Usuario.SUPERADMIN)
-        
-        sin_voto = base_usuarios.exclude(id__in=ids_votaron)
-        lista_abstencion = [f"{u.first_name} {u.last_name}" for u in sin_voto]
-        
-        con_voto = base_usuarios.filter(id__in=ids_votaron)
-        for u in con_voto:
-            texto = f"{u.first_name} {u.last_name}"
-            if u == request.user:
-                texto += " <strong>(YO)</strong>"
-            lista_participacion.append(texto)
+        detalle = formatear_detalle(await aobtener_detalle(votacion), usuario.id)
+    else:
+        detalle = detalle_vacio()
+
+    # La plantilla no puede hacer consultas: las opciones van ya cargadas
+    opciones = [opcion async for opcion in votacion.opciones.all()]
 
     return render(request, 'votaciones/detalle_votacion.html', {
         'votacion': votacion,
         'opciones': opciones,
-        'datos_grafica': datos_grafica,
+        'datos_grafica': datos_grafica(resumen),
         'ya_voto': ya_voto,
-        'total_votos': total_votos,
-        'total_vecinos': total_censo,
-        'abstencion': abstencion,
-        'nombres_js': json.dumps(nombres_opciones),
-        'votos_js': json.dumps(votos_opciones),
-        'mapa_votos_json': json.dumps(mapa_votos_nombres),
-        'lista_abstencion_json': json.dumps(lista_abstencion),
-        'lista_participacion_json': json.dumps(lista_participacion),
+        'fuera_del_censo': fuera_del_censo,
+        'total_votos': resumen['total_votos'],
+        'total_vecinos': resumen['total_censo'],
+        'abstencion': resumen['abstencion'],
+        'nombres_js': json.dumps(resumen['nombres_opciones']),
+        'votos_js': json.dumps(resumen['votos_opciones']),
+        'ids_js': json.dumps(resumen['ids_opciones']),
+        'version_resultados': resumen['version'],
+        'mapa_votos_json': json.dumps(detalle['mapa_votos']),
+        'lista_abstencion_json': json.dumps(detalle['lista_abstencion']),
+        'lista_participacion_json': json.dumps(detalle['lista_participacion']),
         'permiso_ver_detalles': permiso_ver_detalles 
     })
 
 # --- FUNCIÓN API PARA WEBSOCKETS ---
 @login_required(login_url='login')
-def datos_en_vivo(request, id_votacion):
+async def datos_en_vivo(request, id_votacion):
     """
-    Devuelve los datos en JSON cuando el WebSocket avisa de un cambio.
+    Devuelve los datos en JSON (carga inicial o reconexión del WebSocket).
+
+    Con If-None-Match contesta 304 si nada ha cambiado, y con ?since=<version>
+    manda solo lo que ha cambiado desde esa versión. Con ?formato=compacto los
+    vecinos van solo por id (los nombres, en directorio_vecinos).
     """
-    votacion = get_object_or_404(Votacion, id=id_votacion, cooperativa=request.user.cooperativa)
-    
-    # Recalculamos todo (copiado de la lógica principal para consistencia)
-    activa = votacion.activa
-    opciones = votacion.opciones.all()
-    total_votos = votacion.votos_totales.count()
-    
-    total_censo = Usuario.objects.filter(
-        cooperativa=votacion.cooperativa
-    ).exclude(rol=Usuario.SUPERADMIN).count()
-    
-    abstencion = total_censo - total_votos
-    
-    nombres_opciones = []
-    votos_opciones = []
-    mapa_votos_nombres = {}
-    
-    permiso_ver_detalles = request.user.es_presidente and votacion.cooperativa.presidente_ve_votos
-    
-    for op in opciones:
-        nombres_opciones.append(op.texto)
-        votos_opciones.append(op.votos_cantidad)
+    usuario = await usuario_de(request)
+    votacion = await aget_object_or_404(
+        Votacion.objects.select_related('cooperativa', 'resultado_final'),
+        id=id_votacion, cooperativa_id=usuario.cooperativa_id
+    )
+    permiso_ver_detalles = puede_ver_detalle(usuario, votacion)
+
+    # 1. ¿Tiene el navegador ya esta versión? Entonces no calculamos nada
+    etiqueta = etiqueta_resultados(votacion, usuario, permiso_ver_detalles)
+    respuesta = get_conditional_response(request, etag=etiqueta)
+
+    # 2. Solo ids y cuentas: el navegador ya tiene los nombres
+    datos = None
+    if respuesta is None and request.GET.get('formato') == 'compacto':
+        resumen = await aobtener_resumen(votacion)
+        datos = {
+            'formato': 'compacto',
+            'parcial': False,
+            'version': resumen['version'],
+            'activa': resumen['activa'],
+            'total_votos': resumen['total_votos'],
+            'abstencion': resumen['abstencion'],
+            'ids_opciones': resumen['ids_opciones'],
+            'votos_opciones': resumen['votos_opciones'],
+        }
         if permiso_ver_detalles:
-            votantes = Voto.objects.filter(votacion=votacion, opcion_elegida=op).select_related('usuario')
-            nombres = []
-            for v in votantes:
-                nombre = f"{v.usuario.first_name} {v.usuario.last_name}"
-                if v.usuario == request.user:
-                    nombre += " <strong>(MI VOTO)</strong>"
-                nombres.append(nombre)
-            mapa_votos_nombres[op.texto] = nombres
-
-    lista_abstencion = []
-    lista_participacion = []
-    
-    if permiso_ver_detalles:
-        ids_votaron = Voto.objects.filter(votacion=votacion).values_list('usuario_id', flat=True)
-        base_usuarios = Usuario.objects.filter(cooperativa=votacion.cooperativa).exclude(rol=Usuario.SUPERADMIN)
-        
-        sin_voto = base_usuarios.exclude(id__in=ids_votaron)
-        lista_abstencion = [f"{u.first_name} {u.last_name}" for u in sin_voto]
-        
-        con_voto = base_usuarios.filter(id__in=ids_votaron)
-        for u in con_voto:
-            texto = f"{u.first_name} {u.last_name}"
-            if u == request.user:
-                texto += " <strong>(YO)</strong>"
-            lista_participacion.append(texto)
-
-    return JsonResponse({
-        'activa': activa,
-        'total_votos': total_votos,
-        'abstencion': abstencion,
-        'nombres_opciones': nombres_opciones,
-        'votos_opciones': votos_opciones,
-        'mapa_votos': mapa_votos_nombres,
-        'lista_abstencion': lista_abstencion,
-        'lista_participacion': lista_participacion
-    })
\ No newline at end of file
+            directorio = await aobtener_directorio(votacion.cooperativa_id)
+            datos.update(compactar_detalle(await aobtener_detalle(votacion), directorio))
+
+    # 3. Solo los cambios, si nos dicen desde qué versión y aún la tenemos en caché
+    elif respuesta is None and request.GET.get('since', '').isdigit():
+        datos = await sync_to_async(cambios_desde)(
+            votacion, int(request.GET['since']), usuario.id, permiso_ver_detalles
+        )
+
+    # 4. Todo completo
+    if respuesta is None and datos is None:
+        resumen = await aobtener_resumen(votacion)
+        if permiso_ver_detalles:
+            detalle = formatear_detalle(await aobtener_detalle(votacion), usuario.id)
+        else:
+            detalle = detalle_vacio()
+
+        datos = {
+            'parcial': False,
+            'version': resumen['version'],
+            'activa': resumen['activa'],
+            'total_votos': resumen['total_votos'],
+            'abstencion': resumen['abstencion'],
+            'ids_opciones': resumen['ids_opciones'],
+            'nombres_opciones': resumen['nombres_opciones'],
+            'votos_opciones': resumen['votos_opciones'],
+            'porcentajes': [barra['porcentaje'] for barra in datos_grafica(resumen)],
+            'mapa_votos': detalle['mapa_votos'],
+            'lista_abstencion': detalle['lista_abstencion'],
+            'lista_participacion': detalle['lista_participacion']
+        }
+
+    if respuesta is None:
+        respuesta = JsonResponse(datos)
+    respuesta['ETag'] = etiqueta
+
+    # Lleva nombres y el "(MI VOTO)" de quien mira: solo la caché del navegador, nunca compartida.
+    # Las abiertas se guardan igual, pero preguntando siempre con el ETag antes de usarlas.
+    # Las cerradas, sin immutable: al reabrirla sube la versión y el ETag ya no vale
+    if await aresultado_final(votacion) is not None:
+        patch_cache_control(respuesta, private=True, max_age=CACHE_HTTP_CERRADAS)
+    else:
+        patch_cache_control(respuesta, private=True, no_cache=True)
+    return respuesta
+
+@login_required(login_url='login')
+async def eventos_en_vivo(request, id_votacion):
+    """
+    Los avisos del WebSocket como Server-Sent Events (ver votaciones/eventos.py), para
+    quien está detrás de un proxy que corta los WebSockets. Al reconectar, el
+    navegador manda Last-Event-ID (o ?ultima=<version> la primera vez) y solo
+    recibe el estado si ha cambiado desde esa versión.
+    """
+    # Como los consumers: sin esto, un proceso con solo clientes SSE nunca manda el "cerrada"
+    arrancar_en_proceso()
+    usuario = await usuario_de(request)
+    votacion = await aget_object_or_404(
+        Votacion.objects.select_related('cooperativa', 'resultado_final'),
+        id=id_votacion, cooperativa_id=usuario.cooperativa_id
+    )
+    ultima = request.headers.get('Last-Event-ID') or request.GET.get('ultima', '')
+    ultima_version = int(ultima) if ultima.isdigit() else None
+
+    # Cerrada y con el resultado final ya en el navegador: con 204 EventSource deja de reconectar
+    if not votacion.activa and ultima_version is not None:
+        if ultima_version >= (await aobtener_resumen(votacion))['version']:
+            return HttpResponse(status=204)
+
+    # Cuenta en el mismo aforo que los WebSockets (votaciones/conexiones.py); la plaza
+    # la ocupa el propio flujo al arrancar, aquí solo se mira si cabe
+    grupo = grupo_votacion(votacion.id)
+    if not aforo.hay_sitio(usuario.id, grupo):
+        respuesta = HttpResponse("Demasiadas conexiones abiertas.", status=429)
+        respuesta['Retry-After'] = '30'
+        return respuesta
+
+    flujo = flujo_eventos(
+        votacion, usuario, puede_ver_detalle(usuario, votacion), ultima_version,
+        compacto=request.GET.get('formato') == 'compacto',
+        plaza=(usuario.id, grupo),
+    )
+    respuesta = StreamingHttpResponse(flujo, content_type='text/event-stream; charset=utf-8')
+    patch_cache_control(respuesta, private=True, no_cache=True)
+    respuesta['X-Accel-Buffering'] = 'no'   # Que nginx no se guarde los eventos
+    return respuesta
+
+@login_required(login_url='login')
+def directorio_vecinos(request):
+    """
+    Id -> nombre de los vecinos de la cooperativa, para el formato compacto.
+    Solo para el presidente que puede ver quién vota qué.
+    """
+    cooperativa = request.user.cooperativa
+    if not (request.user.es_presidente and cooperativa and cooperativa.presidente_ve_votos):
+        return JsonResponse({'error': "No tienes permiso para ver los votantes."}, status=403)
+
+    directorio = obtener_directorio(cooperativa.id)
+    respuesta = get_conditional_response(request, etag=directorio['etiqueta'])
+    if respuesta is None:
+        respuesta = JsonResponse({'nombres': directorio['nombres']})
+    respuesta['ETag'] = directorio['etiqueta']
+    patch_cache_control(respuesta, private=True, no_cache=True)
+    return respuesta
+
+@login_required(login_url='login')
+def estado_conexiones(request):
+    # Sockets abiertos y avisos enviados por ESTE proceso (cada proceso daphne lleva los suyos)
+    if not (request.user.is_staff or request.user.rol == Usuario.SUPERADMIN):
+        return JsonResponse({'error': "Solo para administradores."}, status=403)
+    respuesta = JsonResponse({'sockets': aforo.metricas(), 'difusion': difusor.estadisticas()})
+    patch_cache_control(respuesta, private=True, no_store=True)
+    return respuesta
+
+
+# --- ACTAS (EXPORTACIÓN DE VOTOS Y RESULTADOS) ---
+
+@login_required(login_url='login')
+async def acta_votacion(request, id_votacion, formato):
+    usuario = await usuario_de(request)
+    if not usuario.es_presidente:
+        return redirect('panel_inicio')
+    votaciones = Votacion.objects.select_related('cooperativa', 'resultado_final').filter(
+        id=id_votacion, cooperativa_id=usuario.cooperativa_id
+    )
+    votacion = await aget_object_or_404(votaciones)
+    return _respuesta_acta(votaciones, votacion.cooperativa, formato, f"acta-votacion-{votacion.id}")
+
+@login_required(login_url='login')
+async def actas_cooperativa(request, formato):
+    # Todas las votaciones de la cooperativa, una detrás de otra
+    usuario = await usuario_de(request)
+    if not (usuario.es_presidente and usuario.cooperativa_id):
+        return redirect('panel_inicio')
+    cooperativa = await Cooperativa.objects.aget(id=usuario.cooperativa_id)
+    votaciones = Votacion.objects.select_related('cooperativa', 'resultado_final').filter(
+        cooperativa_id=cooperativa.id
+    ).order_by('fecha_creacion', 'id')
+    return _respuesta_acta(votaciones, cooperativa, formato, f"actas-{cooperativa.id}")
+
+def _respuesta_acta(votaciones, cooperativa, formato, nombre):
+    if formato not in FORMATOS:
+        raise Http404("Formato no soportado")
+    generar, tipo = FORMATOS[formato]
+    # Se manda según se lee: la memoria no depende del número de votos
+    respuesta = StreamingHttpResponse(generar(votaciones, cooperativa.presidente_ve_votos), content_type=tipo)
+    respuesta['Content-Disposition'] = f'attachment; filename="{nombre}.{formato}"'
+    patch_cache_control(respuesta, private=True, no_store=True)
+    return respuesta